@@ -0,0 +1,183 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+# Peak-memory model for one in-memory analysis, measured end to end through /analyze
+# (DataFrame + igraph + encoded arrays + CSR + response build): ~1.5-2.2 KB per row
+IN_MEMORY_BYTES_PER_ROW = 2048
+AVG_CSV_ROW_BYTES       = 60        # typical transactions CSV row
+OUT_OF_CORE_OVERHEAD    = 64 * 2**20  # interpreter-side state on top of the shard budget
+
+
+def _default_capacity() -> int:
+    """
+    This process's share of the host budget: MEMORY_BUDGET_MB if set, otherwise 75% of
+    physical memory (2 GB where unknown), divided by the uvicorn worker count
+    (WEB_CONCURRENCY, the variable uvicorn reads for --workers).
+    """
+    workers    = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    configured = os.getenv("MEMORY_BUDGET_MB")
+    if configured:
+        return int(configured) * 2**20 // workers
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * 0.75) // workers
+    except (AttributeError, ValueError, OSError):
+        return 2048 * 2**20 // workers
+
+
+def estimate_peak_bytes(file_size: int, rows: Optional[int] = None, out_of_core: bool = False,
+                        memory_budget: Optional[int] = None) -> int:
+    """
+    Expected peak memory of one analysis. Before parsing, rows are estimated from the file
+    size; once the row count is known the estimate is re-derived from it. Out-of-core runs
+    are bounded by their shard budget instead of the file size.
+    """
+    if out_of_core:
+        return (memory_budget or 0) + OUT_OF_CORE_OVERHEAD
+    if rows is None:
+        rows = file_size // AVG_CSV_ROW_BYTES + 1
+    return file_size + rows * IN_MEMORY_BYTES_PER_ROW
+
+
+class AdmissionRejected(Exception):
+    """Raised when an analysis cannot be admitted; mapped to an HTTP response by the API."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail      = detail
+        self.retry_after = retry_after
+
+
+class MemoryBudget:
+    """
+    Memory budget shared by every analysis in this process.
+
+    The budget is a process-local counter: each uvicorn worker holds its own, so the
+    default capacity is the host budget divided by the worker count (_default_capacity).
+
+    A job reserves its estimated peak before it loads anything; when the budget is full it
+    waits (queued, FIFO by polling) up to wait_seconds for running jobs to release, then is
+    rejected with 429. A job that would not fit even in an empty budget is rejected at once
+    with 503 — out-of-core mode is the way to run it.
+    """
+
+    POLL_SECONDS = 0.05
+
+    def __init__(self, capacity: Optional[int] = None, wait_seconds: float = 30.0):
+        self.capacity     = capacity if capacity is not None else _default_capacity()
+        self.wait_seconds = wait_seconds
+        self.reserved     = 0
+        self.admitted     = 0
+        self.rejected     = 0
+        self.running      = 0
+        self._lock        = threading.Lock()
+
+    def try_reserve(self, nbytes: int) -> bool:
+        with self._lock:
+            if self.reserved + nbytes > self.capacity:
+                return False
+            self.reserved += nbytes
+            self.admitted += 1
+            self.running  += 1
+            return True
+
+    def _resize(self, old: int, new: int):
+        """Moves a reservation from old to new bytes. Raises AdmissionRejected if growing it does not fit now."""
+        self._check_fits(new)
+        with self._lock:
+            fits = new <= old or self.reserved + new - old <= self.capacity
+            if fits:
+                self.reserved += new - old
+        if not fits:
+            self._reject_busy(new)
+
+    def _release(self, nbytes: int):
+        with self._lock:
+            self.reserved -= nbytes
+            self.running  -= 1
+
+    def _check_fits(self, nbytes: int):
+        if nbytes > self.capacity:
+            with self._lock:
+                self.rejected += 1
+            raise AdmissionRejected(
+                503, f"Analysis needs ~{nbytes / 2**20:.0f} MB, more than the {self.capacity / 2**20:.0f} MB "
+                     f"memory budget. Retry with out_of_core=true.")
+
+    def _reject_busy(self, nbytes: int):
+        with self._lock:
+            self.rejected += 1
+        raise AdmissionRejected(
+            429, f"Memory budget busy ({self.reserved / 2**20:.0f} of {self.capacity / 2**20:.0f} MB reserved); "
+                 f"this analysis needs ~{nbytes / 2**20:.0f} MB.", retry_after=max(1, int(self.wait_seconds)))
+
+    async def acquire(self, nbytes: int) -> "Reservation":
+        """Reserves nbytes, waiting without blocking the event loop. Raises AdmissionRejected."""
+        self._check_fits(nbytes)
+        deadline = time.monotonic() + self.wait_seconds
+        while not self.try_reserve(nbytes):
+            if time.monotonic() >= deadline:
+                self._reject_busy(nbytes)
+            await asyncio.sleep(self.POLL_SECONDS)
+        return Reservation(self, nbytes)
+
+    def acquire_blocking(self, nbytes: int) -> "Reservation":
+        """acquire() for synchronous (threadpool) endpoints."""
+        self._check_fits(nbytes)
+        deadline = time.monotonic() + self.wait_seconds
+        while not self.try_reserve(nbytes):
+            if time.monotonic() >= deadline:
+                self._reject_busy(nbytes)
+            time.sleep(self.POLL_SECONDS)
+        return Reservation(self, nbytes)
+
+    def render(self) -> str:
+        """Prometheus text lines for the budget state."""
+        with self._lock:
+            return "\n".join([
+                "# HELP mule_memory_budget_bytes Memory budget for concurrent analyses.",
+                "# TYPE mule_memory_budget_bytes gauge",
+                f"mule_memory_budget_bytes {self.capacity}",
+                "# HELP mule_memory_reserved_bytes Estimated peak memory reserved by running analyses.",
+                "# TYPE mule_memory_reserved_bytes gauge",
+                f"mule_memory_reserved_bytes {self.reserved}",
+                "# HELP mule_analyses_running Analyses currently admitted.",
+                "# TYPE mule_analyses_running gauge",
+                f"mule_analyses_running {self.running}",
+                "# HELP mule_admissions_total Analyses admitted under the memory budget.",
+                "# TYPE mule_admissions_total counter",
+                f"mule_admissions_total {self.admitted}",
+                "# HELP mule_admission_rejections_total Analyses rejected by the memory budget.",
+                "# TYPE mule_admission_rejections_total counter",
+                f"mule_admission_rejections_total {self.rejected}"
+            ]) + "\n"
+
+
+class Reservation:
+    """One admitted job's share of a MemoryBudget."""
+
+    def __init__(self, budget: MemoryBudget, nbytes: int):
+        self.budget   = budget
+        self.nbytes   = nbytes
+        self.estimate = nbytes      # the admission-time estimate, kept for reporting
+        self._held    = True
+
+    def resize(self, nbytes: int):
+        """
+        Re-bases the reservation once the job's real size is known. Growing it is admitted
+        like a new job but without waiting — a job that holds memory while it waits for
+        more could deadlock with another doing the same — so a budget that cannot take the
+        growth now raises AdmissionRejected (429, or 503 if it never fits), and the
+        reservation keeps its old size until released.
+        """
+        if self._held:
+            self.budget._resize(self.nbytes, nbytes)
+            self.nbytes = nbytes
+
+    def release(self):
+        if self._held:
+            self.budget._release(self.nbytes)
+            self._held = False
@@ -0,0 +1,122 @@
+import os
+import numpy as np
+from typing import NamedTuple
+
+
+class CSRGraph(NamedTuple):
+    """
+    Compressed sparse row adjacency over integer account codes.
+    Successors of v are targets[offsets[v]:offsets[v + 1]] (distinct, ascending), with the
+    summed transaction amount of each (v, target) pair in weights. out_count / in_count
+    are transaction counts per account, i.e. igraph's multigraph out/in-degree.
+    """
+    offsets: np.ndarray
+    targets: np.ndarray
+    weights: np.ndarray
+    out_count: np.ndarray
+    in_count: np.ndarray
+
+    @property
+    def n_vertices(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.targets)
+
+
+_CSR_ARRAYS = CSRGraph._fields
+
+
+def aggregate_pairs(src: np.ndarray, dst: np.ndarray, amount: np.ndarray, n_vertices: int):
+    """Distinct (src, dst) pairs sorted by (src, dst) with their summed amounts."""
+    key, inverse = np.unique(src.astype(np.int64) * n_vertices + dst, return_inverse=True)
+    weight = np.bincount(inverse, weights=amount, minlength=len(key))
+    return key // n_vertices, key % n_vertices, weight
+
+
+def csr_from_edges(src: np.ndarray, dst: np.ndarray, amount: np.ndarray, n_vertices: int) -> CSRGraph:
+    """Builds a CSRGraph in memory from per-transaction edge arrays."""
+    pair_src, pair_dst, weight = aggregate_pairs(src, dst, amount, n_vertices)
+    offsets = np.zeros(n_vertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_src, minlength=n_vertices), out=offsets[1:])
+    return CSRGraph(
+        offsets   = offsets,
+        targets   = pair_dst.astype(np.int64),
+        weights   = weight,
+        out_count = np.bincount(src, minlength=n_vertices).astype(np.int64),
+        in_count  = np.bincount(dst, minlength=n_vertices).astype(np.int64)
+    )
+
+
+class DiskCSRBuilder:
+    """
+    Two-pass CSR construction for edge sets that do not fit in memory.
+    Pass 1 (add_pairs) receives aggregated pairs chunk by chunk — every pair of a
+    given source must arrive in one call, as with sender-partitioned shards — and
+    spills them to disk while counting successors per source. Pass 2 (finish)
+    lays out offsets and scatters each spilled chunk into np.memmap targets/weights.
+    Only O(n_vertices) counters stay resident.
+    """
+
+    def __init__(self, directory: str, n_vertices: int):
+        self.directory  = directory
+        self.n_vertices = n_vertices
+        self.pair_count = np.zeros(n_vertices, dtype=np.int64)
+        self.out_count  = np.zeros(n_vertices, dtype=np.int64)
+        self.in_count   = np.zeros(n_vertices, dtype=np.int64)
+        self.spills     = []
+        os.makedirs(directory, exist_ok=True)
+
+    def add_counts(self, out_count: np.ndarray, in_count: np.ndarray):
+        self.out_count += out_count
+        self.in_count  += in_count
+
+    def add_pairs(self, pair_src: np.ndarray, pair_dst: np.ndarray, weight: np.ndarray):
+        path = os.path.join(self.directory, f"pairs_{len(self.spills):05d}.npz")
+        np.savez(path, src=pair_src, dst=pair_dst, weight=weight)
+        self.spills.append(path)
+        self.pair_count += np.bincount(pair_src, minlength=self.n_vertices)
+
+    def finish(self) -> CSRGraph:
+        offsets = np.zeros(self.n_vertices + 1, dtype=np.int64)
+        np.cumsum(self.pair_count, out=offsets[1:])
+        n_edges = int(offsets[-1])
+
+        targets = _open_array(self.directory, "targets", np.int64, n_edges)
+        weights = _open_array(self.directory, "weights", np.float64, n_edges)
+
+        for path in self.spills:
+            with np.load(path) as spill:
+                src, dst, weight = spill["src"], spill["dst"], spill["weight"]
+            # Pairs arrive sorted by (src, dst): slot = source offset + rank within the source
+            first = np.searchsorted(src, src, side="left")
+            slot  = offsets[src] + (np.arange(len(src)) - first)
+            targets[slot] = dst
+            weights[slot] = weight
+            os.remove(path)
+
+        targets.flush()
+        weights.flush()
+        for name, array in (("offsets", offsets), ("out_count", self.out_count), ("in_count", self.in_count)):
+            np.save(os.path.join(self.directory, f"{name}.npy"), array)
+
+        return load_csr(self.directory)
+
+
+def _open_array(directory: str, name: str, dtype, length: int) -> np.memmap:
+    return np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+",
+                                     dtype=dtype, shape=(length,))
+
+
+def save_csr(directory: str, csr: CSRGraph):
+    """Writes each CSR array as its own .npy file."""
+    os.makedirs(directory, exist_ok=True)
+    for name in _CSR_ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(csr, name))
+
+
+def load_csr(directory: str, mmap: bool = True) -> CSRGraph:
+    """Reopens a saved CSR; with mmap=True arrays are read-only np.memmap views (no copy, page-cache backed)."""
+    mode = "r" if mmap else None
+    return CSRGraph(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in _CSR_ARRAYS))
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple
+
+
+class EncodedTransactions(NamedTuple):
+    """Transaction columns as flat arrays, with account names integer-encoded once."""
+    src: np.ndarray       # sender code per row
+    dst: np.ndarray       # receiver code per row
+    time: np.ndarray      # int64 nanoseconds since epoch
+    amount: np.ndarray    # float64
+    names: pd.Index       # code -> account name
+    rows: np.ndarray      # global transaction id per row (0..n-1 for a whole table)
+
+
+class EventArrays(NamedTuple):
+    """
+    Per-account event stream: one row per (center account, counterparty, time),
+    sorted by (center, time). Group g occupies [starts[g], starts[g + 1]).
+    """
+    center: np.ndarray
+    peer: np.ndarray
+    time: np.ndarray
+    rows: np.ndarray      # original transaction row of each event
+    starts: np.ndarray    # group offsets, len = number of groups + 1
+    key: np.ndarray       # center * n_ranks + time rank — sorted, group-aware search key
+    ranks: np.ndarray     # sorted unique timestamps used to build key
+
+
+def encode_transactions(df: pd.DataFrame) -> EncodedTransactions:
+    """
+    Encodes sender/receiver names into one shared integer dictionary so every
+    detector works on compact int arrays instead of Python strings.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+    n = len(df)
+    codes, names = pd.factorize(np.concatenate([
+        df['sender_id'].astype(str).to_numpy(),
+        df['receiver_id'].astype(str).to_numpy()
+    ]))
+    return EncodedTransactions(
+        src    = codes[:n],
+        dst    = codes[n:],
+        time   = df['timestamp'].to_numpy().astype('datetime64[ns]').astype(np.int64),
+        amount = df['amount'].to_numpy(dtype=float),
+        names  = pd.Index(names),
+        rows   = np.arange(n)
+    )
+
+
+def sort_events(center: np.ndarray, peer: np.ndarray, time: np.ndarray,
+                rows: np.ndarray = None) -> EventArrays:
+    """
+    Sorts events by (center, time) once. Timestamps are replaced by their dense rank
+    so a single int64 key (center * n_ranks + rank) stays sorted across groups and
+    every per-account window bound becomes one global np.searchsorted call.
+    """
+    if rows is None:
+        rows = np.arange(len(center))
+
+    order  = np.lexsort((time, center))
+    center, peer, time, rows = center[order], peer[order], time[order], rows[order]
+
+    ranks  = np.unique(time)
+    key    = center.astype(np.int64) * len(ranks) + np.searchsorted(ranks, time)
+    change = np.flatnonzero(np.diff(center)) + 1
+    starts = np.concatenate(([0], change, [len(center)])) if len(center) else np.zeros(1, dtype=np.int64)
+
+    return EventArrays(center, peer, time, rows, starts, key, ranks)
+
+
+def window_start(ev: EventArrays, width_ns: int, idx: np.ndarray = None) -> np.ndarray:
+    """lo[j]: first event of j's account with time >= time[j] - width (for all j, or just idx)."""
+    center = ev.center if idx is None else ev.center[idx]
+    time   = ev.time if idx is None else ev.time[idx]
+    bound  = center.astype(np.int64) * len(ev.ranks) + np.searchsorted(ev.ranks, time - width_ns, side="left")
+    return np.searchsorted(ev.key, bound, side="left")
+
+
+def window_end(ev: EventArrays, width_ns: int) -> np.ndarray:
+    """hi[k]: last event of k's account with time <= time[k] + width."""
+    rank_hi = np.searchsorted(ev.ranks, ev.time + width_ns, side="right") - 1
+    key_hi  = ev.center.astype(np.int64) * len(ev.ranks) + rank_hi
+    return np.searchsorted(ev.key, key_hi, side="right") - 1
+
+
+def next_same_peer(ev: EventArrays) -> np.ndarray:
+    """nxt[k]: index of the next event with the same (center, peer) pair, or len(ev) if none."""
+    n     = len(ev.center)
+    pair  = ev.center.astype(np.int64) * (int(ev.peer.max()) + 1 if n else 1) + ev.peer
+    order = np.argsort(pair, kind="stable")   # stable keeps time order within a pair
+
+    nxt = np.full(n, n, dtype=np.int64)
+    same = pair[order[1:]] == pair[order[:-1]]
+    nxt[order[:-1][same]] = order[1:][same]
+    return nxt
+
+
+def distinct_in_window(ev: EventArrays, width_ns: int, nxt: np.ndarray = None) -> np.ndarray:
+    """
+    distinct[j]: number of distinct peers among events [window_start(j), j] —
+    exactly what a two-pointer sweep ending at j would hold.
+
+    Event k is the latest occurrence of its peer for every j in [k, nxt[k] - 1], and is
+    still inside the window for every j <= window_end(k). So it adds +1 to the index
+    interval [k, min(nxt[k] - 1, hi[k])] — one difference array and a cumsum.
+    """
+    n = len(ev.center)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if nxt is None:
+        nxt = next_same_peer(ev)
+
+    last = np.minimum(nxt - 1, window_end(ev, width_ns))
+    return np.cumsum(1 - np.bincount(last + 1, minlength=n + 1)[:n])
@@ -1,6 +1,15 @@
 import igraph
 import numpy as np
-from typing import List, Dict
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+from app.metrics import record
+
+
+def outdegree_cap(outdegrees, multiplier: float = 2.0) -> int:
+    """Cap = mean + (multiplier * std_dev) over per-vertex out-degrees."""
+    mean = np.mean(outdegrees)
+    std  = np.std(outdegrees)
+    return int(mean + (multiplier * std))
 
 
 def get_dynamic_outdegree_cap(graph: igraph.Graph, multiplier: float = 2.0) -> int:
@@ -11,16 +20,14 @@ def get_dynamic_outdegree_cap(graph: igraph.Graph, multiplier: float = 2.0) -> i
     and are excluded from cycle candidate consideration.
     Fully adaptive to any dataset size or time range — no hardcoded thresholds.
     """
-    outdegrees = graph.outdegree()
-    mean = np.mean(outdegrees)
-    std  = np.std(outdegrees)
-    return int(mean + (multiplier * std))
+    return outdegree_cap(graph.outdegree(), multiplier)
 
 
-def find_cycles_dfs(graph: igraph.Graph, min_len: int = 3, max_len: int = 5) -> List[Dict]:
+def enumerate_cycles(adj, candidates: Iterable[int], min_len: int = 3,
+                     max_len: int = 5) -> Iterator[Tuple[int, ...]]:
     """
-    Detects circular money flows (cycles) of length 3 to 5 using iterative DFS.
-    Returns a list of rings, where each ring is a dict with type, members, and metadata.
+    DFS kernel shared by every graph representation. `adj[v]` must return the
+    (already capped) successors of v; yields each cycle once, in discovery order.
 
     Approach:
       - Iterative DFS with explicit stack — eliminates Python function call overhead
@@ -29,31 +36,17 @@ def find_cycles_dfs(graph: igraph.Graph, min_len: int = 3, max_len: int = 5) ->
         exactly where we left off after exploring a subtree, enabling true backtracking
         without recursion
       - Single shared path list + path_set mutated in place — zero list copying
-      - Dynamic out-degree cap (mean + 2*std) excludes statistical outlier nodes
       - O(1) cycle membership check via path_set
       - Deduplicates cycles via canonical rotation (smallest index first)
     """
-    cycles      = []
     seen_cycles = set()
-
-    cap = get_dynamic_outdegree_cap(graph)
-
-    # Pre-build adjacency dict once — avoids repeated igraph API calls in hot loop
-    adj = {}
-    for v in graph.vs:
-        idx = v.index
-        adj[idx] = graph.successors(idx) if graph.outdegree(idx) <= cap else []
-
-    candidates = [
-        v.index for v in graph.vs
-        if v.degree(mode="in") > 0 and 0 < v.degree(mode="out") <= cap
-    ]
+    expansions  = 0 # DFS pushes, reported to the request metrics at the end
 
     path     = []   # current DFS path, mutated in place
     path_set = set()
 
     for start in candidates:
-        if not adj[start]:
+        if not len(adj[start]):
             continue
 
         # Each frame: (node, iterator_over_its_neighbors)
@@ -77,14 +70,11 @@ def find_cycles_dfs(graph: igraph.Graph, min_len: int = 3, max_len: int = 5) ->
 
                         if canonical not in seen_cycles:
                             seen_cycles.add(canonical)
-                            cycles.append({
-                                "type"    : "Cycle",
-                                "members" : [graph.vs[i]["name"] for i in cycle_indices],
-                                "metadata": {"length": len(path)}
-                            })
+                            yield cycle_indices
 
                 elif neighbor not in path_set and len(path) < max_len:
                     # Go deeper
+                    expansions += 1
                     path.append(neighbor)
                     path_set.add(neighbor)
                     stack.append((neighbor, iter(adj[neighbor])))
@@ -99,7 +89,114 @@ def find_cycles_dfs(graph: igraph.Graph, min_len: int = 3, max_len: int = 5) ->
         path.clear()
         path_set.clear()
 
-    return cycles
+    record("dfs_expansions", expansions)
+    record("cycles_found", len(seen_cycles))
+
+
+def find_cycles_dfs(graph: igraph.Graph, min_len: int = 3, max_len: int = 5,
+                    cap: Optional[int] = None) -> List[Dict]:
+    """
+    Detects circular money flows (cycles) of length 3 to 5 using iterative DFS.
+    Returns a list of rings, where each ring is a dict with type, members, and metadata.
+
+    Approach:
+      - Dynamic out-degree cap (mean + 2*std) excludes statistical outlier nodes
+      - Adjacency is pre-built once, then enumerate_cycles runs the iterative DFS
+
+    cap: out-degree cap to use instead of deriving one from `graph` — lets a caller
+    searching a subgraph keep the cap of the full transaction graph.
+    """
+    if cap is None:
+        cap = get_dynamic_outdegree_cap(graph)
+
+    # Pre-build adjacency dict once — avoids repeated igraph API calls in hot loop
+    adj = {}
+    for v in graph.vs:
+        idx = v.index
+        adj[idx] = graph.successors(idx) if graph.outdegree(idx) <= cap else []
+
+    candidates = [
+        v.index for v in graph.vs
+        if v.degree(mode="in") > 0 and 0 < v.degree(mode="out") <= cap
+    ]
+
+    return [{
+        "type"    : "Cycle",
+        "members" : [graph.vs[i]["name"] for i in cycle_indices],
+        "metadata": {"length": len(cycle_indices)}
+    } for cycle_indices in enumerate_cycles(adj, candidates, min_len, max_len)]
+
+
+class _CappedCSRAdjacency:
+    """
+    adj[v] view over CSR arrays (in memory or np.memmap); vertices above the cap have no successors.
+    Arrays are viewed as plain ndarrays (same pages, no np.memmap per-slice overhead) and recently
+    used successor lists are kept in a bounded LRU, since DFS revisits the same hubs constantly.
+    With `within` (vertex mask) only successors inside the mask are returned — the induced subgraph.
+    """
+
+    def __init__(self, offsets: np.ndarray, targets: np.ndarray, out_count: np.ndarray, cap: int,
+                 within: Optional[np.ndarray] = None, cache_size: int = 1 << 16):
+        self.offsets   = np.asarray(offsets).view(np.ndarray)
+        self.targets   = np.asarray(targets).view(np.ndarray)
+        self.out_count = np.asarray(out_count).view(np.ndarray)
+        self.cap       = cap
+        self.within    = within
+        self._row      = lru_cache(maxsize=cache_size)(self._successors)
+
+    def _successors(self, v: int) -> List[int]:
+        if self.out_count[v] > self.cap:
+            return []
+        row = self.targets[self.offsets[v]:self.offsets[v + 1]]
+        if self.within is not None:
+            row = row[self.within[row]]
+        return row.tolist()
+
+    def __getitem__(self, v: int) -> List[int]:
+        return self._row(v)
+
+
+def csr_cycles(offsets: np.ndarray, targets: np.ndarray, out_count: np.ndarray, in_count: np.ndarray,
+               min_len: int = 3, max_len: int = 5, cap: Optional[int] = None,
+               within: Optional[np.ndarray] = None, starts: Optional[np.ndarray] = None) -> Iterator[Tuple[int, ...]]:
+    """
+    Cycle search over a CSR adjacency (offsets/targets, e.g. memory-mapped from disk); yields
+    vertex-code tuples. out_count/in_count are per-vertex transaction counts (multi-edges
+    included) so the cap matches the igraph path exactly.
+
+    within: vertex mask — search only the subgraph induced by these vertices
+    starts: vertex mask — only start the DFS from these vertices; every cycle through at
+            least one of them is still found, since each DFS explores all paths back to its start
+    """
+    if cap is None:
+        cap = outdegree_cap(out_count)
+
+    adj = _CappedCSRAdjacency(offsets, targets, out_count, cap, within)
+    ok  = (in_count > 0) & (out_count > 0) & (out_count <= cap)
+    if within is not None:
+        ok &= within
+    if starts is not None:
+        ok &= starts
+
+    return enumerate_cycles(adj, np.flatnonzero(ok).tolist(), min_len, max_len)
+
+
+def cycle_rings(cycles: Iterable[Tuple[int, ...]], names) -> List[Dict]:
+    """Formats vertex-code cycles as Cycle rings."""
+    return [{
+        "type"    : "Cycle",
+        "members" : [str(names[i]) for i in cycle_indices],
+        "metadata": {"length": len(cycle_indices)}
+    } for cycle_indices in cycles]
+
+
+def find_cycles_csr(offsets: np.ndarray, targets: np.ndarray, out_count: np.ndarray,
+                    in_count: np.ndarray, names, min_len: int = 3, max_len: int = 5,
+                    cap: Optional[int] = None) -> List[Dict]:
+    """
+    Same search as find_cycles_dfs over a CSR adjacency without materializing an igraph object.
+    """
+    return cycle_rings(csr_cycles(offsets, targets, out_count, in_count, min_len, max_len, cap), names)
 
 
 def detect_shells(graph: igraph.Graph, min_hops: int = 3) -> List[Dict]:
@@ -112,14 +209,15 @@ def detect_shells(graph: igraph.Graph, min_hops: int = 3) -> List[Dict]:
       - Filters shell candidates by total degree 2 or 3
       - Constructs a subgraph of shell candidates only
       - Uses weakly connected components of the shell subgraph as clusters
-      - Clusters of size >= 2 represent viable shell chains (X -> S1 -> S2 -> Y)
+      - Clusters of size >= min_hops - 1 represent viable shell chains (X -> S1 -> S2 -> Y)
       - Returns each cluster as a detected shell network with member names
     """
     shell_candidates_indices = [v.index for v in graph.vs if 2 <= v.degree() <= 3]
 
-    shells = []
+    shells   = []
+    min_size = max(2, min_hops - 1)   # a chain of k hops passes through k-1 shells
 
-    if len(shell_candidates_indices) < 2:
+    if len(shell_candidates_indices) < min_size:
         return []
 
     shell_graph = graph.subgraph(shell_candidates_indices)
@@ -128,7 +226,7 @@ def detect_shells(graph: igraph.Graph, min_hops: int = 3) -> List[Dict]:
     for cluster in components:
         original_indices = [shell_candidates_indices[i] for i in cluster]
 
-        if len(original_indices) >= 2:
+        if len(original_indices) >= min_size:
             member_names = [graph.vs[i]["name"] for i in original_indices]
             shells.append({
                 "type"    : "Layered Shell",
@@ -0,0 +1,116 @@
+import os
+import threading
+import multiprocessing as mp
+import igraph
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Dict, Optional
+from app.algorithms.events import encode_transactions
+
+# Process pools for run_partitioned, one per worker count, started on first use and reused
+# across requests. Workers come from a fork server (spawn where there is none): forking the
+# API process itself would copy its threads' locks mid-flight.
+_START_METHOD = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def weak_components(src: np.ndarray, dst: np.ndarray, n_accounts: int) -> np.ndarray:
+    """Weakly connected component id per account code, computed once on the integer edge list."""
+    graph = igraph.Graph(n=n_accounts, edges=np.column_stack((src, dst)).tolist(), directed=True)
+    return np.asarray(graph.connected_components(mode="weak").membership, dtype=np.int64)
+
+
+def component_batches(df: pd.DataFrame, min_size: int = 3, target_rows: int = 50_000) -> List[pd.DataFrame]:
+    """
+    Splits the transactions into work units made of whole weak components.
+
+      - Components with fewer than min_size accounts cannot hold any component-local
+        pattern (shortest cycle is 3 accounts) and are dropped
+      - Large components become their own unit; small ones are packed together,
+        largest first, until a unit reaches target_rows — avoids one task per pair of accounts
+    """
+    if len(df) == 0:
+        return []
+
+    enc        = encode_transactions(df)
+    membership = weak_components(enc.src, enc.dst, len(enc.names))
+    sizes      = np.bincount(membership)
+
+    row_comp = membership[enc.src]
+    keep     = sizes[row_comp] >= min_size
+    if not keep.any():
+        return []
+
+    rows_per_comp = np.bincount(row_comp[keep], minlength=len(sizes))
+    order         = np.argsort(-rows_per_comp, kind="stable")
+    order         = order[rows_per_comp[order] > 0]
+
+    # Greedy packing: assign each component (largest first) to the current unit
+    unit_of = np.full(len(sizes), -1, dtype=np.int64)
+    unit, filled = 0, 0
+    for comp in order:
+        if filled and filled + rows_per_comp[comp] > target_rows:
+            unit, filled = unit + 1, 0
+        unit_of[comp] = unit
+        filled += rows_per_comp[comp]
+
+    row_unit = unit_of[row_comp]
+    positions = np.flatnonzero(keep)
+    by_unit   = np.argsort(row_unit[positions], kind="stable")
+    positions = positions[by_unit]
+    bounds    = np.searchsorted(row_unit[positions], np.arange(unit + 2))
+
+    return [df.iloc[positions[bounds[u]:bounds[u + 1]]] for u in range(unit + 1)]
+
+
+def run_partitioned(df: pd.DataFrame, detect: Callable[[pd.DataFrame], List[Dict]],
+                    max_workers: Optional[int] = None, min_size: int = 3,
+                    target_rows: int = 50_000) -> List[Dict]:
+    """
+    Runs a component-local detector over every work unit and concatenates the rings.
+    `detect` must be picklable (a module-level function or functools.partial of one).
+    Units run in a shared process pool of max_workers (default: CPU count) processes;
+    with max_workers=1, or a single unit, they run inline.
+    """
+    batches = component_batches(df, min_size=min_size, target_rows=target_rows)
+    if not batches:
+        return []
+
+    workers = max_workers or os.cpu_count() or 1
+    if min(workers, len(batches)) <= 1:
+        return [ring for batch in batches for ring in detect(batch)]
+
+    pool = _pool(workers)
+    rings = []
+    try:
+        for found in pool.map(detect, batches):
+            rings.extend(found)
+    except BrokenProcessPool:
+        # A worker died: drop the pool so the next request starts a fresh one
+        with _pools_lock:
+            if _pools.get(workers) is pool:
+                del _pools[workers]
+        pool.shutdown(wait=False)
+        raise
+    return rings
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                         mp_context=mp.get_context(_START_METHOD))
+        return pool
+
+
+def close_pools():
+    """Shuts down the shared pools, waiting for units in flight."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
@@ -0,0 +1,202 @@
+import os
+import time
+import numpy as np
+from typing import Dict, NamedTuple, Optional
+from app.algorithms.csr import CSRGraph
+from app.algorithms.events import EncodedTransactions
+
+PATH_ARRAYS = ("pair_offsets", "txn_time", "txn_amount", "txn_row", "pair_max", "rev_offsets", "rev_sources",
+               "rev_pair")
+
+
+class PathIndex(NamedTuple):
+    """
+    Adjacency for path queries, on top of the aggregated CSR (one entry per distinct
+    (sender, receiver) pair, pair j = csr position j):
+      - the pair's transactions, sorted by time: txn_*[pair_offsets[j]:pair_offsets[j + 1]]
+      - pair_max[j], its largest single transaction (min-amount pruning without a scan)
+      - the reverse CSR: senders into v are rev_sources[rev_offsets[v]:rev_offsets[v + 1]],
+        rev_pair the forward pair of each
+    """
+    csr: CSRGraph
+    pair_offsets: np.ndarray
+    txn_time: np.ndarray
+    txn_amount: np.ndarray
+    txn_row: np.ndarray
+    pair_max: np.ndarray
+    rev_offsets: np.ndarray
+    rev_sources: np.ndarray
+    rev_pair: np.ndarray
+
+
+def build_path_index(enc: EncodedTransactions, csr: CSRGraph) -> PathIndex:
+    n = csr.n_vertices
+    pair_src = np.repeat(np.arange(n, dtype=np.int64), np.diff(csr.offsets))
+    pair_key = pair_src * n + csr.targets            # ascending: CSR rows are sorted by source, then target
+
+    order = np.lexsort((enc.time, enc.dst, enc.src))
+    pair  = np.searchsorted(pair_key, np.asarray(enc.src, np.int64)[order] * n + np.asarray(enc.dst)[order])
+    pair_offsets = np.zeros(csr.n_edges + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair, minlength=csr.n_edges), out=pair_offsets[1:])
+    amount = np.asarray(enc.amount)[order]
+
+    rev = np.lexsort((pair_src, csr.targets))
+    rev_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(csr.targets, minlength=n), out=rev_offsets[1:])
+    return PathIndex(
+        csr          = csr,
+        pair_offsets = pair_offsets,
+        txn_time     = np.asarray(enc.time)[order],
+        txn_amount   = amount,
+        txn_row      = np.asarray(enc.rows)[order],
+        pair_max     = np.maximum.reduceat(amount, pair_offsets[:-1]) if len(amount) else np.zeros(0),
+        rev_offsets  = rev_offsets,
+        rev_sources  = pair_src[rev],
+        rev_pair     = rev.astype(np.int64)
+    )
+
+
+def save_path_index(directory: str, index: PathIndex):
+    os.makedirs(directory, exist_ok=True)
+    for name in PATH_ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(index, name))
+
+
+def load_path_index(directory: str, csr: CSRGraph) -> PathIndex:
+    """Memory-maps a saved PathIndex over `csr`. Raises FileNotFoundError."""
+    return PathIndex(csr, *(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                            for name in PATH_ARRAYS))
+
+
+def _ranges(offsets: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """Concatenated positions offsets[v]:offsets[v + 1] for every v in vertices."""
+    starts  = offsets[vertices]
+    lengths = offsets[vertices + 1] - starts
+    total   = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shift = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return shift + np.arange(total)
+
+
+def bounded_bfs(offsets: np.ndarray, neighbors: np.ndarray, pair_of: Optional[np.ndarray], pair_max: np.ndarray,
+                start: int, depth: int, min_amount: float, deadline: float) -> np.ndarray:
+    """
+    Hop distance from `start` (-1 beyond `depth`) over one direction of the index, using only
+    pairs with some transaction >= min_amount. One vectorized frontier expansion per level.
+    """
+    dist = np.full(len(offsets) - 1, -1, dtype=np.int8)
+    dist[start] = 0
+    frontier = np.array([start], dtype=np.int64)
+    for level in range(1, depth + 1):
+        if not len(frontier) or time.perf_counter() > deadline:
+            break
+        slots = _ranges(offsets, frontier)
+        if min_amount > 0:
+            pairs = slots if pair_of is None else pair_of[slots]
+            slots = slots[pair_max[pairs] >= min_amount]
+        seen = np.zeros(len(dist), dtype=bool)
+        seen[np.asarray(neighbors[slots])] = True
+        frontier = np.flatnonzero(seen & (dist < 0))
+        dist[frontier] = level
+    return dist
+
+
+class _Stop(Exception):
+    pass
+
+
+def find_paths(index: PathIndex, source: int, target: int, max_hops: int = 4, time_ordered: bool = False,
+               min_amount: float = 0.0, max_paths: int = 100, timeout: float = 1.0) -> Dict:
+    """
+    All simple paths source -> target of at most max_hops hops, where a hop u -> v needs a
+    transaction u -> v of at least min_amount — and, with time_ordered, no earlier than the
+    previous hop's (the earliest such transaction is taken, which keeps the most options open).
+
+    Bidirectional bounded search: BFS backward from the target (max_hops // 2 levels) and
+    forward from the source (the rest). If the frontiers never meet there is no path and
+    the answer is immediate. Otherwise an iterative DFS from the source enumerates paths,
+    pruning any account that cannot reach the target within the remaining hops: its
+    backward distance when known, else more than max_hops // 2.
+    Stops after max_paths paths or `timeout` seconds (truncated = True).
+    """
+    csr      = index.csr
+    deadline = time.perf_counter() + timeout
+    back     = max_hops // 2
+    d_target = bounded_bfs(index.rev_offsets, index.rev_sources, index.rev_pair, index.pair_max, target, back,
+                           min_amount, deadline)
+    d_source = bounded_bfs(csr.offsets, csr.targets, None, index.pair_max, source, max_hops - back,
+                           min_amount, deadline)
+    meet     = np.flatnonzero((d_source >= 0) & (d_target >= 0))
+    result   = {
+        "shortest_hops": int((d_source[meet].astype(np.int64) + d_target[meet]).min()) if len(meet) else None,
+        "paths": [],
+        "truncated": time.perf_counter() > deadline,      # distances may be incomplete
+        "expansions": 0
+    }
+    if not len(meet) or source == target or result["truncated"]:
+        return result
+
+    def lower_bound(vertices: np.ndarray) -> np.ndarray:
+        known = d_target[vertices]
+        return np.where(known >= 0, known, back + 1)
+
+    def hop(pair: int, after: int) -> Optional[Dict]:
+        lo, hi  = index.pair_offsets[pair], index.pair_offsets[pair + 1]
+        times   = np.asarray(index.txn_time[lo:hi])
+        amounts = np.asarray(index.txn_amount[lo:hi])
+        ok      = amounts >= min_amount
+        if time_ordered:
+            ok &= times >= after
+        picked = np.flatnonzero(ok)
+        if not len(picked):
+            return None
+        first = picked[0]
+        return {"amount": float(amounts[picked].sum()), "transactions": len(picked), "time": int(times[first]),
+                "row": int(index.txn_row[lo + first])}
+
+    def successors(u: int, depth: int):
+        """(v, pair) of u's usable successors that can still reach the target in time."""
+        lo, hi  = csr.offsets[u], csr.offsets[u + 1]
+        targets = np.asarray(csr.targets[lo:hi])
+        keep    = depth + 1 + lower_bound(targets) <= max_hops
+        if min_amount > 0:
+            keep &= np.asarray(index.pair_max[lo:hi]) >= min_amount
+        slots = np.flatnonzero(keep)
+        return iter(zip(targets[slots].tolist(), (slots + lo).tolist()))
+
+    path, hops = [source], []
+    on_path    = {source}
+    stack      = [successors(source, 0)]
+    try:
+        while stack:
+            result["expansions"] += 1
+            if result["expansions"] % 256 == 0 and time.perf_counter() > deadline:
+                raise _Stop
+            step = next(stack[-1], None)
+            if step is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                if hops:
+                    hops.pop()
+                continue
+            v, pair = step
+            if v in on_path:
+                continue
+            detail = hop(pair, hops[-1]["time"] if (time_ordered and hops) else np.iinfo(np.int64).min)
+            if detail is None:
+                continue
+            if v == target:
+                result["paths"].append({"accounts": path + [v], "hops": hops + [detail]})
+                if len(result["paths"]) >= max_paths:
+                    raise _Stop
+                continue
+            path.append(v)
+            on_path.add(v)
+            hops.append(detail)
+            stack.append(successors(v, len(hops)))
+    except _Stop:
+        result["truncated"] = True
+
+    result["paths"].sort(key=lambda p: len(p["hops"]))
+    return result
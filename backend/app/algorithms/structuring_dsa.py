@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Optional, Sequence
+from app.algorithms.events import encode_transactions, sort_events, window_start, EncodedTransactions
+from app.metrics import record
+
+
+def _below_threshold_band(amounts: np.ndarray, thresholds: np.ndarray, margin: float) -> np.ndarray:
+    """
+    Histogram-style banding in one vectorized pass: each amount is binned against the
+    sorted reporting thresholds and returns the index of the threshold it sits just
+    under (amount in [thr * (1 - margin), thr)), or -1 when it sits in no band.
+    """
+    nxt  = np.searchsorted(thresholds, amounts, side="right")
+    band = np.full(len(amounts), -1, dtype=np.int64)
+    has  = nxt < len(thresholds)
+    near = has.copy()
+    near[has] = amounts[has] >= thresholds[nxt[has]] * (1 - margin)
+    band[near] = nxt[near]
+    return band
+
+
+def detect_structuring(df: pd.DataFrame, thresholds: Sequence[float] = (10000.0,), margin: float = 0.10,
+                       window_hours: int = 72, count_threshold: int = 3) -> List[Dict]:
+    """
+    Detects Structuring: clusters of transactions just under reporting thresholds.
+    An account that sends or receives count_threshold+ such transactions inside one
+    rolling window of window_hours is flagged, with the counterparties of its densest window.
+
+    Approach:
+      - Amounts are banded against the sorted thresholds with one searchsorted
+      - Banded transactions become events centred on the receiver (inbound) and on
+        the sender (outbound), sorted by (account, time) once per direction
+      - Rolling count of the window ending at every event = j - window_start(j) + 1,
+        so the whole sweep is two searchsorted calls and a reduceat — no per-account loop
+    """
+    if len(df) == 0:
+        return []
+
+    return structuring_rings(encode_transactions(df), thresholds, margin, window_hours, count_threshold)
+
+
+def structuring_rings(enc: EncodedTransactions, thresholds: Sequence[float], margin: float,
+                       window_hours: float, count_threshold: int,
+                       allowed: Optional[np.ndarray] = None) -> List[Dict]:
+    """Core of detect_structuring over encoded arrays; `allowed` optionally masks central accounts."""
+    results = []
+    thr    = np.sort(np.asarray(thresholds, dtype=float))
+    band   = _below_threshold_band(enc.amount, thr, margin)
+    banded = band >= 0
+    record("structuring_banded", int(banded.sum()))
+    if banded.sum() < count_threshold:
+        return results
+
+    width = int(pd.Timedelta(hours=window_hours).value)
+
+    for direction, center, peer in (("inbound", enc.dst, enc.src), ("outbound", enc.src, enc.dst)):
+        rows = np.flatnonzero(banded & allowed[center]) if allowed is not None else np.flatnonzero(banded)
+        if len(rows) == 0:
+            continue
+        ev = sort_events(center[rows], peer[rows], enc.time[rows], rows)
+
+        lo     = window_start(ev, width)
+        counts = np.arange(len(ev.center)) - lo + 1
+        starts = ev.starts[:-1]
+        peak   = np.maximum.reduceat(counts, starts)
+
+        for g in np.flatnonzero(peak >= count_threshold):
+            # Densest window of this account: first event where the peak count is reached
+            seg = slice(starts[g], ev.starts[g + 1])
+            j   = starts[g] + int(np.argmax(counts[seg]))
+            win = slice(lo[j], j + 1)
+
+            code   = ev.center[j]
+            leaves = [enc.names[p] for p in pd.unique(ev.peer[win])]
+            hit    = np.unique(band[ev.rows[win]])
+
+            results.append({
+                "type": "Structuring",
+                "members": [enc.names[code]] + leaves, # Central + counterparties
+                "metadata": {
+                    "central_node"         : enc.names[code],
+                    "direction"            : direction,
+                    "flagged_transactions" : int(counts[j]),
+                    "window_hours"         : window_hours,
+                    "window_amount"        : round(float(enc.amount[ev.rows[win]].sum()), 2),
+                    "thresholds"           : [float(thr[b]) for b in hit]
+                }
+            })
+
+    return results
@@ -1,120 +1,573 @@
+import math
+import time
+import numpy as np
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from app.algorithms.events import (
+    encode_transactions, sort_events, window_start, next_same_peer, distinct_in_window,
+    EncodedTransactions, EventArrays
+)
+from app.algorithms.sketch import hash_codes, hll_registers, hll_estimate
+from app.metrics import record
 
-def detect_smurfing(df: pd.DataFrame, window_hours: int = 72, count_threshold: int = 10) -> List[Dict]:
+TRIAGE_BLOCK_CELLS = 65_536     # sketch cells merged per block in _smurf_candidates (4 MiB at precision 6)
+
+
+def _smurf_windows(window_hours: float, count_threshold: int,
+                   windows: Optional[List[Tuple[float, int]]]) -> List[Tuple[float, int]]:
+    """Normalises the (hours, threshold) horizons to evaluate; defaults to the single legacy window."""
+    if not windows:
+        return [(window_hours, count_threshold)]
+    return [(float(hours), int(threshold)) for hours, threshold in windows]
+
+
+def _smurf_directions(enc: EncodedTransactions):
+    """(ring type, center codes, peer codes) — Fan-In centers on receivers, Fan-Out on senders."""
+    return (
+        ("Smurfing (Fan-In)",  enc.dst, enc.src),
+        ("Smurfing (Fan-Out)", enc.src, enc.dst),
+    )
+
+
+def _smurf_events(enc: EncodedTransactions, center: np.ndarray, peer: np.ndarray,
+                  min_threshold: int, allowed: Optional[np.ndarray] = None) -> EventArrays:
+    """
+    Sorted event arrays for one direction, restricted to centers that have at least
+    min_threshold distinct counterparties over the whole dataset (no window can beat that)
+    and, if given, to centers whose code is set in the boolean `allowed` mask.
+    """
+    # Masked-out centers are dropped first, so a narrow mask (triage, one shard) also
+    # narrows the distinct-pair count below
+    n_names = len(enc.names)
+    rows    = np.arange(len(center)) if allowed is None else np.flatnonzero(allowed[center])
+    pairs   = np.unique(center[rows].astype(np.int64) * n_names + peer[rows])
+    nunique = np.bincount(pairs // n_names, minlength=n_names)
+    rows    = rows[nunique[center[rows]] >= min_threshold]
+    return sort_events(center[rows], peer[rows], enc.time[rows], rows)
+
+
+class SmurfEpisodes(NamedTuple):
+    """Maximal merged intervals of qualifying windows, as index ranges into an EventArrays."""
+    center: np.ndarray    # center code per episode
+    start: np.ndarray     # first event index of the episode
+    end: np.ndarray       # last event index of the episode (inclusive)
+    peak: np.ndarray      # max distinct counterparties of any window inside it
+
+
+def smurf_episodes(ev: EventArrays, distinct: np.ndarray, width_ns: int, threshold: int) -> SmurfEpisodes:
+    """
+    Finds every window [lo_j, j] with distinct[j] >= threshold and merges overlapping
+    ones per account. Window ends j are increasing and lo_j is non-decreasing within an
+    account, so a qualifying window opens a new episode exactly when it changes account
+    or starts after the previous qualifying window ended — one vectorized pass, no rescans.
+    """
+    hits = np.flatnonzero(distinct >= threshold)
+    if len(hits) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return SmurfEpisodes(empty, empty, empty, empty)
+
+    lo  = window_start(ev, width_ns, hits)
+    new = np.ones(len(hits), dtype=bool)
+    new[1:] = (ev.center[hits[1:]] != ev.center[hits[:-1]]) | (lo[1:] > hits[:-1])
+
+    first = np.flatnonzero(new)
+    last  = np.concatenate((first[1:], [len(hits)])) - 1
+    return SmurfEpisodes(
+        center = ev.center[hits[first]],
+        start  = lo[first],
+        end    = hits[last],
+        peak   = np.maximum.reduceat(distinct[hits], first)
+    )
+
+
+def _episode_rings(enc: EncodedTransactions, ev: EventArrays, episodes: SmurfEpisodes,
+                   rtype: str, hours: float, threshold: int) -> List[Dict]:
+    """One ring per episode; members are the exact counterparties inside the merged interval."""
+    rings  = []
+    counts = np.bincount(episodes.center, minlength=len(enc.names))
+    seen   = {}
+    for code, start, end, peak in zip(episodes.center.tolist(), episodes.start.tolist(),
+                                      episodes.end.tolist(), episodes.peak.tolist()):
+        seen[code] = seen.get(code, 0) + 1
+        leaves = [enc.names[p] for p in pd.unique(ev.peer[start:end + 1])]
+        rings.append({
+            "type": rtype,
+            "members": [enc.names[code]] + leaves,
+            "metadata": {
+                "central_node"   : enc.names[code],
+                "unique_peers"   : peak,
+                "window_hours"   : hours,
+                "count_threshold": threshold,
+                "episode"        : {
+                    "index"             : seen[code],
+                    "of"                : int(counts[code]),
+                    "start"             : pd.Timestamp(int(ev.time[start])).isoformat(),
+                    "end"               : pd.Timestamp(int(ev.time[end])).isoformat(),
+                    "peak_unique_peers" : peak,
+                    "counterparties"    : len(leaves),
+                    "transactions"      : end - start + 1
+                }
+            }
+        })
+    return rings
+
+
+def detect_smurfing(df: pd.DataFrame, window_hours: int = 72, count_threshold: int = 10,
+                    windows: Optional[List[Tuple[float, int]]] = None,
+                    episodes: bool = False) -> List[Dict]:
     """
     Detects Smurfing (Fan-in / Fan-out) using sliding temporal windows.
     Fan-in: Many senders -> 1 receiver.
     Fan-out: 1 sender -> Many receivers.
+
+    windows: optional list of (window_hours, count_threshold) horizons, e.g.
+    [(24, 10), (72, 10), (168, 15)]. All horizons share one encoding and one sort.
+    episodes: report every burst instead of only the first — overlapping qualifying
+    windows are merged into maximal episodes, one ring per episode per horizon.
+
+    Approach:
+      - Account names are integer-encoded once and events sorted by (center, time) once
+      - For each horizon the distinct-counterparty count of the window ending at every
+        event is computed exactly with a difference array (see events.distinct_in_window)
+        — same result as the two-pointer sweep, but in vectorized O(n log n)
+      - Per-account peaks come from one np.maximum.reduceat per horizon
+      - One ring per fired account; members are the counterparties of the first window
+        that crossed the threshold in the first horizon (in list order) that fired
+    """
+    if len(df) == 0:
+        return []
+
+    enc = encode_transactions(df)
+    return smurf_rings(enc, _smurf_windows(window_hours, count_threshold, windows), episodes)
+
+
+SmurfStreams = Dict[str, Tuple[EventArrays, SmurfEpisodes]]     # ring type -> (events, episodes)
+
+
+def smurf_rings(enc: EncodedTransactions, specs: List[Tuple[float, int]], episodes: bool = False,
+                 allowed: Optional[Dict[str, np.ndarray]] = None, streams: Optional[SmurfStreams] = None) -> List[Dict]:
+    """
+    Core of detect_smurfing over encoded arrays; `allowed` optionally maps ring type -> center mask.
+    A `streams` dict is filled with each direction's events and its episodes under the first
+    horizon in specs, so gather_scatter_rings can reuse the pass instead of repeating it.
     """
     results = []
-    
-    # Ensure timestamp is datetime
-    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-    df = df.sort_values('timestamp')
-    
-    # --- Fan-in Detection (Receiver focus) ---
-    # We want to count unique senders per receiver within 72h.
-    # set_index to timestamp for rolling
-    
-    # Iterate through each receiver (group by is safer than global rolling for logic)
-    # Optimization: Filter receivers with total degree < threshold first?
-    # Total distinct senders check might be a good pre-filter.
-    receiver_counts = df.groupby('receiver_id')['sender_id'].nunique()
-    sus_receivers = receiver_counts[receiver_counts >= count_threshold].index.tolist()
-    
-    for receiver in sus_receivers:
-        receiver_df = df[df['receiver_id'] == receiver].sort_values('timestamp')
-        
-        # We need to find if there exists a 72h window with >= 10 unique senders
-        # Sliding window over the events
-        # We can just iterate or use a rolling approach on the time index
-        
-        # Helper to check window
-        # For every transaction, check how many unique senders in [t, t + 72h]
-        # This is O(N^2) worst case per group, but N is small per group usually.
-        # Faster: Use a deque or two pointers.
-        
-        # Vectorized rolling is hard with "unique" count.
-        # Fallback to simple sliding window since we filtered candidates.
-        
-        times = receiver_df['timestamp'].values
-        senders = receiver_df['sender_id'].values
-        n = len(times)
-        
-        start = 0
-        window_senders = {} # Map sender -> count in window
-        distinct_count = 0
-        
-        found = False
-        window_td = pd.Timedelta(hours=window_hours)
-        
-        for end in range(n):
-            # Add current
-            s_end = senders[end]
-            if s_end not in window_senders:
-                window_senders[s_end] = 0
-                distinct_count += 1
-            window_senders[s_end] += 1
-            
-            # Remove expired from left
-            while times[end] - times[start] > window_td:
-                s_start = senders[start]
-                window_senders[s_start] -= 1
-                if window_senders[s_start] == 0:
-                    del window_senders[s_start]
-                    distinct_count -= 1
-                start += 1
-            
-            if distinct_count >= count_threshold:
-                # Found a window
-                results.append({
-                    "type": "Smurfing (Fan-In)",
-                    "members": [receiver] + list(window_senders.keys()), # Central + leaves
-                    "metadata": {"central_node": receiver, "unique_peers": distinct_count}
-                })
-                found = True
-                break # Report once per node to avoid noise
-                
-    # --- Fan-out Detection (Sender focus) ---
-    sender_counts = df.groupby('sender_id')['receiver_id'].nunique()
-    sus_senders = sender_counts[sender_counts >= count_threshold].index.tolist()
-    
-    for sender in sus_senders:
-        sender_df = df[df['sender_id'] == sender].sort_values('timestamp')
-        
-        times = sender_df['timestamp'].values
-        receivers = sender_df['receiver_id'].values
-        n = len(times)
-        
-        start = 0
-        window_receivers = {}
-        distinct_count = 0
-        window_td = pd.Timedelta(hours=window_hours)
-        
-        for end in range(n):
-            r_end = receivers[end]
-            if r_end not in window_receivers:
-                window_receivers[r_end] = 0
-                distinct_count += 1
-            window_receivers[r_end] += 1
-            
-            while times[end] - times[start] > window_td:
-                r_start = receivers[start]
-                window_receivers[r_start] -= 1
-                if window_receivers[r_start] == 0:
-                    del window_receivers[r_start]
-                    distinct_count -= 1
-                start += 1
-            
-            if distinct_count >= count_threshold:
-                results.append({
-                    "type": "Smurfing (Fan-Out)",
-                    "members": [sender] + list(window_receivers.keys()),
-                    "metadata": {"central_node": sender, "unique_peers": distinct_count}
-                })
-                break
+    min_threshold = min(threshold for _, threshold in specs)
+
+    for rtype, center, peer in _smurf_directions(enc):
+        ev = _smurf_events(enc, center, peer, min_threshold, allowed.get(rtype) if allowed else None)
+        record("smurf_events_scanned", len(ev.center))
+        record("smurf_accounts_scanned", len(ev.starts) - 1)
+        if len(ev.center) == 0:
+            if streams is not None:
+                streams[rtype] = (ev, smurf_episodes(ev, np.zeros(0, dtype=np.int64), 0, specs[0][1]))
+            continue
+
+        nxt          = next_same_peer(ev)
+        group_starts = ev.starts[:-1]
+        group_center = ev.center[group_starts]
+
+        # --- Evaluate every horizon over the shared sorted arrays ---
+        horizons = []
+        for i, (hours, threshold) in enumerate(specs):
+            width    = int(pd.Timedelta(hours=hours).value)
+            distinct = distinct_in_window(ev, width, nxt)
+            if episodes or (i == 0 and streams is not None):
+                found = smurf_episodes(ev, distinct, width, threshold)
+                if i == 0 and streams is not None:
+                    streams[rtype] = (ev, found)
+            if episodes:
+                results.extend(_episode_rings(enc, ev, found, rtype, hours, threshold))
+                continue
+            peak     = np.maximum.reduceat(distinct, group_starts)
+            hits     = np.flatnonzero(distinct >= threshold)
+            # First crossing per account (hits are ordered by group, then time)
+            _, first_pos = np.unique(ev.center[hits], return_index=True)
+            first     = hits[first_pos]
+            horizons.append({
+                "hours"    : hours,
+                "threshold": threshold,
+                "width"    : width,
+                "peak"     : peak,
+                "first"    : dict(zip(ev.center[first].tolist(), zip(first.tolist(), distinct[first].tolist())))
+            })
+
+        if episodes:
+            continue
+
+        fired = sorted(set().union(*(h["first"].keys() for h in horizons)))
+
+        # --- Emit one ring per fired account ---
+        for code in fired:
+            g       = int(np.searchsorted(group_center, code))
+            primary = next(h for h in horizons if code in h["first"])
+            j, unique_peers = primary["first"][code]
+            lo      = int(window_start(ev, primary["width"], np.array([j]))[0])
+            leaves  = [enc.names[p] for p in pd.unique(ev.peer[lo:j + 1])]
+
+            results.append({
+                "type": rtype,
+                "members": [enc.names[code]] + leaves, # Central + leaves
+                "metadata": {
+                    "central_node": enc.names[code],
+                    "unique_peers": unique_peers,
+                    "window_hours": primary["hours"],
+                    "windows": [{
+                        "window_hours"     : h["hours"],
+                        "count_threshold"  : h["threshold"],
+                        "fired"            : code in h["first"],
+                        "peak_unique_peers": int(h["peak"][g])
+                    } for h in horizons]
+                }
+            })
+
+    return results
+
+
+def detect_gather_scatter(df: pd.DataFrame, window_hours: int = 72, count_threshold: int = 10,
+                          max_gap_hours: int = 24) -> List[Dict]:
+    """
+    Detects gather-scatter layering: an account that collects from many senders
+    (a Fan-In episode) and then disperses to many receivers (a Fan-Out episode)
+    that starts no later than max_gap_hours after the gathering ended.
+
+    Approach:
+      - Fan-In and Fan-Out episodes come from the same sorted-array pass as detect_smurfing
+        (the pipeline hands over the episodes its smurfing pass found, see smurf_rings)
+      - Episodes are joined per account with one vectorized merge on the account code,
+        then filtered on gather_start <= scatter_start <= gather_end + max_gap_hours
+      - Each matching pair becomes one ring: central account + senders + receivers
+    """
+    if len(df) == 0:
+        return []
+
+    return gather_scatter_rings(encode_transactions(df), window_hours, count_threshold, max_gap_hours)
+
+
+def gather_scatter_rings(enc: EncodedTransactions, window_hours: float, count_threshold: int,
+                          max_gap_hours: float, allowed: Optional[np.ndarray] = None,
+                          streams: Optional[SmurfStreams] = None) -> List[Dict]:
+    """
+    Core of detect_gather_scatter over encoded arrays; `allowed` optionally masks central accounts.
+    `streams` are the episodes a smurf_rings pass over the same enc, allowed mask and
+    (window_hours, count_threshold) first horizon already found; without them the pass runs here.
+    """
+    results = []
+    width = int(pd.Timedelta(hours=window_hours).value)
+    gap   = int(pd.Timedelta(hours=max_gap_hours).value)
+
+    if streams is None:
+        streams = {}
+        for rtype, center, peer in _smurf_directions(enc):
+            ev = _smurf_events(enc, center, peer, count_threshold, allowed)
+            streams[rtype] = (ev, smurf_episodes(ev, distinct_in_window(ev, width), width, count_threshold))
+
+    frames = {}
+    for rtype, (ev, episodes) in streams.items():
+        frames[rtype] = (ev, pd.DataFrame({
+            "center": episodes.center,
+            "start" : episodes.start,
+            "end"   : episodes.end,
+            "t0"    : ev.time[episodes.start],
+            "t1"    : ev.time[episodes.end],
+            "peak"  : episodes.peak
+        }))
+
+    gather_ev, gather   = frames["Smurfing (Fan-In)"]
+    scatter_ev, scatter = frames["Smurfing (Fan-Out)"]
+    if gather.empty or scatter.empty:
+        return results
+
+    pairs = gather.merge(scatter, on="center", suffixes=("_in", "_out"))
+    pairs = pairs[(pairs["t0_out"] >= pairs["t0_in"]) & (pairs["t0_out"] <= pairs["t1_in"] + gap)]
+
+    for row in pairs.itertuples(index=False):
+        senders   = [enc.names[p] for p in pd.unique(gather_ev.peer[row.start_in:row.end_in + 1])]
+        receivers = [enc.names[p] for p in pd.unique(scatter_ev.peer[row.start_out:row.end_out + 1])]
+        central   = enc.names[row.center]
+
+        results.append({
+            "type": "Gather-Scatter",
+            "members": [central] + list(dict.fromkeys(senders + receivers)),
+            "metadata": {
+                "central_node": central,
+                "gap_hours"   : round((row.t0_out - row.t1_in) / 3.6e12, 2),
+                "gather"      : {
+                    "start"       : pd.Timestamp(int(row.t0_in)).isoformat(),
+                    "end"         : pd.Timestamp(int(row.t1_in)).isoformat(),
+                    "unique_peers": int(row.peak_in),
+                    "senders"     : len(senders)
+                },
+                "scatter"     : {
+                    "start"       : pd.Timestamp(int(row.t0_out)).isoformat(),
+                    "end"         : pd.Timestamp(int(row.t1_out)).isoformat(),
+                    "unique_peers": int(row.peak_out),
+                    "receivers"   : len(receivers)
+                }
+            }
+        })
 
     return results
+
+
+def _smurf_candidates(enc: EncodedTransactions, window_hours: float, count_threshold: int,
+                      bucket_hours: float, precision: int, slack: float) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Approximate first pass: one fixed-size HyperLogLog sketch per (account, time bucket).
+    Any window of window_hours lies inside ceil(window / bucket) + 1 consecutive buckets,
+    so the register-wise max over that run of buckets sketches a superset of every window
+    that starts in the first one. Accounts whose estimate reaches slack * count_threshold
+    in some run become candidates for the exact pass.
+    """
+    bucket_ns = int(pd.Timedelta(hours=bucket_hours).value)
+    span      = math.ceil(window_hours / bucket_hours) + 1
+    bucket    = (enc.time - enc.time.min()) // bucket_ns if len(enc.time) else enc.time
+    n_buckets = int(bucket.max()) + 1 if len(bucket) else 1
+
+    candidates = {}
+    stats      = {"sketch_cells": 0, "sketch_bytes": 0, "candidates": 0}
+
+    for rtype, center, peer in _smurf_directions(enc):
+        # An account with fewer transactions than the threshold cannot have that many
+        # distinct counterparties: a bincount drops it before anything is sketched
+        rows   = np.flatnonzero(np.bincount(center, minlength=len(enc.names))[center] >= count_threshold)
+        cells, cell_of = np.unique(center[rows].astype(np.int64) * n_buckets + bucket[rows], return_inverse=True)
+        registers = hll_registers(cell_of, hash_codes(peer[rows]), len(cells), precision)
+
+        # Union each cell with the following span-1 buckets of the same account, a block
+        # of cells at a time: only the block is copied, never the whole register matrix
+        mask = np.zeros(len(enc.names), dtype=bool)
+        for lo in range(0, len(cells), TRIAGE_BLOCK_CELLS):
+            block  = cells[lo:lo + TRIAGE_BLOCK_CELLS]
+            merged = registers[lo:lo + TRIAGE_BLOCK_CELLS].copy()
+            for offset in range(1, span):
+                target = block + offset
+                pos    = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+                exists = (cells[pos] == target) & ((block % n_buckets) + offset < n_buckets)
+                merged[exists] = np.maximum(merged[exists], registers[pos[exists]])
+            flagged = hll_estimate(merged) >= slack * count_threshold
+            mask[block[flagged] // n_buckets] = True
+
+        candidates[rtype] = mask
+        stats["sketch_cells"] += len(cells)
+        stats["sketch_bytes"] += registers.nbytes
+        stats["candidates"]   += int(mask.sum())
+
+    return candidates, stats
+
+
+def detect_smurfing_triaged(df: pd.DataFrame, window_hours: int = 72, count_threshold: int = 10,
+                            bucket_hours: float = 24, precision: int = 6, slack: float = 0.7,
+                            episodes: bool = False) -> List[Dict]:
+    """
+    Two-stage smurfing detection for very large datasets.
+    A HyperLogLog pass (2**precision one-byte registers per account per bucket) flags
+    accounts whose distinct counterparties over window_hours come near count_threshold;
+    the exact sliding-window check then runs only on those candidates.
+    Results are a subset of detect_smurfing's; use smurf_triage_recall to measure the gap.
+    """
+    if len(df) == 0:
+        return []
+
+    enc = encode_transactions(df)
+    candidates, _ = _smurf_candidates(enc, window_hours, count_threshold, bucket_hours, precision, slack)
+    return smurf_rings(enc, [(window_hours, count_threshold)], episodes, allowed=candidates)
+
+
+def smurf_triage_recall(df: pd.DataFrame, window_hours: int = 72, count_threshold: int = 10,
+                        bucket_hours: float = 24, precision: int = 6, slack: float = 0.7) -> Dict:
+    """
+    Measures the triaged detector against the exact one on the same data:
+    recall of fired accounts at the configured threshold, candidate volume, sketch memory
+    and wall time of both paths.
+    """
+    enc   = encode_transactions(df)
+    specs = [(window_hours, count_threshold)]
+
+    t0    = time.perf_counter()
+    exact = smurf_rings(enc, specs)
+    exact_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    candidates, stats = _smurf_candidates(enc, window_hours, count_threshold, bucket_hours, precision, slack)
+    triaged = smurf_rings(enc, specs, allowed=candidates)
+    triaged_seconds = time.perf_counter() - t0
+
+    truth = {(r["type"], r["metadata"]["central_node"]) for r in exact}
+    found = {(r["type"], r["metadata"]["central_node"]) for r in triaged} & truth
+
+    return {
+        "recall"          : round(len(found) / len(truth), 4) if truth else 1.0,
+        "exact_positives" : len(truth),
+        "recovered"       : len(found),
+        "candidates"      : stats["candidates"],
+        "accounts"        : len(enc.names),
+        "sketch_cells"    : stats["sketch_cells"],
+        "sketch_bytes"    : stats["sketch_bytes"],
+        "exact_seconds"   : round(exact_seconds, 4),
+        "triaged_seconds" : round(triaged_seconds, 4)
+    }
+
+
+def detect_pass_through_shells(df: pd.DataFrame, min_hops: int = 3, max_gap_hours: int = 24,
+                               max_haircut: float = 0.10, max_degree: int = 3) -> List[Dict]:
+    """
+    Detects layered shell chains from how money actually moves through them.
+    A shell receives funds and passes them on quickly with a small haircut, so a
+    hop is an incoming leg paired with an outgoing leg of the same low-degree account
+    that leaves within max_gap_hours and keeps the amount within max_haircut.
+
+    Approach:
+      - Accounts are integer-encoded once; candidates are accounts of total degree 2..max_degree
+      - Incoming and outgoing legs of candidates are paired in one batched merge on the
+        account; every pair strictly forward in time, within the gap and the haircut is a link
+      - Time strictly increases along a link, so the links form a DAG over transactions
+      - Longest path lengths come from one level-by-level DP over that DAG (sinks first);
+        each head (a leg with no predecessor) is then walked along its best onward legs
+      - Paths with >= min_hops legs are reported; members are the intermediate shells
+    """
+    if len(df) == 0:
+        return []
+
+    return pass_through_rings(encode_transactions(df), min_hops, max_gap_hours, max_haircut, max_degree)
+
+
+def pass_through_rings(enc: EncodedTransactions, min_hops: int, max_gap_hours: float,
+                       max_haircut: float, max_degree: int) -> List[Dict]:
+    """Core of detect_pass_through_shells over encoded arrays."""
+    tx_in, tx_out = pass_through_links(enc, max_gap_hours, max_haircut, max_degree)
+    paths = shell_paths(tx_in, tx_out, min_hops)
+    legs  = np.unique(np.concatenate(paths)) if paths else np.zeros(0, dtype=np.int64)
+    return shell_rings(paths, leg_table(enc, legs), enc.names)
+
+
+def pass_through_links(enc: EncodedTransactions, max_gap_hours: float, max_haircut: float,
+                        max_degree: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hop links as (incoming leg, onward leg) pairs of enc.rows ids. Only accounts set in
+    `allowed` act as shells; enc must hold every transaction of those accounts so
+    their degree is exact.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    src, dst, times, amounts = enc.src, enc.dst, enc.time, enc.amount
+    tx = np.arange(len(src))
+
+    degree       = np.bincount(src, minlength=len(enc.names)) + np.bincount(dst, minlength=len(enc.names))
+    is_candidate = (degree >= 2) & (degree <= max_degree)
+    if allowed is not None:
+        is_candidate &= allowed
+    not_loop     = src != dst
+
+    in_mask  = is_candidate[dst] & not_loop
+    out_mask = is_candidate[src] & not_loop
+    record("shell_candidates", int(is_candidate.sum()))
+    if not in_mask.any() or not out_mask.any():
+        return empty, empty
+
+    incoming = pd.DataFrame({"account": dst[in_mask], "tx_in": tx[in_mask]})
+    outgoing = pd.DataFrame({"account": src[out_mask], "tx_out": tx[out_mask]})
+
+    # --- Batched in/out join: every outgoing leg of the same account that qualifies ---
+    # Gap and haircut are checked on every (in, out) pair of an account, and every pair that
+    # passes is kept: which onward leg continues the longest chain is for shell_paths to
+    # decide. Shells have at most max_degree legs, so an account contributes at most
+    # (max_degree / 2)**2 pairs.
+    pairs   = incoming.merge(outgoing, on="account")
+    tx_in   = pairs["tx_in"].to_numpy(dtype=np.int64)
+    tx_out  = pairs["tx_out"].to_numpy(dtype=np.int64)
+    elapsed = times[tx_out] - times[tx_in]
+    keep    = ((elapsed > 0) & (elapsed <= int(pd.Timedelta(hours=max_gap_hours).value)) &
+               (np.abs(amounts[tx_out] - amounts[tx_in]) <= max_haircut * amounts[tx_in]))
+    record("shell_hop_links", int(keep.sum()))
+    return enc.rows[tx_in[keep]], enc.rows[tx_out[keep]]
+
+
+def shell_paths(tx_in: np.ndarray, tx_out: np.ndarray, min_hops: int) -> List[np.ndarray]:
+    """
+    Longest path from every head (a leg nobody links into) over the hop DAG.
+
+    hops[v] = legs on the longest path starting at leg v = 1 + max(hops[w]) over v's
+    onward legs. It is computed in reverse topological order, level by level: legs whose
+    onward legs are all settled (at first, legs with none) settle their predecessors'
+    counts — one np.maximum.at per level, O(links) in total. Each leg then keeps the onward
+    leg with the largest count (ties: the lowest row id), and the heads are walked along
+    those choices, all at once, one searchsorted per level.
+    """
+    if len(tx_in) == 0:
+        return []
+
+    legs = np.unique(np.concatenate((tx_in, tx_out)))
+    a, b = np.searchsorted(legs, tx_in), np.searchsorted(legs, tx_out)
+    n    = len(legs)
+
+    # --- Longest path length from every leg, sinks first ---
+    by_b     = np.argsort(b, kind="stable")
+    b_starts = np.searchsorted(b[by_b], np.arange(n + 1))
+    pending  = np.bincount(a, minlength=n)           # onward legs not settled yet
+    hops     = np.ones(n, dtype=np.int64)
+    frontier = np.flatnonzero(pending == 0)
+    while len(frontier):
+        # Links into the frontier: their sources' counts can be settled against it
+        counts = b_starts[frontier + 1] - b_starts[frontier]
+        links  = by_b[np.repeat(b_starts[frontier + 1] - counts.cumsum(), counts) + np.arange(counts.sum())]
+        np.maximum.at(hops, a[links], hops[b[links]] + 1)
+        np.subtract.at(pending, a[links], 1)
+        sources  = np.unique(a[links])
+        frontier = sources[pending[sources] == 0]
+
+    # --- Best onward leg per leg, then walk every head along it ---
+    order  = np.lexsort((b, -hops[b], a))
+    first  = np.ones(len(order), dtype=bool)
+    first[1:] = a[order[1:]] != a[order[:-1]]
+    key    = a[order[first]]
+    onward = b[order[first]]
+    heads  = np.setdiff1d(key, b)
+
+    levels = [heads]
+    cur    = heads
+    while True:
+        pos   = np.minimum(np.searchsorted(key, cur), len(key) - 1)
+        found = (cur >= 0) & (key[pos] == cur)
+        if not found.any():
+            break
+        cur = np.where(found, onward[pos], -1)
+        levels.append(cur)
+
+    paths = np.stack(levels, axis=1)
+    count = (paths >= 0).sum(axis=1)
+    return [legs[row[row >= 0]] for row in paths[count >= min_hops]]
+
+
+def leg_table(enc: EncodedTransactions, legs: np.ndarray) -> pd.DataFrame:
+    """src/dst/time/amount of the given row ids, indexed by row id."""
+    order = np.argsort(enc.rows, kind="stable")
+    pos   = order[np.searchsorted(enc.rows, legs, sorter=order)]
+    return pd.DataFrame({
+        "src"   : enc.src[pos],
+        "dst"   : enc.dst[pos],
+        "time"  : enc.time[pos],
+        "amount": enc.amount[pos]
+    }, index=legs)
+
+
+def shell_rings(paths: List[np.ndarray], legs: pd.DataFrame, names: pd.Index) -> List[Dict]:
+    """One 'Layered Shell' ring per path; members are the intermediate accounts."""
+    shells = []
+    for path_legs in paths:
+        hop  = legs.loc[path_legs]
+        path = [names[hop["src"].iat[0]]] + [names[d] for d in hop["dst"]]
+        shells.append({
+            "type"    : "Layered Shell",
+            "members" : path[1:-1],
+            "metadata": {
+                "size"          : len(path) - 2,
+                "hops"          : len(path_legs),
+                "source"        : path[0],
+                "destination"   : path[-1],
+                "path"          : path,
+                "duration_hours": round(float(hop["time"].iat[-1] - hop["time"].iat[0]) / 3.6e12, 2),
+                "retained_ratio": round(float(hop["amount"].iat[-1] / hop["amount"].iat[0]), 4)
+            }
+        })
+
+    return shells
@@ -0,0 +1,151 @@
+import heapq
+import os
+import time
+import numpy as np
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.algorithms.events import EncodedTransactions
+
+TRACE_ARRAYS = ("out_offsets", "out_order", "out_clock", "in_offsets", "in_order", "in_clock")
+
+
+class TraceIndex(NamedTuple):
+    """
+    Each account's transactions in sweep order, as two CSR indexes over transaction rows:
+      - sent by v, oldest first:    out_order[out_offsets[v]:out_offsets[v + 1]]
+      - received by v, newest first: in_order[in_offsets[v]:in_offsets[v + 1]]
+    out_clock / in_clock hold the matching sweep clocks (the timestamp, negated for received
+    transactions) — ascending within every slice, so an account's first transaction past a
+    given clock is one binary search.
+    """
+    out_offsets: np.ndarray
+    out_order: np.ndarray
+    out_clock: np.ndarray
+    in_offsets: np.ndarray
+    in_order: np.ndarray
+    in_clock: np.ndarray
+
+
+def build_trace_index(enc: EncodedTransactions) -> TraceIndex:
+    n        = len(enc.names)
+    time_col = np.asarray(enc.time)
+    out      = np.lexsort((time_col, enc.src))
+    inc      = np.lexsort((-time_col, enc.dst))
+    out_offsets = np.zeros(n + 1, dtype=np.int64)
+    in_offsets  = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(enc.src, minlength=n), out=out_offsets[1:])
+    np.cumsum(np.bincount(enc.dst, minlength=n), out=in_offsets[1:])
+    return TraceIndex(
+        out_offsets = out_offsets,
+        out_order   = out.astype(np.int64),
+        out_clock   = time_col[out],
+        in_offsets  = in_offsets,
+        in_order    = inc.astype(np.int64),
+        in_clock    = -time_col[inc]
+    )
+
+
+def save_trace_index(directory: str, index: TraceIndex):
+    os.makedirs(directory, exist_ok=True)
+    for name in TRACE_ARRAYS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(index, name))
+
+
+def load_trace_index(directory: str) -> TraceIndex:
+    """Memory-maps a saved TraceIndex. Raises FileNotFoundError."""
+    return TraceIndex(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                        for name in TRACE_ARRAYS))
+
+
+def trace_funds(index: TraceIndex, enc: EncodedTransactions, seed: int, backward: bool = False,
+                window_ns: int = 7 * 86_400 * 10**9, start: Optional[int] = None, amount: Optional[float] = None,
+                max_hops: int = 6, min_amount: float = 0.0, timeout: float = 2.0) -> Dict:
+    """
+    Follows `amount` of the seed's money through time-respecting transfers, conserving it.
+
+    Forward, the seed starts holding `amount` (default: everything it sends in the window)
+    at `start` (default: its first outgoing transaction) and the window runs `window_ns`
+    after that. Transactions are swept in time order; one from u moves min(its amount,
+    what u still holds) of the traced funds to its receiver, who can pass them on from
+    then. Backward is the mirror image: newest first over received transactions, tracing
+    where the money the seed received (up to `start`) could have come from.
+
+    Every account's traced funds are therefore its receipts minus what it passed on, and
+    they sum to `amount` at all times. Transfers that would move less than min_amount are
+    skipped, accounts `max_hops` transfers from the seed keep what they get, and the sweep
+    stops at `timeout` seconds (truncated = True).
+
+    The sweep is a heap over the frontier — accounts holding funds, keyed by their next
+    transaction — so it touches only the transactions of accounts reached, never the
+    whole window. Returns per-account received / held / hops / first time; window is None
+    when the seed has no transactions to start from.
+    """
+    if backward:
+        offsets, order, clocks, peers, sign = index.in_offsets, index.in_order, index.in_clock, enc.src, -1
+    else:
+        offsets, order, clocks, peers, sign = index.out_offsets, index.out_order, index.out_clock, enc.dst, 1
+    amounts  = enc.amount
+    deadline = time.perf_counter() + timeout
+
+    lo, hi = int(offsets[seed]), int(offsets[seed + 1])
+    if start is None and hi == lo:
+        return {"amount": amount or 0.0, "window": None, "accounts": {}, "transfers": 0, "truncated": False,
+                "held_by_seed": amount or 0.0}
+    clock0 = sign * start if start is not None else int(clocks[lo])
+    clock1 = clock0 + window_ns
+    first  = lo + int(np.searchsorted(clocks[lo:hi], clock0))
+    last   = lo + int(np.searchsorted(clocks[lo:hi], clock1, side="right"))
+    if amount is None:
+        amount = float(np.asarray(amounts)[np.asarray(order[first:last])].sum())
+
+    result = {"amount": amount, "window": sorted((sign * clock0, sign * clock1)), "accounts": {},
+              "transfers": 0, "truncated": False}
+    floor  = max(min_amount, 1e-9)
+    held   = {seed: amount}
+    recv   = {}
+    hops   = {seed: 0}
+    seen   = {}          # account -> clock it was first reached at
+    done   = {}          # account -> last transaction position swept
+    heap   = []
+
+    def upcoming(u: int, pos: int, clock: Optional[int] = None) -> Optional[Tuple[int, int, int]]:
+        """Heap entry for u's first unswept transaction from `pos` (at or after `clock`) in the window."""
+        hi = int(offsets[u + 1])
+        if clock is not None:
+            pos += int(clocks[pos:hi].searchsorted(clock))
+        return (int(clocks[pos]), pos, u) if pos < hi and clocks[pos] <= clock1 else None
+
+    carry  = upcoming(seed, first) if amount >= floor else None     # the next entry, not yet pushed
+    queued = {seed} if carry else set()
+    steps  = 0
+    while carry or heap:
+        steps += 1
+        if steps % 1024 == 0 and time.perf_counter() > deadline:
+            result["truncated"] = True
+            break
+        # pushpop hands the carried entry straight back when it is still the earliest
+        clock, pos, u = heapq.heappushpop(heap, carry) if carry else heapq.heappop(heap)
+        done[u] = pos
+        txn     = int(order[pos])
+        moved   = min(float(amounts[txn]), held[u])
+        if moved >= floor:
+            v        = int(peers[txn])
+            held[u] -= moved
+            held[v]  = held.get(v, 0.0) + moved
+            recv[v]  = recv.get(v, 0.0) + moved
+            hops[v]  = min(hops.get(v, max_hops), hops[u] + 1)
+            seen.setdefault(v, clock)
+            result["transfers"] += 1
+            if v not in queued and hops[v] < max_hops and held[v] >= floor:
+                entry = upcoming(v, done[v] + 1 if v in done else int(offsets[v]), clock)
+                if entry:
+                    heapq.heappush(heap, entry)
+                    queued.add(v)
+        # u carries on with its next transaction while it still holds enough to move
+        carry = upcoming(u, pos + 1) if held[u] >= floor else None
+        if not carry:
+            queued.discard(u)
+
+    result["accounts"] = {v: {"received": recv[v], "held": held[v], "hops": hops[v], "first_time": sign * seen[v]}
+                          for v in recv}
+    result["held_by_seed"] = held[seed]
+    return result
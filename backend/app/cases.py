@@ -0,0 +1,77 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CASE_DB = os.getenv("CASE_DB", "cases.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flags (
+    account_id TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    notes      TEXT,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS flags_by_status ON flags (status);
+"""
+
+UPSERT = """
+INSERT INTO flags (account_id, status, notes, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (account_id) DO UPDATE SET status = excluded.status, notes = excluded.notes,
+                                       updated_at = excluded.updated_at
+"""
+
+
+class CaseStore:
+    """
+    Analyst case flags (account_id -> status, notes) in an embedded SQLite database.
+
+    WAL mode lets every uvicorn worker and thread read while one writes, and the flags
+    survive restarts. account_id is the clustered primary key, so looking up a batch of
+    accounts is one index probe per account however many are flagged. Each thread gets its
+    own connection, since sqlite3 connections must not be shared across threads.
+    """
+
+    def __init__(self, path: str = CASE_DB):
+        self.path   = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")     # durable at checkpoints; WAL keeps it consistent
+            self._local.conn = conn
+        return conn
+
+    def flag(self, account_id: str, status: str, notes: Optional[str] = None) -> Dict:
+        return self.flag_many([(account_id, status, notes)])[0]
+
+    def flag_many(self, flags: Iterable[Tuple[str, str, Optional[str]]]) -> List[Dict]:
+        """Sets (account_id, status, notes) for every account in one transaction."""
+        now  = time.time()
+        rows = [(str(account_id), status, notes, now) for account_id, status, notes in flags]
+        with self._connect() as conn:
+            conn.executemany(UPSERT, rows)
+        return [{"account_id": a, "status": s, "notes": n, "timestamp": t} for a, s, n, t in rows]
+
+    def get(self, account_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT status, notes, updated_at FROM flags WHERE account_id = ?", (account_id,)).fetchone()
+        return {"status": row[0], "notes": row[1], "timestamp": row[2]} if row else None
+
+    def statuses(self, account_ids: Iterable[str]) -> Dict[str, str]:
+        """Status of each flagged account among account_ids, in a single query."""
+        ids = json.dumps([str(a) for a in account_ids])
+        return dict(self._connect().execute(
+            "SELECT flags.account_id, flags.status FROM json_each(?) AS ids "
+            "JOIN flags ON flags.account_id = ids.value", (ids,)))
+
+    def counts(self) -> Dict[str, int]:
+        """Flagged accounts per status."""
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM flags GROUP BY status"))
@@ -0,0 +1,101 @@
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+
+class DisjointSet:
+    """Union-find over 0..n-1 with path halving and union by size."""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size   = [1] * n
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> bool:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+
+def consolidate_rings(rings: List[Dict], threshold: float) -> List[Dict]:
+    """
+    Merges detected rings of the same pattern type whose member sets overlap by at least
+    `threshold` (Jaccard, 0 < threshold <= 1) into ring clusters — connected components of
+    the "overlaps" relation, so A~B and B~C put A, B and C in one cluster.
+
+    Candidate pairs come from the account -> ring incidence, with prefix filtering: each
+    ring's members are ordered rarest account first, and two rings with Jaccard >= t must
+    share one of the first |r| - ceil(t * |r|) + 1 members of each. Hub accounts that sit
+    in thousands of cycles are thus almost never indexed, and candidates stay near-linear
+    in the number of rings. A pair already in one cluster is not re-checked.
+
+    Each cluster is returned as a ring over the union of its members; its metadata holds
+    ring_count (distinct member sets merged) and member_ring_counts (account -> how many of
+    them it was in). A member set that merges with nothing is returned as its first ring,
+    with its metadata plus ring_count 1.
+    """
+    # Rings over the same accounts (e.g. one cycle's rotations and reorderings) are one
+    # set: union-find runs over distinct (type, members) sets only
+    distinct = {}
+    for i, ring in enumerate(rings):
+        distinct.setdefault((ring["type"], tuple(sorted({str(m) for m in ring["members"]}))), []).append(i)
+    keys    = list(distinct)
+    types   = [rtype for rtype, _ in keys]
+    members = [list(accounts) for _, accounts in keys]
+    uf      = DisjointSet(len(keys))
+
+    by_type = defaultdict(list)
+    for i, rtype in enumerate(types):
+        by_type[rtype].append(i)
+
+    for indexes in by_type.values():
+        frequency = Counter(m for i in indexes for m in members[i])
+        postings  = defaultdict(list)              # account -> sets with it in their prefix
+        # Smallest sets first: a later set r only has to match sets with |s| >= t * |r|
+        for r in sorted(indexes, key=lambda i: len(members[i])):
+            size    = len(members[r])
+            ordered = sorted(members[r], key=lambda m: (frequency[m], m))
+            prefix  = ordered[:size - math.ceil(threshold * size - 1e-9) + 1]
+            mine    = None
+            checked = set()
+            for account in prefix:
+                for s in postings[account]:
+                    if s in checked or len(members[s]) + 1e-9 < threshold * size or uf.find(s) == uf.find(r):
+                        continue
+                    checked.add(s)
+                    mine   = mine or set(members[r])
+                    shared = len(mine.intersection(members[s]))
+                    if shared + 1e-9 >= threshold * (size + len(members[s]) - shared):
+                        uf.union(r, s)
+                postings[account].append(r)
+
+    clusters = defaultdict(list)
+    for k, key in enumerate(keys):
+        clusters[uf.find(k)].append(key)
+
+    # A cluster counts each distinct member set once, as score_rings' ring_id dedup does —
+    # two orderings of one cycle are one ring with or without consolidation
+    consolidated = []
+    for cluster in clusters.values():
+        if len(cluster) == 1:
+            ring = rings[distinct[cluster[0]][0]]
+            consolidated.append({**ring, "metadata": {**ring.get("metadata", {}), "ring_count": 1}})
+            continue
+        counts = Counter(m for _, accounts in cluster for m in accounts)
+        consolidated.append({
+            "type"    : cluster[0][0],
+            "members" : sorted(counts),
+            "metadata": {"ring_count": len(cluster), "member_ring_counts": dict(counts)}
+        })
+    return consolidated
@@ -0,0 +1,282 @@
+import multiprocessing as mp
+import os
+import threading
+import numpy as np
+from collections import deque
+from functools import lru_cache
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from app.algorithms.events import EncodedTransactions
+from app.algorithms.graph_dsa import csr_cycles, cycle_rings
+from app.out_of_core import shard_of
+from app.pipeline import CYCLE_MIN_LEN, CYCLE_MAX_LEN, detect_shard_rings, combine_shard_rings
+from app.snapshot import GraphSnapshot, derived_index, open_snapshot
+
+
+def _worker_main(conn, handler: Callable[[Any], Any]):
+    """Worker process loop: run tasks received on its pipe until a None sentinel arrives."""
+    while True:
+        payload = conn.recv()
+        if payload is None:
+            return
+        try:
+            conn.send((True, handler(payload)))
+        except Exception as e:
+            conn.send((False, repr(e)))
+
+
+class Coordinator:
+    """
+    Pool of local worker processes, each fed one task at a time over its own pipe.
+
+    A private pipe per worker means the coordinator always knows which task a worker
+    holds, and a worker dying mid-write cannot leave a lock held that other workers need
+    (as it can with one shared multiprocessing.Queue). The coordinator blocks on all pipes
+    and process sentinels at once. A worker that dies mid-task (segfault, OOM kill,
+    os._exit) is replaced and its task re-queued, up to max_retries times per task. An
+    exception raised by the handler is deterministic, so it fails the run instead.
+    Workers persist across run() calls. Runs are serialized; the parallelism comes from
+    the workers.
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], workers: int = 4, max_retries: int = 2):
+        self.handler     = handler
+        self.n_workers   = max(1, workers)
+        self.max_retries = max_retries
+        self._ctx        = mp.get_context("spawn")
+        self._workers    = []       # [process, pipe] per slot
+        self._lock       = threading.Lock()
+        self.restarts    = 0
+
+    def _spawn(self) -> list:
+        conn, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker_main, args=(child, self.handler), daemon=True)
+        proc.start()
+        child.close()
+        return [proc, conn]
+
+    def _replace(self, slot: int):
+        proc, conn = self._workers[slot]
+        conn.close()
+        proc.join(timeout=1)
+        self._workers[slot] = self._spawn()
+        self.restarts += 1
+
+    def _abandon(self, running: Dict[int, int]):
+        """Replaces workers still holding tasks of a failed run, so their late replies cannot reach the next run."""
+        for slot in running:
+            self._workers[slot][0].terminate()
+            self._replace(slot)
+        running.clear()
+
+    def run(self, payloads: List[Any]) -> List[Any]:
+        """Runs every payload through the handler on the pool; results come back in payload order."""
+        with self._lock:
+            while len(self._workers) < self.n_workers:
+                self._workers.append(self._spawn())
+
+            pending   = deque(range(len(payloads)))
+            attempts  = [0] * len(payloads)
+            results   = [None] * len(payloads)
+            running   = {}              # worker slot -> task id
+            remaining = len(payloads)
+
+            while remaining:
+                # Hand one task to every idle worker
+                for slot in range(len(self._workers)):
+                    if slot in running or not pending:
+                        continue
+                    if not self._workers[slot][0].is_alive():
+                        self._replace(slot)
+                    task_id = pending.popleft()
+                    self._workers[slot][1].send(payloads[task_id])
+                    running[slot] = task_id
+
+                wait([self._workers[slot][1] for slot in running] +
+                     [self._workers[slot][0].sentinel for slot in running])
+
+                for slot, task_id in list(running.items()):
+                    proc, conn = self._workers[slot]
+                    try:
+                        if conn.poll():
+                            ok, value = conn.recv()
+                        elif not proc.is_alive():
+                            raise EOFError
+                        else:
+                            continue
+                    except (EOFError, OSError):
+                        # Worker died holding this task: replace it and retry the task
+                        del running[slot]
+                        self._replace(slot)
+                        attempts[task_id] += 1
+                        if attempts[task_id] > self.max_retries:
+                            self._abandon(running)
+                            raise RuntimeError(f"Task {task_id} crashed its worker {attempts[task_id]} times")
+                        pending.appendleft(task_id)
+                        continue
+
+                    del running[slot]
+                    if not ok:
+                        self._abandon(running)
+                        raise RuntimeError(f"Task {task_id} failed: {value}")
+                    results[task_id] = value
+                    remaining -= 1
+
+            return results
+
+    def close(self):
+        """Stops the workers, after any run in progress (runs hold the same lock)."""
+        with self._lock:
+            for proc, conn in self._workers:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+            for proc, conn in self._workers:
+                proc.join(timeout=5)
+                if proc.is_alive():
+                    proc.terminate()
+                conn.close()
+            self._workers = []
+
+
+# --- Sharded ring detection over a snapshot ---
+
+_snapshot = lru_cache(maxsize=4)(open_snapshot)  # per worker: a snapshot is mapped once, pages shared
+
+
+class ShardLayout(NamedTuple):
+    """
+    A snapshot's transactions bucketed by account shard, so a task reads only its own rows:
+      - owner[v]: shard owning account v
+      - txn_positions[txn_offsets[s]:txn_offsets[s + 1]]: ascending positions of the
+        transactions touching shard s (sender or receiver owned; a cross-shard one is in both)
+      - boundary_sources: sorted accounts with an outgoing CSR edge into another shard
+    """
+    owner: np.ndarray
+    txn_offsets: np.ndarray
+    txn_positions: np.ndarray
+    boundary_sources: np.ndarray
+
+
+def build_shard_layout(snap: GraphSnapshot, n_shards: int) -> ShardLayout:
+    enc, csr = snap.transactions, snap.csr
+    owner    = shard_of(np.arange(len(enc.names)), n_shards)
+    src_shard, dst_shard = owner[enc.src], owner[enc.dst]
+    positions = np.arange(len(enc.src), dtype=np.int64)
+    cross     = src_shard != dst_shard
+    shards    = np.concatenate((src_shard, dst_shard[cross]))
+    positions = np.concatenate((positions, positions[cross]))
+    order     = np.lexsort((positions, shards))
+    txn_offsets = np.zeros(n_shards + 1, dtype=np.int64)
+    np.cumsum(np.bincount(shards, minlength=n_shards), out=txn_offsets[1:])
+
+    offsets = np.asarray(csr.offsets)
+    sources = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    boundary = np.zeros(len(owner), dtype=bool)
+    boundary[sources[owner[sources] != owner[np.asarray(csr.targets)]]] = True
+    return ShardLayout(owner, txn_offsets, positions[order], np.flatnonzero(boundary).astype(np.int64))
+
+
+def save_shard_layout(directory: str, layout: ShardLayout):
+    os.makedirs(directory, exist_ok=True)
+    for name in ShardLayout._fields:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(layout, name))
+
+
+def load_shard_layout(directory: str) -> ShardLayout:
+    """Memory-maps a saved ShardLayout. Raises FileNotFoundError."""
+    return ShardLayout(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                         for name in ShardLayout._fields))
+
+
+def open_shard_layout(snap: GraphSnapshot, n_shards: int) -> ShardLayout:
+    """The snapshot's layout for n_shards, built by the first run that asks for it and kept beside it."""
+    return derived_index(snap, f"shards-{n_shards}", load_shard_layout, lambda: build_shard_layout(snap, n_shards),
+                         save_shard_layout)
+
+
+@lru_cache(maxsize=8)
+def _layout(directory: str, n_shards: int) -> ShardLayout:
+    return load_shard_layout(os.path.join(directory, f"shards-{n_shards}"))
+
+
+def analysis_task(payload: Tuple) -> Any:
+    """
+    Worker-side handler for analyze_coordinated. Payloads name a snapshot directory, so
+    only shard ids travel over the pipes — the data is shared through the page cache.
+    Tasks read their rows through the snapshot's ShardLayout (written by the coordinator
+    before dispatch), so each touches only its own slice of the transactions.
+
+      ("shard", directory, n_shards, shard, smurf_episodes)
+          per-account detectors for the accounts the shard owns, plus the cycles that
+          stay inside the shard (search over the shard's induced subgraph)
+      ("boundary", directory, n_shards, part, n_parts)
+          cycles through at least one cross-shard edge, started from the sources of
+          cross-shard edges in this part; returned as vertex-code tuples
+    """
+    kind, directory, n_shards = payload[:3]
+    snap   = _snapshot(directory)
+    enc, csr = snap.transactions, snap.csr
+    layout = _layout(directory, n_shards)
+    owner  = layout.owner
+
+    if kind == "shard":
+        shard, smurf_episodes = payload[3:]
+        owned = owner == shard
+        touch = layout.txn_positions[layout.txn_offsets[shard]:layout.txn_offsets[shard + 1]]
+        sub   = EncodedTransactions(enc.src[touch], enc.dst[touch], enc.time[touch], enc.amount[touch],
+                                    enc.names, enc.rows[touch])
+        result = detect_shard_rings(sub, owned, smurf_episodes)
+        result["cycles"] = list(csr_cycles(csr.offsets, csr.targets, csr.out_count, csr.in_count,
+                                           CYCLE_MIN_LEN, CYCLE_MAX_LEN, within=owned))
+        return result
+
+    part, n_parts = payload[3:]
+    sources = layout.boundary_sources
+    starts  = np.zeros(len(owner), dtype=bool)
+    starts[sources[sources % n_parts == part]] = True
+
+    return [cycle for cycle in csr_cycles(csr.offsets, csr.targets, csr.out_count, csr.in_count,
+                                          CYCLE_MIN_LEN, CYCLE_MAX_LEN, starts=starts)
+            if len(set(owner[list(cycle)].tolist())) > 1]
+
+
+def _canonical(cycle: Tuple[int, ...]) -> Tuple[int, ...]:
+    pos = cycle.index(min(cycle))
+    return cycle[pos:] + cycle[:pos]
+
+
+def analyze_coordinated(coordinator: Coordinator, directory: str, n_shards: Optional[int] = None,
+                        smurf_episodes: bool = False) -> List[Dict]:
+    """
+    Sharded analysis of a snapshot on a Coordinator running analysis_task.
+
+    Accounts are hash-partitioned into n_shards (default: 2 per worker). A shard task runs
+    the per-account detectors for its accounts and finds the cycles that stay inside it.
+    Cycles that cross shards always use at least one boundary edge, so boundary tasks
+    start the DFS only from boundary-edge sources and keep cycles spanning more than one
+    shard. Boundary tasks may find the same cycle from different starts; duplicates are
+    dropped by canonical rotation. Rings equal the in-memory pipeline's.
+
+    Rows are bucketed by shard once per snapshot and shard count (open_shard_layout), so
+    total task work stays O(E) however many shards the run is cut into.
+    """
+    n_shards = n_shards or 2 * coordinator.n_workers
+    n_parts  = coordinator.n_workers
+    open_shard_layout(_snapshot(directory), n_shards)      # bucket the rows once, before any task reads them
+
+    payloads = ([("shard", directory, n_shards, shard, smurf_episodes) for shard in range(n_shards)] +
+                [("boundary", directory, n_shards, part, n_parts) for part in range(n_parts)])
+    results  = coordinator.run(payloads)
+    shard_results, boundary = results[:n_shards], results[n_shards:]
+
+    cycles, seen = [], set()
+    for cycle in [c for r in shard_results for c in r["cycles"]] + [c for b in boundary for c in b]:
+        key = _canonical(cycle)
+        if key not in seen:
+            seen.add(key)
+            cycles.append(cycle)
+
+    names = _snapshot(directory).transactions.names
+    return combine_shard_rings(cycle_rings(cycles, names), shard_results, names)
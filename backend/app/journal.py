@@ -0,0 +1,292 @@
+import asyncio
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+SAR_JOURNAL_DIR       = os.getenv("SAR_JOURNAL_DIR", "sar_journal")
+JOURNAL_FSYNC_SECONDS = float(os.getenv("SAR_JOURNAL_FSYNC_SECONDS", "1"))
+JOURNAL_SEGMENT_BYTES = int(os.getenv("SAR_JOURNAL_SEGMENT_MB", "64")) * 2**20
+JOURNAL_MAX_BATCH     = 512
+
+SEGMENT_NAME = re.compile(r"^submissions-(\d{6})\.jsonl$")
+
+
+class SubmissionJournal:
+    """
+    Append-only journal of SAR submissions: JSON lines in size-rotated segment files,
+    written by one background task.
+
+    append() queues a record and waits for the writer, which takes everything queued since
+    its last write as one batch: a single write() per batch, done in a worker thread so the
+    event loop never blocks on disk. The segment is fsynced at most every `fsync_interval`
+    seconds (group commit); 0 fsyncs every batch before acknowledging it. A crash can lose
+    at most the last interval — a torn final line is dropped when the journal is reopened.
+
+    An in-memory index maps ring_id to the (segment, offset, length) of each of its records,
+    so read() fetches a ring's submissions without scanning. Sealed segments keep their
+    index in a sidecar .idx file; only the active segment is re-scanned on open.
+
+    Every uvicorn worker opens the same directory. Writes, rotation and index catch-up
+    hold an exclusive flock on journal.lock (reads a shared one), and each instance
+    indexes the records other workers appended since it last looked before it writes or
+    reads — so a ring's submissions are found whichever worker took them, and a segment
+    is only sealed (its .idx written) once every record in it is indexed.
+    """
+
+    def __init__(self, directory: str = SAR_JOURNAL_DIR, fsync_interval: float = JOURNAL_FSYNC_SECONDS,
+                 segment_bytes: int = JOURNAL_SEGMENT_BYTES, max_batch: int = JOURNAL_MAX_BATCH):
+        self.directory      = directory
+        self.fsync_interval = fsync_interval
+        self.segment_bytes  = segment_bytes
+        self.max_batch      = max_batch
+        self.records        = 0
+        self.batches        = 0
+        self.fsyncs         = 0
+        self.index          = {}        # ring_id -> [(segment, offset, length)]
+        self._tail          = (1, 0)    # (segment, offset): every record before it is indexed
+        self._lock          = threading.Lock()
+        self._dirty         = False
+        self._last_sync     = time.monotonic()
+        self._loop          = None
+        self._queue         = None
+        self._writer        = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "journal.lock"), "a")
+        with self._locked():
+            segments     = self._segments()
+            self.segment = segments[-1] if segments else 1
+            for n in segments[:-1]:
+                self._load_sealed(n)
+            self._recover_active()
+            self._file = open(self._path(self.segment), "ab")
+
+    @contextmanager
+    def _locked(self, mode: int = fcntl.LOCK_EX) -> Iterator[None]:
+        """_lock within this process, plus the directory's flock across workers."""
+        with self._lock:
+            fcntl.flock(self._lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    # ---- segment files (under _locked) ----
+
+    def _path(self, segment: int, suffix: str = ".jsonl") -> str:
+        return os.path.join(self.directory, f"submissions-{segment:06d}{suffix}")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(m.group(1)) for m in map(SEGMENT_NAME.match, os.listdir(self.directory)) if m)
+
+    def _scan(self, segment: int, offset: int = 0) -> Tuple[List[Tuple[str, int, int]], int]:
+        """(ring_id, offset, length) of each complete record from `offset`, and the end of the last one."""
+        entries = []
+        with open(self._path(segment), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entries.append((json.loads(line)["ring_id"], offset, len(line)))
+                except (ValueError, KeyError):
+                    break
+                offset += len(line)
+        return entries, offset
+
+    def _add(self, segment: int, entries: List[Tuple[str, int, int]]):
+        for ring_id, offset, length in entries:
+            self.index.setdefault(ring_id, []).append((segment, offset, length))
+
+    def _load_sealed(self, segment: int):
+        idx_path = self._path(segment, ".idx")
+        if os.path.exists(idx_path):
+            with open(idx_path) as f:
+                entries = [tuple(entry) for entry in json.load(f)]
+        else:
+            entries, _ = self._scan(segment)
+            self._write_idx(segment, entries)
+        self._add(segment, entries)
+        self._tail = (segment + 1, 0)
+
+    def _recover_active(self):
+        path = self._path(self.segment)
+        self._tail = (self.segment, 0)
+        if not os.path.exists(path):
+            return
+        entries, end = self._scan(self.segment)
+        if end < os.path.getsize(path):
+            print(f"SAR journal: dropping a torn record at the end of {path}")
+            os.truncate(path, end)
+        self._add(self.segment, entries)
+        self._tail = (self.segment, end)
+
+    def _catch_up(self):
+        """Indexes the records other workers appended (and segments they rotated to) since the tail."""
+        segment, offset = self._tail
+        for n in self._segments():
+            if n < segment:
+                continue
+            entries, end = self._scan(n, offset if n == segment else 0)
+            self._add(n, entries)
+            self._tail = (n, end)
+        if self._tail[0] != self.segment:
+            # Another worker rotated: append to the segment it opened
+            reopen = not self._file.closed
+            self._file.close()
+            self.segment = self._tail[0]
+            if reopen:
+                self._file = open(self._path(self.segment), "ab")
+
+    def _write_idx(self, segment: int, entries: List[Tuple[str, int, int]]):
+        tmp = self._path(segment, ".idx.tmp")
+        with open(tmp, "w") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp, self._path(segment, ".idx"))
+
+    def _sync(self):
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._file.fileno())
+                self.fsyncs    += 1
+                self._dirty     = False
+            self._last_sync = time.monotonic()
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._write_idx(self.segment, [(ring_id, offset, length) for ring_id, entries in self.index.items()
+                                       for segment, offset, length in entries if segment == self.segment])
+        self.segment += 1
+        self._file    = open(self._path(self.segment), "ab")
+        self._tail    = (self.segment, 0)
+
+    def _write_batch(self, records: List[Dict[str, Any]]):
+        lines = [json.dumps(record, separators=(",", ":")).encode() + b"\n" for record in records]
+        with self._locked():
+            if self._file.closed:
+                self._file = open(self._path(self.segment), "ab")
+            self._catch_up()
+            if self._file.seek(0, os.SEEK_END) > self._tail[1]:
+                # A worker died mid-write: drop its torn record, as reopening the journal would
+                os.truncate(self._path(self.segment), self._tail[1])
+            start = 0
+            while start < len(lines):
+                # As many records as fit in the active segment (at least one, into a fresh segment);
+                # other workers may have appended since our last write, so the offset is the real end
+                offset = size = self._file.seek(0, os.SEEK_END)
+                end    = start
+                while end < len(lines) and (size + len(lines[end]) <= self.segment_bytes or size == 0):
+                    size += len(lines[end])
+                    end  += 1
+                if end == start:
+                    self._rotate()
+                    continue
+                self._file.write(b"".join(lines[start:end]))
+                for record, line in zip(records[start:end], lines[start:end]):
+                    self.index.setdefault(record["ring_id"], []).append((self.segment, offset, len(line)))
+                    offset += len(line)
+                start = end
+                self._file.flush()
+                self._tail = (self.segment, offset)
+            self.records += len(records)
+            self.batches += 1
+            self._dirty   = True
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+
+    # ---- event loop side ----
+
+    def _bind(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop   = loop
+            self._queue  = asyncio.Queue()
+            self._writer = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            try:
+                # While unsynced writes are pending, wake up in time to fsync them
+                timeout = max(0.0, self.fsync_interval - (time.monotonic() - self._last_sync)) if self._dirty else None
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._sync)
+                continue
+            batch = [item]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            stop  = any(entry is None for entry in batch)
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write_batch, [record for record, _ in batch])
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_result(None)
+                except Exception as e:
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_exception(e)
+            if stop:
+                return
+
+    async def append(self, record: Dict[str, Any]):
+        """Journals one submission (it must carry a ring_id) and returns once it is written."""
+        queue = self._bind()
+        done  = self._loop.create_future()
+        queue.put_nowait((record, done))
+        await done
+
+    async def aclose(self):
+        """Drains the queue, fsyncs and closes the active segment."""
+        if self._writer is not None and self._loop is asyncio.get_running_loop():
+            self._queue.put_nowait(None)
+            await self._writer
+        self._loop = self._queue = self._writer = None
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    # ---- readers (any thread) ----
+
+    def read(self, ring_id: str) -> List[Dict[str, Any]]:
+        """Every journaled submission for ring_id, oldest first — including other workers'."""
+        with self._locked(fcntl.LOCK_SH):
+            self._catch_up()
+            entries = list(self.index.get(ring_id, ()))
+        records, handles = [], {}
+        try:
+            for segment, offset, length in entries:
+                if segment not in handles:
+                    handles[segment] = open(self._path(segment), "rb")
+                f = handles[segment]
+                f.seek(offset)
+                records.append(json.loads(f.read(length)))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def render(self) -> str:
+        """Prometheus text lines for the journal counters."""
+        return "\n".join([
+            "# HELP mule_sar_journal_records_total SAR submissions journaled.",
+            "# TYPE mule_sar_journal_records_total counter",
+            f"mule_sar_journal_records_total {self.records}",
+            "# HELP mule_sar_journal_batches_total Batched writes to the SAR journal.",
+            "# TYPE mule_sar_journal_batches_total counter",
+            f"mule_sar_journal_batches_total {self.batches}",
+            "# HELP mule_sar_journal_fsyncs_total fsync calls on the SAR journal.",
+            "# TYPE mule_sar_journal_fsyncs_total counter",
+            f"mule_sar_journal_fsyncs_total {self.fsyncs}"
+        ]) + "\n"
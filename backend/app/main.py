@@ -1,17 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 import pandas as pd
-import igraph
+import asyncio
 import io
+import json
+import re
 import time
 import os
-from typing import Dict, List, Any, Optional
+import hashlib
+import heapq
+import shutil
+import tempfile
+import threading
+import numpy as np
+from typing import Dict, List, Any, Optional, Tuple
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from groq import Groq
-from app.algorithms.graph_dsa import find_cycles_dfs, detect_shells
-from app.algorithms.temporal_dsa import detect_smurfing
+from functools import partial
+from app.algorithms.graph_dsa import get_dynamic_outdegree_cap
+from app.algorithms.partition import run_partitioned, close_pools
+from app.algorithms.csr import csr_from_edges
+from app.algorithms.events import encode_transactions
+from app.pipeline import build_graph, detect_component_rings, detect_global_rings, detect_encoded_rings
+from app.scoring import score_rings, score_accounts, csr_ring_value
+from app.consolidation import consolidate_rings
+from app.out_of_core import analyze_out_of_core
+from app.snapshot import write_snapshot, open_snapshot, open_account_lookup, open_path_index, open_trace_index
+from app.algorithms.paths import find_paths
+from app.algorithms.trace import trace_funds
+from app.coordinator import Coordinator, analysis_task, analyze_coordinated
+from app.metrics import REGISTRY, begin_analysis, stage, record
+from app.profiling import PROFILER_LOCK, is_admin, profiled_call
+from app.admission import MemoryBudget, AdmissionRejected, Reservation, estimate_peak_bytes
+from app.sar import SARTimeout, default_generator
+from app.cases import CaseStore, CASE_DB
+from app.journal import SubmissionJournal
+from app.search import AnalysisStore
 
 # Load environment variables
 load_dotenv()
@@ -33,324 +58,761 @@ app.add_middleware(
 )
 
 
-# Initialize Groq Client
-groq_client = None
-api_key = os.getenv("GROQ_API_KEY")
-if api_key and "gsk_" in api_key:
-    try:
-        groq_client = Groq(api_key=api_key)
-        print("Groq Client Initialized Successfully")
-    except Exception as e:
-        print(f"Failed to initialize Groq client: {e}")
-else:
-    print("WARNING: GROQ_API_KEY not found or invalid in .env. AI features will be disabled or mocked.")
+# SAR generation: async Groq client (or the offline stub) with pooled connections and a concurrency limit
+sar_generator = default_generator()
+
+@app.on_event("shutdown")
+async def close_sar_client():
+    await sar_generator.aclose()
+
+# Submitted SARs: append-only JSON-lines journal, written in batches by a background task
+sar_journal = SubmissionJournal()
+
+@app.on_event("shutdown")
+async def close_sar_journal():
+    await sar_journal.aclose()
+
+# Graph snapshots written by /analyze?snapshot=true, keyed by a hash of the uploaded file
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "mule_snapshots"))
+SNAPSHOT_ID = re.compile(r"^[0-9a-f]{16}$")
+
+# Search indexes over each analysis' suspicious accounts, for /analyses/{analysis_id}/accounts
+analyses = AnalysisStore()
+ANALYSIS_ID = re.compile(r"^[0-9a-f]{16}$")
+
+# Worker pool for coordinated analysis — started on first use, reused across requests
+coordinator = None
+coordinator_lock = threading.Lock()
+
+def get_coordinator(workers: Optional[int]) -> Coordinator:
+    """
+    The shared worker pool. Its size is fixed by the first coordinated request: another
+    `workers` value gets a 409 instead of closing the pool under runs still in flight.
+    """
+    global coordinator
+    with coordinator_lock:
+        if coordinator is None:
+            coordinator = Coordinator(analysis_task, workers=workers or os.cpu_count() or 1)
+        elif workers and workers != coordinator.n_workers:
+            raise HTTPException(status_code=409,
+                                detail=f"The coordinated worker pool is already running {coordinator.n_workers} workers")
+        return coordinator
+
+@app.on_event("shutdown")
+def close_coordinator():
+    with coordinator_lock:
+        if coordinator is not None:
+            coordinator.close()
+
+@app.on_event("shutdown")
+def close_partition_pools():
+    close_pools()
+
+# Admission control: analyses reserve their estimated peak memory from this worker's budget
+BUDGET = MemoryBudget(wait_seconds=float(os.getenv("ADMISSION_WAIT_SECONDS", "30")))
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
+def upload_size(file: UploadFile) -> int:
+    """Size of the (already spooled) upload without reading it into memory."""
+    if file.size is not None:
+        return file.size
+    pos = file.file.tell()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(pos)
+    return size
+
+def memory_summary(reservation: Reservation, peak_rss: int) -> Dict:
+    return {
+        "estimated_peak_mb": round(reservation.estimate / 2**20, 2),
+        "reserved_mb": round(reservation.nbytes / 2**20, 2),
+        "measured_peak_rss_mb": round(peak_rss / 2**20, 1),
+        "budget_mb": round(BUDGET.capacity / 2**20, 1)
+    }
+
+def check_consolidate(threshold: Optional[float]):
+    if threshold is not None and not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="consolidate must be an overlap threshold in (0, 1]")
+
+def consolidated(rings: List[Dict], threshold: Optional[float]) -> Tuple[List[Dict], Optional[Dict]]:
+    """With ?consolidate=<threshold>, overlapping rings are merged into clusters before scoring."""
+    if threshold is None:
+        return rings, None
+    with stage("consolidation"):
+        clusters = consolidate_rings(rings, threshold)
+        record("rings_detected", len(rings))
+        record("ring_clusters", len(clusters))
+    return clusters, {"threshold": threshold, "rings": len(rings), "clusters": len(clusters)}
 
-# In-memory storage for flagged accounts (in real app, use DB)
-flagged_accounts = {} 
+# Analyst flags, persisted in SQLite (CASE_DB) and shared by every worker
+cases = CaseStore(CASE_DB)
 
 class FlagRequest(BaseModel):
     account_id: str
     status: str # "false_positive", "escalated", "review_pending"
     notes: Optional[str] = None
 
+class BulkFlagRequest(BaseModel):
+    flags: List[FlagRequest]
+
 class SARSubmission(BaseModel):
     ring_id: str
     report_content: Dict[str, Any]
     analyst_notes: Optional[str] = None
 
+class SARBatchRequest(BaseModel):
+    rings: List[Dict[str, Any]]
+    pack: int = 1   # rings per LLM prompt; >1 trades per-ring latency for fewer calls
+
 @app.get("/")
 def root():
     return {"message": "Money Mule Engine API running"}
 
+def graph_node(name: str, acc_data: Optional[Dict], inflow: Dict[str, float], outflow: Dict[str, float]) -> Dict:
+    """One graph_data node; acc_data is the account's entry in suspicious_accounts, if any."""
+    is_suspicious = acc_data is not None
+    score = acc_data["suspicion_score"] if is_suspicious else 0
+    
+    color = "#cccccc"
+    if score > 50: color = "#ef4444"
+    elif score > 0: color = "#f97316"
+    
+    # Override color if flagged as false positive
+    if acc_data and acc_data.get("status") == "false_positive":
+         color = "#10b981" # Green
+         score = 0
+        
+    return {
+        "id": name,
+        "val": 1 + (score / 20),
+        "color": color,
+        "suspicion_score": score,
+        "patterns": acc_data["detected_patterns"] if is_suspicious else [],
+        "ring": acc_data["ring_id"] if is_suspicious else "",
+        "inflow": round(inflow.get(name, 0.0), 2),
+        "outflow": round(outflow.get(name, 0.0), 2),
+        "status": acc_data.get("status") if is_suspicious else None
+    }
+
+def analyze_transactions_out_of_core(file: UploadFile, smurf_episodes: bool, memory_budget_mb: int,
+                                     start_time: float, reservation: Reservation,
+                                     consolidate: Optional[float] = None) -> Dict:
+    """
+    Disk-backed variant of /analyze for uploads larger than memory: the upload is spooled
+    to a scratch directory and analysed shard by shard (see app.out_of_core).
+    graph_data is restricted to suspicious accounts and the links among them — the full
+    graph would not fit in a browser at this scale anyway.
+    """
+    metrics = begin_analysis()
+
+    with tempfile.TemporaryDirectory(prefix="mule_ooc_") as work_dir:
+        csv_path = os.path.join(work_dir, "upload.csv")
+        with stage("spool"), open(csv_path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+
+        try:
+            result = analyze_out_of_core(csv_path, work_dir, memory_budget=memory_budget_mb * 2**20,
+                                         smurf_episodes=smurf_episodes)
+        except (ValueError, pd.errors.ParserError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid CSV: {str(e)}")
+
+        rings, consolidation = consolidated(result.rings, consolidate)
+        with stage("scoring"):
+            formatted_rings, account_ring_memberships = score_rings(rings, csr_ring_value(result.csr, result.names))
+
+            member_codes = result.names.get_indexer(list(account_ring_memberships))
+            inflow  = {str(result.names[c]): float(result.inflow[c]) for c in member_codes}
+            outflow = {str(result.names[c]): float(result.outflow[c]) for c in member_codes}
+
+            statuses = cases.statuses(account_ring_memberships)
+            final_accounts = score_accounts(account_ring_memberships, inflow, outflow, statuses)
+            record("rings_scored", len(rings))
+            record("accounts_scored", len(final_accounts))
+
+        with stage("search_index"):
+            analysis_id = analyses.save(final_accounts, formatted_rings)
+
+        with stage("visualization"):
+            vis_nodes = [graph_node(acc["account_id"], acc, inflow, outflow) for acc in final_accounts]
+            vis_edges = []
+            codes = np.sort(member_codes)
+            for v in codes.tolist():
+                lo, hi = result.csr.offsets[v], result.csr.offsets[v + 1]
+                targets = np.asarray(result.csr.targets[lo:hi])
+                inside  = np.isin(targets, codes)
+                for t, amount in zip(targets[inside].tolist(), np.asarray(result.csr.weights[lo:hi])[inside].tolist()):
+                    vis_edges.append({
+                        "source": str(result.names[v]),
+                        "target": str(result.names[t]),
+                        "amount": amount
+                    })
+            record("nodes", len(vis_nodes))
+            record("links", len(vis_edges))
+
+        stats = result.stats
+
+    processing_time = time.time() - start_time
+    REGISTRY.publish(metrics)
+
+    summary = {
+        "total_accounts_analyzed": stats["accounts"],
+        "suspicious_accounts_flagged": len(final_accounts),
+        "fraud_rings_detected": len(formatted_rings),
+        "processing_time_seconds": round(processing_time, 2),
+        "out_of_core": stats,
+        "analysis_id": analysis_id,
+        "stages": metrics.summary(),
+        "memory": memory_summary(reservation, metrics.peak_rss())
+    }
+    if consolidation:
+        summary["consolidation"] = consolidation
+
+    return {
+        "suspicious_accounts": final_accounts,
+        "fraud_rings": formatted_rings,
+        "summary": summary,
+        "graph_data": {
+            "nodes": vis_nodes,
+            "links": vis_edges
+        }
+    }
+
 @app.post("/analyze")
-async def analyze_transactions(file: UploadFile = File(...)):
+async def analyze_transactions(file: UploadFile = File(...), smurf_episodes: bool = False,
+                               partitioned: bool = False, workers: Optional[int] = None,
+                               out_of_core: bool = False, memory_budget_mb: int = 512,
+                               snapshot: bool = False, coordinated: bool = False,
+                               consolidate: Optional[float] = None,
+                               profile: bool = False, x_admin_token: Optional[str] = Header(None)):
+    check_consolidate(consolidate)
+    options = dict(smurf_episodes=smurf_episodes, partitioned=partitioned, workers=workers,
+                   out_of_core=out_of_core, memory_budget_mb=memory_budget_mb,
+                   snapshot=snapshot, coordinated=coordinated, consolidate=consolidate)
+    if not profile:
+        return await run_analysis(file, **options)
+
+    # Opt-in profiling (admin only): the same analysis under cProfile, hotspots in the summary
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+    # The profiler is enabled only in the analysis' worker thread, so only this request is profiled
+    if not PROFILER_LOCK.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Another profiled analysis is running; retry when it finishes")
+    try:
+        return await run_analysis(file, profile=True, **options)
+    finally:
+        PROFILER_LOCK.release()
+
+async def run_analysis(file: UploadFile, smurf_episodes: bool = False, partitioned: bool = False,
+                       workers: Optional[int] = None, out_of_core: bool = False, memory_budget_mb: int = 512,
+                       snapshot: bool = False, coordinated: bool = False, consolidate: Optional[float] = None,
+                       profile: bool = False) -> Dict:
+    """
+    Admits the analysis under the worker's memory budget (waiting or rejecting), then runs
+    it in a worker thread — the event loop keeps serving other requests, and other
+    analyses can be admitted or made to wait, while it runs.
+    """
+    estimate = estimate_peak_bytes(upload_size(file), out_of_core=out_of_core, memory_budget=memory_budget_mb * 2**20)
+    reservation = await BUDGET.acquire(estimate)
+    try:
+        if out_of_core:
+            job = partial(analyze_transactions_out_of_core, file, smurf_episodes, memory_budget_mb, time.time(),
+                          reservation, consolidate)
+        else:
+            job = partial(analyze_in_memory, file, reservation, smurf_episodes, partitioned, workers, snapshot,
+                          coordinated, consolidate)
+        if not profile:
+            return await asyncio.to_thread(job)
+        response, report = await asyncio.to_thread(profiled_call, "analyze", job)
+        response["summary"]["profile"] = report
+        return response
+    finally:
+        reservation.release()
+
+def analyze_in_memory(file: UploadFile, reservation: Reservation, smurf_episodes: bool, partitioned: bool,
+                      workers: Optional[int], snapshot: bool, coordinated: bool,
+                      consolidate: Optional[float] = None) -> Dict:
+    """The in-memory /analyze pipeline; blocking, so run_analysis calls it in a worker thread."""
     start_time = time.time()
     
+    metrics = begin_analysis()
+
     # 1. Parsing
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-        
-        required_cols = {'transaction_id', 'sender_id', 'receiver_id', 'amount', 'timestamp'}
-        if not required_cols.issubset(df.columns):
-            raise HTTPException(status_code=400, detail=f"Missing columns. Required: {required_cols}")
-        
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        with stage("parse"):
+            file.file.seek(0)
+            contents = file.file.read()
+            df = pd.read_csv(io.BytesIO(contents))
+            
+            required_cols = {'transaction_id', 'sender_id', 'receiver_id', 'amount', 'timestamp'}
+            if not required_cols.issubset(df.columns):
+                raise HTTPException(status_code=400, detail=f"Missing columns. Required: {required_cols}")
+            
+            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            record("rows", len(df))
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid CSV: {str(e)}")
 
+    # Real row count known: re-base the reservation on it (outside the parse handler, so a
+    # budget rejection keeps its 429/503 instead of reading as a bad CSV)
+    reservation.resize(estimate_peak_bytes(len(contents), rows=len(df)))
+
     # 1b. Pre-calculate Account Stats
-    inflow = df.groupby('receiver_id')['amount'].sum().to_dict()
-    outflow = df.groupby('sender_id')['amount'].sum().to_dict()
+    with stage("account_stats"):
+        inflow = df.groupby(df['receiver_id'].astype(str))['amount'].sum().to_dict()
+        outflow = df.groupby(df['sender_id'].astype(str))['amount'].sum().to_dict()
 
     # 2. Graph Construction
-    edges = list(zip(df['sender_id'].astype(str), df['receiver_id'].astype(str), df['amount']))
-    graph = igraph.Graph.TupleList(edges, directed=True, edge_attrs="amount")
-    all_accounts = graph.vs["name"]
+    with stage("graph_build"):
+        graph = build_graph(df)
+        all_accounts = graph.vs["name"]
+        
+        enc = encode_transactions(df)
+        csr = csr_from_edges(enc.src, enc.dst, enc.amount, len(enc.names))
+        record("vertices", graph.vcount())
+        record("edges", graph.ecount())
+
+    # Snapshot (optional, required by coordinated mode) so the dataset can be
+    # re-examined — and shared with worker processes — without re-parsing
+    snapshot_id = None
+    if snapshot or coordinated:
+        with stage("snapshot"):
+            snapshot_id = hashlib.sha256(contents).hexdigest()[:16]
+            write_snapshot(os.path.join(SNAPSHOT_DIR, snapshot_id), enc, csr)
     
-    # 3. Execution (Sequential)
+    # 3. Execution
     rings = []
     suspicious_accounts = {} 
     
-    # Algorithms
-    cycles = find_cycles_dfs(graph, min_len=3, max_len=5)
-    rings.extend(cycles)
-    
-    smurfs = detect_smurfing(df, window_hours=72, count_threshold=10)
-    rings.extend(smurfs)
-    
-    shells = detect_shells(graph, min_hops=3)
-    rings.extend(shells)
-    
-    # 4. Scoring & Formatting
-    # 4. Dynamic Scoring & Formatting
-    formatted_rings = []
-    seen_ring_ids = set()
+    # Algorithms — partitioned mode fans weak components out to a process pool;
+    # the cycle cap is still derived from the full graph so results are identical.
+    # Coordinated mode hands account shards of the snapshot to the worker pool.
+    # Per-detector stages are recorded in this process only; worker pools report one stage.
+    if coordinated:
+        with stage("coordinated_detection"):
+            rings.extend(analyze_coordinated(get_coordinator(workers), os.path.join(SNAPSHOT_DIR, snapshot_id),
+                                             smurf_episodes=smurf_episodes))
+    elif partitioned:
+        with stage("partitioned_detection"):
+            detect = partial(detect_component_rings, cycle_cap=get_dynamic_outdegree_cap(graph),
+                             smurf_episodes=smurf_episodes)
+            rings.extend(run_partitioned(df, detect, max_workers=workers))
+        rings.extend(detect_global_rings(df, enc))
+    else:
+        rings.extend(detect_component_rings(df, graph, smurf_episodes=smurf_episodes, enc=enc))
+        rings.extend(detect_global_rings(df, enc))
     
-    # Track account memberships for Kingpin detection (Rule 4)
-    # { account_id: { "rings": [], "patterns": set(), "max_ring_score": 0.0 } }
-    account_ring_memberships = {} 
+    # 4. Dynamic Scoring & Formatting (optionally of ring clusters)
+    rings, consolidation = consolidated(rings, consolidate)
+    with stage("scoring"):
+        formatted_rings, account_ring_memberships = score_rings(rings, csr_ring_value(csr, enc.names))
 
-    for ring in rings:
-        rtype = ring["type"]
-        members = ring['members']
-        
-        # --- Rule 1: Base Pattern Weights ---
-        base_score = 0.0
-        if "Smurfing" in rtype or "Fan" in rtype: 
-            base_score = 70.0
-        elif "Cycle" in rtype: 
-            base_score = 65.0
-        elif "Layered" in rtype or "Shell" in rtype: 
-            base_score = 55.0
-        else: 
-            base_score = 50.0 # Fallback
-
-        # --- Calculate Ring Volume & ID ---
-        sorted_members = sorted([str(m) for m in members])
-        ring_members_set = set(sorted_members)
-        ring_val = 0.0
-        try:
-            v_indices = [graph.vs.find(name=str(m)).index for m in ring_members_set if str(m) in all_accounts]
-            if v_indices:
-                subgraph_edges = graph.es.select(_source_in=v_indices, _target_in=v_indices)
-                ring_val = sum(e["amount"] for e in subgraph_edges)
-        except Exception:
-            ring_val = 0.0
-
-        # --- Rule 2: Financial Volume Multiplier ---
-        vol_score = 0.0
-        if ring_val > 50000: vol_score = 15.0
-        elif ring_val > 20000: vol_score = 10.0
-        elif ring_val > 5000: vol_score = 5.0
-        
-        # --- Rule 3: Network Complexity Multiplier ---
-        node_count = len(members)
-        node_score = 0.0
-        if node_count >= 10: node_score = 10.0
-        elif node_count >= 5: node_score = 5.0
-        
-        # --- Total Ring Score (Rule 5: Cap at 99.5) ---
-        total_ring_score = min(99.5, base_score + vol_score + node_score)
-        
-        # ID Generation & Deduplication
-        members_str = ",".join(sorted_members)
-        ring_hash = abs(hash(members_str + rtype)) % 100000
-        ring_id = f"RING_{ring_hash:05d}"
-        
-        if ring_id in seen_ring_ids:
-            continue
-        seen_ring_ids.add(ring_id)
-        
-        formatted_rings.append({
-            "ring_id": ring_id,
-            "member_accounts": sorted_members,
-            "pattern_type": rtype,
-            "risk_score": round(total_ring_score, 1),
-            "total_value": round(ring_val, 2)
-        })
-
-        # Update Account Memberships for Kingpin Logic
-        for member in sorted_members:
-            if member not in account_ring_memberships:
-                account_ring_memberships[member] = {
-                    "rings": [],
-                    "patterns": set(),
-                    "max_ring_score": 0.0
-                }
-            account_ring_memberships[member]["rings"].append(ring_id)
-            account_ring_memberships[member]["patterns"].add(rtype)
-            account_ring_memberships[member]["max_ring_score"] = max(account_ring_memberships[member]["max_ring_score"], total_ring_score)
-
-    # Finalize Accounts
-    final_accounts = []
-    # Finalize Accounts with dynamic scoring
-    final_accounts = []
-    for acc_id, data in account_ring_memberships.items():
-        # Base Score is the MAX risk of any ring they are part of (not sum)
-        base_suspicion = data["max_ring_score"]
-        
-        # --- Rule 4: Kingpin Overlap Multiplier ---
-        # If in > 1 unique ring, add 20.0
-        overlap_bonus = 0.0
-        if len(set(data["rings"])) > 1:
-            overlap_bonus = 20.0
-            
-        # Final Score Cap (Rule 5)
-        final_score = min(99.5, base_suspicion + overlap_bonus)
-        
-        acc = {
-            "account_id": acc_id,
-            "suspicion_score": round(final_score, 1),
-            "detected_patterns": list(data["patterns"]),
-            "ring_id": list(data["rings"])[0] if data["rings"] else None
-        }
-        
-        acc["total_inflow"] = round(inflow.get(acc_id, 0.0) if isinstance(acc_id, str) else inflow.get(int(acc_id), 0.0), 2)
-        acc["total_outflow"] = round(outflow.get(acc_id, 0.0) if isinstance(acc_id, str) else outflow.get(int(acc_id), 0.0), 2)
-        acc["net_balance"] = round(acc["total_inflow"] - acc["total_outflow"], 2)
-        
-        # Inject status if flagged
-        if acc_id in flagged_accounts:
-            acc["status"] = flagged_accounts[acc_id]["status"]
+        statuses = cases.statuses(account_ring_memberships)
+        final_accounts = score_accounts(account_ring_memberships, inflow, outflow, statuses)
+        record("rings_scored", len(rings))
+        record("accounts_scored", len(final_accounts))
 
-        final_accounts.append(acc)
-    
-    final_accounts.sort(key=lambda x: x["suspicion_score"], reverse=True)
+    with stage("search_index"):
+        analysis_id = analyses.save(final_accounts, formatted_rings)
     
     # 5. Graph Data
-    vis_nodes = []
-    sus_map = {acc['account_id']: acc for acc in final_accounts}
-    
-    for v in graph.vs:
-        name = v["name"]
-        acc_data = sus_map.get(name)
-        is_suspicious = acc_data is not None
-        score = acc_data["suspicion_score"] if is_suspicious else 0
-        
-        color = "#cccccc"
-        if score > 50: color = "#ef4444"
-        elif score > 0: color = "#f97316"
+    with stage("visualization"):
+        vis_nodes = []
+        sus_map = {acc['account_id']: acc for acc in final_accounts}
         
-        # Override color if flagged as false positive
-        if acc_data and acc_data.get("status") == "false_positive":
-             color = "#10b981" # Green
-             score = 0
+        for v in graph.vs:
+            name = v["name"]
+            vis_nodes.append(graph_node(name, sus_map.get(name), inflow, outflow))
             
-        vis_nodes.append({
-            "id": name,
-            "val": 1 + (score / 20),
-            "color": color,
-            "suspicion_score": score,
-            "patterns": acc_data["detected_patterns"] if is_suspicious else [],
-            "ring": acc_data["ring_id"] if is_suspicious else "",
-            "inflow": round(inflow.get(name, 0.0), 2),
-            "outflow": round(outflow.get(name, 0.0), 2),
-            "status": acc_data.get("status") if is_suspicious else None
-        })
-        
-    vis_edges = []
-    for e in graph.es:
-        src = graph.vs[e.source]["name"]
-        tgt = graph.vs[e.target]["name"]
-        vis_edges.append({
-            "source": src,
-            "target": tgt,
-            "amount": e["amount"]
-        })
+        vis_edges = []
+        for e in graph.es:
+            src = graph.vs[e.source]["name"]
+            tgt = graph.vs[e.target]["name"]
+            vis_edges.append({
+                "source": src,
+                "target": tgt,
+                "amount": e["amount"]
+            })
+        record("nodes", len(vis_nodes))
+        record("links", len(vis_edges))
 
     processing_time = time.time() - start_time
+    REGISTRY.publish(metrics)
+
+    summary = {
+        "total_accounts_analyzed": len(all_accounts),
+        "suspicious_accounts_flagged": len(final_accounts),
+        "fraud_rings_detected": len(formatted_rings),
+        "processing_time_seconds": round(processing_time, 2),
+        "analysis_id": analysis_id,
+        "stages": metrics.summary(),
+        "memory": memory_summary(reservation, metrics.peak_rss())
+    }
+    if snapshot_id:
+        summary["snapshot_id"] = snapshot_id
+    if consolidation:
+        summary["consolidation"] = consolidation
     
     return {
         "suspicious_accounts": final_accounts,
         "fraud_rings": formatted_rings,
-        "summary": {
-            "total_accounts_analyzed": len(all_accounts),
-            "suspicious_accounts_flagged": len(final_accounts),
-            "fraud_rings_detected": len(formatted_rings),
-            "processing_time_seconds": round(processing_time, 2)
-        },
+        "summary": summary,
         "graph_data": {
             "nodes": vis_nodes,
             "links": vis_edges 
         }
     }
 
-@app.post("/generate-sar")
-async def generate_sar(ring: Dict[str, Any] = Body(...)):
+@app.post("/snapshots/{snapshot_id}/analyze")
+def analyze_snapshot(snapshot_id: str, smurf_episodes: bool = False, workers: Optional[int] = None,
+                     consolidate: Optional[float] = None):
     """
-    Generates a Suspicious Activity Report (SAR) using Groq based on ring data.
+    Re-runs the analysis on a stored snapshot. The graph is memory-mapped straight from
+    disk (no CSV parse, no igraph build) and the detectors run on it directly — or,
+    when workers is given, sharded across the coordinator's worker processes.
+    """
+    check_consolidate(consolidate)
+    start_time = time.time()
+    metrics = begin_analysis()
+
+    directory = os.path.join(SNAPSHOT_DIR, snapshot_id)
+    if not SNAPSHOT_ID.match(snapshot_id) or not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    with open(os.path.join(directory, "meta.json")) as f:
+        n_rows = json.load(f)["transactions"]
+    # Arrays are memory-mapped; the peak is the scoring and response build
+    reservation = BUDGET.acquire_blocking(estimate_peak_bytes(0, rows=n_rows))
+    try:
+        return analyze_snapshot_admitted(snapshot_id, directory, smurf_episodes, workers, metrics, start_time, reservation,
+                                         consolidate)
+    finally:
+        reservation.release()
+
+@app.get("/snapshots/{snapshot_id}/paths")
+def snapshot_paths(snapshot_id: str, source: str, target: str, max_hops: int = 4, time_ordered: bool = False,
+                   min_amount: float = 0.0, max_paths: int = 100, timeout_ms: int = 1000):
     """
-    if not groq_client:
-        time.sleep(2)
-        return {
-            "executive_summary": "Simulated AI Response: Groq API Key is missing. This is a placeholder summary indicating that a suspicious ring was detected with circular flow characteristics.",
-            "mule_herder": ring['member_accounts'][0] if ring.get('member_accounts') else "Unknown"
+    How did money get from `source` to `target`? Every simple path of at most max_hops
+    transfers in a stored snapshot, optionally with time-ordered hops and a minimum amount
+    per hop. Bounded by max_paths and timeout_ms; `truncated` says when either cut it short.
+    shortest_hops ignores time ordering, so with time_ordered it is a lower bound.
+    """
+    if not 1 <= max_hops <= 8 or not 1 <= max_paths <= 1000 or not 1 <= timeout_ms <= 10000:
+        raise HTTPException(status_code=400, detail="max_hops must be 1-8, max_paths 1-1000 and timeout_ms 1-10000")
+    directory = os.path.join(SNAPSHOT_DIR, snapshot_id)
+    if not SNAPSHOT_ID.match(snapshot_id) or not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+    started = time.perf_counter()
+    snap    = open_snapshot(directory)
+    lookup  = open_account_lookup(snap)
+    codes   = {name: lookup.code(name) for name in (source, target)}
+    missing = [name for name, code in codes.items() if code is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown account: {missing[0]}")
+
+    found = find_paths(open_path_index(snap), codes[source], codes[target], max_hops, time_ordered, min_amount, max_paths,
+                       timeout_ms / 1000)
+    names = snap.transactions.names
+    paths = []
+    for p in found["paths"]:
+        accounts = [str(names[v]) for v in p["accounts"]]
+        paths.append({
+            "accounts": accounts,
+            "hops": [{"from": a, "to": b, "amount": round(h["amount"], 2), "transactions": h["transactions"],
+                      "first_timestamp": pd.Timestamp(h["time"]).isoformat(), "first_transaction_row": h["row"]}
+                     for a, b, h in zip(accounts, accounts[1:], p["hops"])]
+        })
+    return {
+        "source": source,
+        "target": target,
+        "max_hops": max_hops,
+        "shortest_hops": found["shortest_hops"],
+        "paths": paths,
+        "truncated": found["truncated"],
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+@app.get("/snapshots/{snapshot_id}/trace")
+def snapshot_trace(snapshot_id: str, account: str, direction: str = "forward", days: float = 7.0,
+                   start: Optional[str] = None, amount: Optional[float] = None, max_hops: int = 6,
+                   min_amount: float = 0.0, limit: int = 100, timeout_ms: int = 2000):
+    """
+    Follow the money: where could `amount` of `account`'s funds have gone within `days`
+    (direction=forward), or where could the money it received have come from (backward)?
+    Funds move through time-respecting transfers and are conserved: each account reports
+    what it received of them and what it still held at the end of the window.
+    """
+    if direction not in ("forward", "backward"):
+        raise HTTPException(status_code=400, detail="direction must be forward or backward")
+    if not 0 < days <= 366 or not 1 <= max_hops <= 12 or not 1 <= limit <= 1000 or not 1 <= timeout_ms <= 10000:
+        raise HTTPException(status_code=400,
+                            detail="days must be 0-366, max_hops 1-12, limit 1-1000 and timeout_ms 1-10000")
+    if amount is not None and amount <= 0:
+        raise HTTPException(status_code=400, detail="amount must be positive")
+    start_ns = None
+    if start is not None:
+        try:
+            stamp = pd.Timestamp(start)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid start timestamp: {start}")
+        start_ns = (stamp.tz_convert(None) if stamp.tzinfo else stamp).as_unit("ns").value
+    directory = os.path.join(SNAPSHOT_DIR, snapshot_id)
+    if not SNAPSHOT_ID.match(snapshot_id) or not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+    started = time.perf_counter()
+    snap    = open_snapshot(directory)
+    seed    = open_account_lookup(snap).code(account)
+    if seed is None:
+        raise HTTPException(status_code=404, detail=f"Unknown account: {account}")
+
+    traced = trace_funds(open_trace_index(snap), snap.transactions, seed, direction == "backward",
+                         int(days * 86_400 * 10**9), start_ns, amount, max_hops, min_amount, timeout_ms / 1000)
+    names = snap.transactions.names
+    top   = heapq.nlargest(limit, traced["accounts"].items(), key=lambda item: item[1]["received"])
+    return {
+        "account": account,
+        "direction": direction,
+        "window": {"start": pd.Timestamp(traced["window"][0]).isoformat(),
+                   "end": pd.Timestamp(traced["window"][1]).isoformat()} if traced["window"] else None,
+        "amount": round(traced["amount"], 2),
+        "held_by_account": round(traced["held_by_seed"], 2),
+        "accounts_reached": len(traced["accounts"]),
+        "transfers": traced["transfers"],
+        "accounts": [{"account_id": str(names[v]), "received": round(d["received"], 2), "held": round(d["held"], 2),
+                      "hops": d["hops"], "first_reached": pd.Timestamp(d["first_time"]).isoformat()}
+                     for v, d in top],
+        "truncated": traced["truncated"],
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+def analyze_snapshot_admitted(snapshot_id: str, directory: str, smurf_episodes: bool, workers: Optional[int],
+                              metrics, start_time: float, reservation: Reservation,
+                              consolidate: Optional[float] = None) -> Dict:
+    with stage("snapshot_open"):
+        snap = open_snapshot(directory)
+        enc  = snap.transactions
+        record("rows", len(enc.src))
+        record("vertices", len(enc.names))
+        record("csr_edges", snap.csr.n_edges)
+
+    if workers:
+        with stage("coordinated_detection"):
+            rings = analyze_coordinated(get_coordinator(workers), directory, smurf_episodes=smurf_episodes)
+    else:
+        rings = detect_encoded_rings(enc, snap.csr, smurf_episodes=smurf_episodes)
+    rings, consolidation = consolidated(rings, consolidate)
+
+    with stage("scoring"):
+        all_accounts = enc.names.tolist()
+        inflow  = dict(zip(all_accounts, np.bincount(enc.dst, weights=enc.amount, minlength=len(all_accounts)).tolist()))
+        outflow = dict(zip(all_accounts, np.bincount(enc.src, weights=enc.amount, minlength=len(all_accounts)).tolist()))
+
+        formatted_rings, account_ring_memberships = score_rings(rings, csr_ring_value(snap.csr, snap.name_index()))
+
+        statuses = cases.statuses(account_ring_memberships)
+        final_accounts = score_accounts(account_ring_memberships, inflow, outflow, statuses)
+        record("rings_scored", len(rings))
+        record("accounts_scored", len(final_accounts))
+
+    with stage("search_index"):
+        analysis_id = analyses.save(final_accounts, formatted_rings)
+
+    with stage("visualization"):
+        sus_map   = {acc['account_id']: acc for acc in final_accounts}
+        vis_nodes = [graph_node(name, sus_map.get(name), inflow, outflow) for name in all_accounts]
+        vis_edges = [{
+            "source": all_accounts[s],
+            "target": all_accounts[t],
+            "amount": amount
+        } for s, t, amount in zip(enc.src.tolist(), enc.dst.tolist(), enc.amount.tolist())]
+        record("nodes", len(vis_nodes))
+        record("links", len(vis_edges))
+
+    processing_time = time.time() - start_time
+    REGISTRY.publish(metrics)
+
+    summary = {
+        "total_accounts_analyzed": len(all_accounts),
+        "suspicious_accounts_flagged": len(final_accounts),
+        "fraud_rings_detected": len(formatted_rings),
+        "processing_time_seconds": round(processing_time, 2),
+        "snapshot_id": snapshot_id,
+        "analysis_id": analysis_id,
+        "stages": metrics.summary(),
+        "memory": memory_summary(reservation, metrics.peak_rss())
+    }
+    if consolidation:
+        summary["consolidation"] = consolidation
+
+    return {
+        "suspicious_accounts": final_accounts,
+        "fraud_rings": formatted_rings,
+        "summary": summary,
+        "graph_data": {
+            "nodes": vis_nodes,
+            "links": vis_edges
         }
+    }
 
-    prompt = f"""
-    You are an expert Financial Forensics Analyst for FinCEN.
-    Analyze the following Fraud Ring data and generate a professional Suspicious Activity Report (SAR) snippet.
-    
-    Ring ID: {ring.get('ring_id')}
-    Pattern Type: {ring.get('pattern_type')}
-    Risk Score: {ring.get('risk_score')}/100
-    Total Volume: ${ring.get('total_value', 0)}
-    Member Accounts: {', '.join(ring.get('member_accounts', []))}
-    
-    Output strictly in JSON format with two keys:
-    1. "executive_summary": A professional, 3-sentence summary of the suspicious activity, mentioning the typology (e.g. smurfing, cycle) and financial impact. Use "We have detected..." style.
-    2. "mule_herder": Identify the likely central actor (account ID) and briefly explain why (e.g. "Account X initiated the flow"). If unsure, pick the first account.
+@app.get("/analyses/{analysis_id}/accounts")
+def search_accounts(analysis_id: str, q: str = "", match: str = "prefix", pattern: Optional[str] = None,
+                    min_score: Optional[float] = None, max_score: Optional[float] = None,
+                    sort: str = "score", offset: int = 0, limit: int = 50):
+    """
+    Searches a stored analysis' suspicious accounts: `q` by account ID prefix (or substring
+    with match=substring), filtered by pattern type and score range, one page at a time.
     """
+    if match not in ("prefix", "substring") or sort not in ("score", "account_id"):
+        raise HTTPException(status_code=400, detail="match must be prefix|substring and sort score|account_id")
+    if offset < 0 or not 0 < limit <= 1000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000")
+    if not ANALYSIS_ID.match(analysis_id):
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    try:
+        index = analyses.open(analysis_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Analysis not found (or no longer stored)")
 
+    started = time.perf_counter()
+    total, accounts = index.search(q, match, pattern, min_score, max_score, sort, offset, limit)
+    # Statuses are read live, so flags set after the analysis show up
+    statuses = cases.statuses(acc["account_id"] for acc in accounts)
+    for acc in accounts:
+        if acc["account_id"] in statuses:
+            acc["status"] = statuses[acc["account_id"]]
+    return {
+        "analysis_id": analysis_id,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "accounts": accounts,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+def stored_rings(analysis_id: str):
+    if not ANALYSIS_ID.match(analysis_id):
+        raise HTTPException(status_code=404, detail="Analysis not found")
     try:
-        completion = groq_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a specialized financial crime detection AI. Output strictly valid JSON."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="llama-3.1-8b-instant",
-            temperature=0.2,
-            max_tokens=300,
-            response_format={"type": "json_object"}
-        )
-        
-        response_content = completion.choices[0].message.content
-        import json
-        return json.loads(response_content)
+        return analyses.rings(analysis_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Analysis not found (or no longer stored)")
 
+@app.get("/analyses/{analysis_id}/accounts/{account_id}/rings")
+def account_rings(analysis_id: str, account_id: str):
+    """Every ring an account belongs to in a stored analysis, highest risk first."""
+    rings = stored_rings(analysis_id).rings_of(account_id)
+    if rings is None:
+        raise HTTPException(status_code=404, detail="Account is not in any ring")
+    return {"account_id": account_id, "ring_count": len(rings), "rings": rings}
+
+@app.get("/analyses/{analysis_id}/rings/{ring_a}/shared/{ring_b}")
+def shared_ring_accounts(analysis_id: str, ring_a: str, ring_b: str):
+    """Accounts that belong to both rings."""
+    shared = stored_rings(analysis_id).shared_accounts(ring_a, ring_b)
+    if shared is None:
+        raise HTTPException(status_code=404, detail="Ring not found")
+    return {"ring_a": ring_a, "ring_b": ring_b, "shared_accounts": shared}
+
+@app.get("/analyses/{analysis_id}/overlap")
+def ring_overlap(analysis_id: str, k: int = 10):
+    """The k accounts that belong to the most rings (Kingpin candidates)."""
+    if not 0 < k <= 1000:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 1000")
+    return {"analysis_id": analysis_id, "accounts": stored_rings(analysis_id).top_overlap(k)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Stage timings and item counts over all analyses, in Prometheus text exposition format."""
+    return PlainTextResponse(REGISTRY.render() + BUDGET.render() + sar_journal.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/generate-sar")
+async def generate_sar(ring: Dict[str, Any] = Body(...)):
+    """
+    Generates a Suspicious Activity Report (SAR) using Groq based on ring data.
+    The call is awaited on the async client, so other requests keep being served; at most
+    SAR_MAX_CONCURRENCY completions run at once and each is cut off after SAR_TIMEOUT_SECONDS.
+    Reports are cached by ring content (SAR_CACHE_SIZE entries, SAR_CACHE_TTL_SECONDS).
+    """
+    try:
+        return await sar_generator.generate(ring)
+    except SARTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Groq API Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-sar/batch")
+async def generate_sar_batch(req: SARBatchRequest):
+    """
+    Generates SARs for many rings at once, streamed as NDJSON: one line per input ring as its
+    report is ready (cached reports first), then a {"done": true} summary line. Identical
+    rings (same ring_key) are generated once; with `pack` > 1 several rings share a prompt.
+    """
+    async def lines():
+        start  = time.time()
+        counts = {"rings": len(req.rings), "unique": 0, "cached": 0, "generated": 0, "failed": 0}
+        async for indexes, key, report, error, cached in sar_generator.generate_batch(req.rings, req.pack):
+            counts["unique"] += 1
+            counts["failed" if error else "cached" if cached else "generated"] += 1
+            for i in indexes:
+                line = {"index": i, "key": key, "ring_id": req.rings[i].get("ring_id"), "cached": cached}
+                line.update({"error": error} if error else {"report": report})
+                yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, **counts, "seconds": round(time.time() - start, 2)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.post("/flag-account")
 async def flag_account(req: FlagRequest):
     print(f"Flagging account {req.account_id} as {req.status}")
-    flagged_accounts[req.account_id] = {
-        "status": req.status,
-        "notes": req.notes,
-        "timestamp": time.time()
-    }
+    await asyncio.to_thread(cases.flag, req.account_id, req.status, req.notes)
     return {"message": "Account status updated", "account_id": req.account_id, "status": req.status}
 
+@app.post("/flag-accounts")
+async def flag_accounts(req: BulkFlagRequest):
+    """Flags many accounts in one transaction."""
+    print(f"Flagging {len(req.flags)} accounts")
+    await asyncio.to_thread(cases.flag_many, [(f.account_id, f.status, f.notes) for f in req.flags])
+    return {"message": "Account statuses updated", "updated": len(req.flags)}
+
+@app.get("/flag-account/{account_id}")
+async def get_flag(account_id: str):
+    flag = await asyncio.to_thread(cases.get, account_id)
+    if flag is None:
+        raise HTTPException(status_code=404, detail="Account is not flagged")
+    return {"account_id": account_id, **flag}
+
 @app.post("/submit-sar")
 async def submit_sar(req: SARSubmission):
     print(f"Submitting SAR for Ring {req.ring_id}")
     # Simulate external API call
-    time.sleep(1)
-    
-    # Log to disk for verification?
-    with open("sar_submissions.log", "a") as f:
-        f.write(f"[{time.ctime()}] SUBMISSION: Ring {req.ring_id} - {req.report_content}\n")
+    await asyncio.sleep(1)
+    reference_id = f"SAR-{int(time.time())}"
+
+    # Journal the submission (batched with concurrent ones, written off the event loop)
+    await sar_journal.append({
+        "ring_id": req.ring_id,
+        "reference_id": reference_id,
+        "submitted_at": time.time(),
+        "report_content": req.report_content,
+        "analyst_notes": req.analyst_notes
+    })
         
-    return {"message": "SAR Submitted to FinCEN", "reference_id": f"SAR-{int(time.time())}"}
+    return {"message": "SAR Submitted to FinCEN", "reference_id": reference_id}
+
+@app.get("/sar-submissions/{ring_id}")
+async def sar_submissions(ring_id: str):
+    """Every journaled SAR submission for a ring, oldest first."""
+    submissions = await asyncio.to_thread(sar_journal.read, ring_id)
+    if not submissions:
+        raise HTTPException(status_code=404, detail="No submissions for this ring")
+    return {"ring_id": ring_id, "submissions": submissions}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+import json
+import os
+from typing import Dict, List, Optional
+import numpy as np
+
+MEMBERSHIP_VERSION = 1
+
+COLUMNS = ("accounts", "acc_offsets", "acc_rings", "by_overlap",
+           "ring_ids", "pattern_type", "risk_score", "total_value", "ring_offsets", "ring_members")
+
+
+class RingIndex:
+    """
+    Account <-> ring membership of one analysis as two CSR indexes over sorted ID arrays:
+    acc_offsets / acc_rings give each account's ring positions, ring_offsets / ring_members
+    each ring's account positions, both ascending. An account or ring is found by binary
+    search over `accounts` / `ring_ids`, so every lookup costs O(log n + answer size).
+    by_overlap lists accounts by descending ring count (then ID) — top-k is a slice.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+
+    @staticmethod
+    def _find(sorted_ids: np.ndarray, key: str) -> Optional[int]:
+        pos = int(np.searchsorted(sorted_ids, key))
+        return pos if pos < len(sorted_ids) and sorted_ids[pos] == key else None
+
+    def _ring(self, r: int) -> Dict:
+        a = self.arrays
+        return {
+            "ring_id": str(a["ring_ids"][r]),
+            "pattern_type": str(a["pattern_type"][r]),
+            "risk_score": float(a["risk_score"][r]),
+            "total_value": float(a["total_value"][r]),
+            "member_count": int(a["ring_offsets"][r + 1] - a["ring_offsets"][r])
+        }
+
+    def _ring_positions(self, v: int) -> np.ndarray:
+        a = self.arrays
+        return np.asarray(a["acc_rings"][a["acc_offsets"][v]:a["acc_offsets"][v + 1]])
+
+    def _members(self, r: int) -> np.ndarray:
+        a = self.arrays
+        return np.asarray(a["ring_members"][a["ring_offsets"][r]:a["ring_offsets"][r + 1]])
+
+    def rings_of(self, account_id: str) -> Optional[List[Dict]]:
+        """Every ring the account belongs to, highest risk first; None if it is in no ring."""
+        v = self._find(self.arrays["accounts"], account_id)
+        if v is None:
+            return None
+        rings = [self._ring(r) for r in self._ring_positions(v).tolist()]
+        return sorted(rings, key=lambda ring: -ring["risk_score"])
+
+    def shared_accounts(self, ring_a: str, ring_b: str) -> Optional[List[str]]:
+        """Accounts in both rings (sorted); None if either ring is unknown."""
+        ra, rb = self._find(self.arrays["ring_ids"], ring_a), self._find(self.arrays["ring_ids"], ring_b)
+        if ra is None or rb is None:
+            return None
+        shared = np.intersect1d(self._members(ra), self._members(rb), assume_unique=True)
+        return [str(name) for name in self.arrays["accounts"][shared]]
+
+    def top_overlap(self, k: int) -> List[Dict]:
+        """The k accounts in the most rings, with their ring IDs."""
+        a = self.arrays
+        top = []
+        for v in np.asarray(a["by_overlap"][:k]).tolist():
+            rings = self._ring_positions(v)
+            top.append({"account_id": str(a["accounts"][v]), "ring_count": len(rings),
+                        "ring_ids": [str(r) for r in a["ring_ids"][rings]]})
+        return top
+
+
+def build_ring_index(rings: List[Dict]) -> RingIndex:
+    """Builds the index over score_rings() output (ring_id, member_accounts, pattern_type, ...)."""
+    order    = sorted(range(len(rings)), key=lambda i: rings[i]["ring_id"])
+    rings    = [rings[i] for i in order]
+    sizes    = np.array([len(ring["member_accounts"]) for ring in rings], dtype=np.int64)
+    names    = np.array([m for ring in rings for m in ring["member_accounts"]], dtype=str)
+    accounts, acc_pos = np.unique(names, return_inverse=True)
+    ring_pos = np.repeat(np.arange(len(rings), dtype=np.int64), sizes)
+
+    # One entry per (ring, account) pair, in ring-major then account-major order
+    pairs    = np.sort(ring_pos * max(1, len(accounts)) + acc_pos)
+    pairs    = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))[:len(pairs)]]
+    ring_pos, acc_pos = pairs // max(1, len(accounts)), pairs % max(1, len(accounts))
+    by_acc   = np.lexsort((ring_pos, acc_pos))
+    acc_count = np.bincount(acc_pos, minlength=len(accounts))
+
+    arrays = {
+        "accounts"    : accounts,
+        "acc_offsets" : np.concatenate(([0], np.cumsum(acc_count))).astype(np.int64),
+        "acc_rings"   : ring_pos[by_acc].astype(np.int32),
+        "by_overlap"  : np.lexsort((np.arange(len(accounts)), -acc_count)).astype(np.int64),
+        "ring_ids"    : np.array([ring["ring_id"] for ring in rings], dtype=str),
+        "pattern_type": np.array([ring["pattern_type"] for ring in rings], dtype=str),
+        "risk_score"  : np.array([ring["risk_score"] for ring in rings], dtype=np.float64),
+        "total_value" : np.array([ring["total_value"] for ring in rings], dtype=np.float64),
+        "ring_offsets": np.concatenate(([0], np.cumsum(np.bincount(ring_pos, minlength=len(rings))))).astype(np.int64),
+        "ring_members": acc_pos.astype(np.int32)
+    }
+    return RingIndex(arrays)
+
+
+def write_ring_index(directory: str, index: RingIndex):
+    os.makedirs(directory, exist_ok=True)
+    for name in COLUMNS:
+        np.save(os.path.join(directory, f"{name}.npy"), index.arrays[name])
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"version": MEMBERSHIP_VERSION, "accounts": len(index.arrays["accounts"]),
+                   "rings": len(index.arrays["ring_ids"])}, f)
+
+
+def open_ring_index(directory: str) -> RingIndex:
+    """Memory-maps an index written by write_ring_index. Raises FileNotFoundError / ValueError."""
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != MEMBERSHIP_VERSION:
+        raise ValueError(f"Unsupported membership index version: {meta.get('version')}")
+    return RingIndex({name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                      for name in COLUMNS})
@@ -0,0 +1,216 @@
+import contextvars
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+_active = contextvars.ContextVar("analysis_metrics", default=None)
+
+RSS_SAMPLE_SECONDS = 0.01
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (Linux /proc); None where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RSSSampler:
+    """
+    Background thread sampling RSS every RSS_SAMPLE_SECONDS while at least one stage is
+    watching; each watcher keeps the highest value seen. RSS is process-wide, so stages of
+    concurrent analyses see each other's allocations.
+    """
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._watchers = []         # [peak] cells of running stages
+        self._thread   = None
+
+    def watch(self) -> List[int]:
+        cell = [current_rss() or 0]
+        with self._lock:
+            self._watchers.append(cell)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+        return cell
+
+    def unwatch(self, cell: List[int]) -> int:
+        rss = current_rss() or 0
+        with self._lock:
+            # By identity: cells are plain lists, and two stages can hold equal peaks
+            self._watchers = [watcher for watcher in self._watchers if watcher is not cell]
+        return max(cell[0], rss)
+
+    def _run(self):
+        while True:
+            rss = current_rss() or 0
+            with self._lock:
+                if not self._watchers:
+                    self._thread = None
+                    return
+                for cell in self._watchers:
+                    if rss > cell[0]:
+                        cell[0] = rss
+            time.sleep(RSS_SAMPLE_SECONDS)
+
+
+SAMPLER = RSSSampler()
+
+
+class AnalysisMetrics:
+    """
+    Stage timings and item counts for one analysis request.
+
+    Stages are timed with wall clock and thread CPU time — the CPU of worker processes
+    (partitioned / coordinated modes) is not included, their wall time is.
+    Peak memory per stage is the highest sampled RSS, plus the tracemalloc peak when
+    tracing is on (PYTHONTRACEMALLOC=1 — it slows allocation-heavy code, so off by default).
+    Counts recorded with record() go to the innermost running stage.
+    """
+
+    def __init__(self):
+        self.stages = {}            # name -> {"wall_seconds", "cpu_seconds", "peak_rss", "peak_traced", "counts"}
+        self._open  = []            # stack of running stage names
+        self._traced = []           # tracemalloc peak seen so far by each running stage
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        entry = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss": 0,
+                                              "peak_traced": None, "counts": {}})
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # reset_peak() is global: bank the enclosing stage's peak so far before resetting
+            if self._traced:
+                self._traced[-1] = max(self._traced[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._open.append(name)
+        self._traced.append(0)
+        cell = SAMPLER.watch()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            entry["wall_seconds"] += time.perf_counter() - wall
+            entry["cpu_seconds"]  += time.thread_time() - cpu
+            entry["peak_rss"]      = max(entry["peak_rss"], SAMPLER.unwatch(cell))
+            peak = self._traced.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                entry["peak_traced"] = max(entry["peak_traced"] or 0, peak)
+                # The enclosing stage was running too, so its peak is at least this one
+                if self._traced:
+                    self._traced[-1] = max(self._traced[-1], peak)
+            self._open.pop()
+
+    def record(self, item: str, n: int = 1):
+        if not self._open:
+            return
+        counts = self.stages[self._open[-1]]["counts"]
+        counts[item] = counts.get(item, 0) + int(n)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per-stage block for the response summary, in execution order."""
+        summary = {}
+        for name, entry in self.stages.items():
+            block = {
+                "wall_seconds": round(entry["wall_seconds"], 4),
+                "cpu_seconds" : round(entry["cpu_seconds"], 4),
+                "peak_rss_mb" : round(entry["peak_rss"] / 2**20, 1)
+            }
+            if entry["peak_traced"] is not None:
+                block["peak_traced_mb"] = round(entry["peak_traced"] / 2**20, 1)
+            block.update(entry["counts"])
+            summary[name] = block
+        return summary
+
+    def peak_rss(self) -> int:
+        return max((entry["peak_rss"] for entry in self.stages.values()), default=0)
+
+
+def begin_analysis() -> AnalysisMetrics:
+    """Starts collecting for the current request (context-local, so concurrent requests don't mix)."""
+    metrics = AnalysisMetrics()
+    _active.set(metrics)
+    return metrics
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times `name` on the active request's metrics; a plain no-op block when none is active."""
+    metrics = _active.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+def record(item: str, n: int = 1):
+    """Adds n to `item` of the running stage, if a request is being measured."""
+    metrics = _active.get()
+    if metrics is not None:
+        metrics.record(item, n)
+
+
+class MetricsRegistry:
+    """Process-wide totals over every published analysis, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self.analyses  = 0
+        self.wall      = {}         # stage -> total seconds
+        self.cpu       = {}
+        self.runs      = {}
+        self.last_wall = {}
+        self.last_rss  = {}         # stage -> peak RSS bytes of its latest run
+        self.items     = {}         # (stage, item) -> total
+
+    def publish(self, metrics: AnalysisMetrics):
+        with self._lock:
+            self.analyses += 1
+            for name, entry in metrics.stages.items():
+                self.wall[name]      = self.wall.get(name, 0.0) + entry["wall_seconds"]
+                self.cpu[name]       = self.cpu.get(name, 0.0) + entry["cpu_seconds"]
+                self.runs[name]      = self.runs.get(name, 0) + 1
+                self.last_wall[name] = entry["wall_seconds"]
+                self.last_rss[name]  = entry["peak_rss"]
+                for item, n in entry["counts"].items():
+                    self.items[(name, item)] = self.items.get((name, item), 0) + n
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+
+            def family(metric: str, kind: str, help_text: str, samples: Dict):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for key, value in sorted(samples.items()):
+                    if isinstance(key, tuple):
+                        labels = f'{{stage="{key[0]}",item="{key[1]}"}}'
+                    else:
+                        labels = f'{{stage="{key}"}}'
+                    lines.append(f"{metric}{labels} {value}")
+
+            lines.append("# HELP mule_analyses_total Completed analyses.")
+            lines.append("# TYPE mule_analyses_total counter")
+            lines.append(f"mule_analyses_total {self.analyses}")
+            family("mule_stage_wall_seconds_total", "counter", "Wall-clock seconds spent per stage.", self.wall)
+            family("mule_stage_cpu_seconds_total", "counter", "Thread CPU seconds spent per stage.", self.cpu)
+            family("mule_stage_runs_total", "counter", "Times each stage ran.", self.runs)
+            family("mule_stage_last_wall_seconds", "gauge", "Wall-clock seconds of the latest run of each stage.",
+                   self.last_wall)
+            family("mule_stage_last_peak_rss_bytes", "gauge", "Peak process RSS during the latest run of each stage.",
+                   self.last_rss)
+            family("mule_stage_items_total", "counter", "Items processed per stage.", self.items)
+            return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
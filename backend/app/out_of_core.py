@@ -0,0 +1,193 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, NamedTuple, Tuple
+from app.algorithms.csr import CSRGraph, DiskCSRBuilder, aggregate_pairs
+from app.algorithms.events import EncodedTransactions
+from app.algorithms.graph_dsa import find_cycles_csr
+from app.pipeline import CYCLE_MIN_LEN, CYCLE_MAX_LEN, detect_shard_rings, combine_shard_rings
+from app.metrics import stage, record
+
+# Working-set estimates used to turn a memory budget into chunk and shard sizes
+PARSE_BYTES_PER_ROW = 600     # one parsed CSV row in pandas, string objects included
+SHARD_BYTES_PER_ROW = 400     # one shard row through sort, event arrays and detector temporaries
+MIN_CSV_ROW_BYTES   = 32      # conservative lower bound, so row estimates from file size err high
+
+REQUIRED_COLUMNS = {'transaction_id', 'sender_id', 'receiver_id', 'amount', 'timestamp'}
+SHARD_COLUMNS    = (("src", np.int64), ("dst", np.int64), ("time", np.int64),
+                    ("amount", np.float64), ("row", np.int64))
+
+
+class OutOfCoreResult(NamedTuple):
+    rings: List[Dict]
+    names: pd.Index           # account code -> name
+    csr: CSRGraph             # memory-mapped from the work directory
+    inflow: np.ndarray        # total received per account code
+    outflow: np.ndarray       # total sent per account code
+    stats: Dict
+
+
+def shard_of(codes: np.ndarray, n_shards: int) -> np.ndarray:
+    """Multiplicative hash of account codes onto shards."""
+    return (np.asarray(codes, dtype=np.int64) * 2654435761) % n_shards
+
+
+def plan_shards(file_size: int, memory_budget: int) -> Tuple[int, int]:
+    """(n_shards, chunk_rows) so one parse chunk and one shard each fit in memory_budget bytes."""
+    est_rows   = max(1, file_size // MIN_CSV_ROW_BYTES)
+    chunk_rows = max(1_000, memory_budget // PARSE_BYTES_PER_ROW)
+    # Each row lands in at most two shards (sender's and receiver's)
+    n_shards   = max(1, math.ceil(2 * est_rows * SHARD_BYTES_PER_ROW / memory_budget))
+    return n_shards, chunk_rows
+
+
+def _shard_dir(work_dir: str, shard: int) -> str:
+    return os.path.join(work_dir, f"shard_{shard:05d}")
+
+
+def partition_csv(csv_path: str, work_dir: str, n_shards: int, chunk_rows: int) -> Tuple[List[str], int]:
+    """
+    Streams the CSV in chunks, encodes account names into one dictionary and appends every
+    row as binary columns to the shard of its sender and (if different) of its receiver.
+    A shard therefore holds every transaction touching the accounts it owns.
+    Returns (names by code, total rows).
+    """
+    for shard in range(n_shards):
+        os.makedirs(_shard_dir(work_dir, shard), exist_ok=True)
+
+    code_of, names, row0 = {}, [], 0
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        if not REQUIRED_COLUMNS.issubset(chunk.columns):
+            raise ValueError(f"Missing columns. Required: {REQUIRED_COLUMNS}")
+
+        senders   = chunk['sender_id'].astype(str)
+        receivers = chunk['receiver_id'].astype(str)
+        for name in pd.unique(np.concatenate((senders.to_numpy(), receivers.to_numpy()))):
+            if name not in code_of:
+                code_of[name] = len(names)
+                names.append(name)
+
+        columns = {
+            "src"   : senders.map(code_of).to_numpy(dtype=np.int64),
+            "dst"   : receivers.map(code_of).to_numpy(dtype=np.int64),
+            "time"  : pd.to_datetime(chunk['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64),
+            "amount": chunk['amount'].to_numpy(dtype=np.float64),
+            "row"   : np.arange(row0, row0 + len(chunk), dtype=np.int64)
+        }
+        row0 += len(chunk)
+
+        # Route: sender's shard always, receiver's shard when it differs
+        s_src, s_dst = shard_of(columns["src"], n_shards), shard_of(columns["dst"], n_shards)
+        cross  = np.flatnonzero(s_dst != s_src)
+        target = np.concatenate((s_src, s_dst[cross]))
+        pick   = np.concatenate((np.arange(len(chunk)), cross))
+        order  = np.argsort(target, kind="stable")
+        target, pick = target[order], pick[order]
+        bounds = np.searchsorted(target, np.arange(n_shards + 1))
+
+        for shard in np.flatnonzero(np.diff(bounds)):
+            rows = pick[bounds[shard]:bounds[shard + 1]]
+            for name, dtype in SHARD_COLUMNS:
+                with open(os.path.join(_shard_dir(work_dir, shard), f"{name}.bin"), "ab") as f:
+                    columns[name][rows].astype(dtype).tofile(f)
+
+    return names, row0
+
+
+def sort_shard(work_dir: str, shard: int) -> int:
+    """External-sort step: loads one shard, orders it by (timestamp, row) and rewrites it as .npy columns."""
+    directory = _shard_dir(work_dir, shard)
+    columns   = {}
+    for name, dtype in SHARD_COLUMNS:
+        path = os.path.join(directory, f"{name}.bin")
+        columns[name] = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.zeros(0, dtype=dtype)
+
+    order = np.lexsort((columns["row"], columns["time"]))
+    for name, _ in SHARD_COLUMNS:
+        np.save(os.path.join(directory, f"{name}.npy"), columns[name][order])
+        path = os.path.join(directory, f"{name}.bin")
+        if os.path.exists(path):
+            os.remove(path)
+    return len(order)
+
+
+def load_shard(work_dir: str, shard: int, names: pd.Index) -> EncodedTransactions:
+    directory = _shard_dir(work_dir, shard)
+    columns   = {name: np.load(os.path.join(directory, f"{name}.npy")) for name, _ in SHARD_COLUMNS}
+    return EncodedTransactions(columns["src"], columns["dst"], columns["time"], columns["amount"],
+                               names, columns["row"])
+
+
+def analyze_out_of_core(csv_path: str, work_dir: str, memory_budget: int = 512 * 2**20,
+                        smurf_episodes: bool = False) -> OutOfCoreResult:
+    """
+    Disk-backed analysis for transaction files larger than memory.
+
+      1. partition_csv: chunked parse, account encoding, hash-partition by account
+         into on-disk columnar shards (one row per owner shard)
+      2. sort_shard: each shard sorted by timestamp on its own — shards are sized from
+         memory_budget so a single shard always fits
+      3. Per shard: smurfing, gather-scatter, structuring and shell hop links for owned
+         accounts (detect_shard_rings); owned out-edges are aggregated and spilled for the CSR
+      4. Shell links from all shards are chained once; the CSR adjacency is laid out on
+         disk and memory-mapped, and cycles are searched over it (find_cycles_csr)
+
+    Resident memory is bounded by memory_budget plus O(accounts) counters and the
+    account-name dictionary. Rings equal the in-memory pipeline's on the same data.
+    """
+    n_shards, chunk_rows = plan_shards(os.path.getsize(csv_path), memory_budget)
+    with stage("partition"):
+        raw_names, n_rows = partition_csv(csv_path, work_dir, n_shards, chunk_rows)
+        record("rows", n_rows)
+        record("shards", n_shards)
+    names      = pd.Index(raw_names)
+    n_accounts = len(names)
+    owner      = shard_of(np.arange(n_accounts), n_shards)
+
+    builder = DiskCSRBuilder(os.path.join(work_dir, "csr"), n_accounts)
+    inflow  = np.zeros(n_accounts)
+    outflow = np.zeros(n_accounts)
+
+    shard_results = []
+    largest_shard = 0
+
+    for shard in range(n_shards):
+        with stage("shard_sort"):
+            largest_shard = max(largest_shard, sort_shard(work_dir, shard))
+            enc   = load_shard(work_dir, shard, names)
+            owned = owner == shard
+
+        with stage("shard_detection"):
+            shard_results.append(detect_shard_rings(enc, owned, smurf_episodes))
+
+        # Owned senders contribute their out-edges (all of them live in this shard)
+        with stage("csr_build"):
+            sends, gets = owned[enc.src], owned[enc.dst]
+            builder.add_pairs(*aggregate_pairs(enc.src[sends], enc.dst[sends], enc.amount[sends], n_accounts))
+            builder.add_counts(np.bincount(enc.src[sends], minlength=n_accounts),
+                               np.bincount(enc.dst[gets], minlength=n_accounts))
+            outflow += np.bincount(enc.src[sends], weights=enc.amount[sends], minlength=n_accounts)
+            inflow  += np.bincount(enc.dst[gets], weights=enc.amount[gets], minlength=n_accounts)
+
+    with stage("csr_build"):
+        csr = builder.finish()
+        record("vertices", n_accounts)
+        record("csr_edges", csr.n_edges)
+    with stage("cycles"):
+        cycles = find_cycles_csr(csr.offsets, csr.targets, csr.out_count, csr.in_count, names,
+                                 min_len=CYCLE_MIN_LEN, max_len=CYCLE_MAX_LEN)
+    with stage("shell_chaining"):
+        rings = combine_shard_rings(cycles, shard_results, names)
+
+    stats = {
+        "rows"              : n_rows,
+        "accounts"          : n_accounts,
+        "shards"            : n_shards,
+        "chunk_rows"        : chunk_rows,
+        "largest_shard_rows": largest_shard,
+        "csr_edges"         : csr.n_edges,
+        "memory_budget"     : memory_budget
+    }
+    return OutOfCoreResult(rings, names, csr, inflow, outflow, stats)
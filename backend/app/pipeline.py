@@ -0,0 +1,171 @@
+import igraph
+import numpy as np
+import pandas as pd
+from typing import List, Dict, NamedTuple, Optional
+from app.algorithms.csr import CSRGraph
+from app.algorithms.events import EncodedTransactions, encode_transactions
+from app.algorithms.graph_dsa import find_cycles_dfs, find_cycles_csr, get_dynamic_outdegree_cap
+from app.algorithms.temporal_dsa import (
+    smurf_rings, gather_scatter_rings, pass_through_links, pass_through_rings, leg_table, shell_paths, shell_rings
+)
+from app.algorithms.structuring_dsa import structuring_rings
+from app.metrics import stage, record
+
+# Detector settings shared by the in-memory, partitioned and out-of-core paths
+CYCLE_MIN_LEN, CYCLE_MAX_LEN = 3, 5
+SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD = 72, 10
+GATHER_SCATTER_GAP_HOURS = 24
+SHELL_MIN_HOPS, SHELL_MAX_GAP_HOURS, SHELL_MAX_HAIRCUT, SHELL_MAX_DEGREE = 3, 24, 0.10, 3
+STRUCTURING_THRESHOLDS, STRUCTURING_MARGIN = (10000.0,), 0.10
+STRUCTURING_WINDOW_HOURS, STRUCTURING_COUNT_THRESHOLD = 72, 3
+
+
+class DetectorSettings(NamedTuple):
+    """
+    The speed / accuracy knobs of detect_component_rings. Defaults are the settings above;
+    other values are for tuning experiments (tests/accuracy.py) — the API always runs the defaults.
+    """
+    cycle_min_len: int            = CYCLE_MIN_LEN
+    cycle_max_len: int            = CYCLE_MAX_LEN
+    cap_multiplier: float         = 2.0       # get_dynamic_outdegree_cap: mean + multiplier * std
+    smurf_window_hours: float     = SMURF_WINDOW_HOURS
+    smurf_count_threshold: int    = SMURF_COUNT_THRESHOLD
+
+
+DEFAULT_SETTINGS = DetectorSettings()
+
+
+def build_graph(df: pd.DataFrame) -> igraph.Graph:
+    """Directed multigraph of the transactions, vertex names = account IDs, edge attr = amount."""
+    edges = list(zip(df['sender_id'].astype(str), df['receiver_id'].astype(str), df['amount']))
+    return igraph.Graph.TupleList(edges, directed=True, edge_attrs="amount")
+
+
+def detect_component_rings(df: pd.DataFrame, graph: Optional[igraph.Graph] = None,
+                           cycle_cap: Optional[int] = None, smurf_episodes: bool = False,
+                           settings: DetectorSettings = DEFAULT_SETTINGS,
+                           enc: Optional[EncodedTransactions] = None) -> List[Dict]:
+    """
+    Runs the detectors whose results never cross a weakly connected component:
+    cycles, smurfing, gather-scatter and pass-through shells.
+    Safe to call on any union of whole components (see algorithms.partition).
+    The frame is encoded once (or `enc`, its encoding, is reused) for every detector.
+    """
+    if graph is None:
+        graph = build_graph(df)
+    if enc is None:
+        enc = encode_transactions(df)
+    if cycle_cap is None:
+        cycle_cap = get_dynamic_outdegree_cap(graph, settings.cap_multiplier)
+
+    rings = []
+
+    with stage("cycles"):
+        cycles = find_cycles_dfs(graph, min_len=settings.cycle_min_len, max_len=settings.cycle_max_len,
+                                 cap=cycle_cap)
+        rings.extend(cycles)
+
+    # Gather-scatter joins the Fan-In / Fan-Out episodes the smurfing pass already found
+    streams = {}
+    with stage("smurfing"):
+        smurfs = smurf_rings(enc, [(settings.smurf_window_hours, settings.smurf_count_threshold)], smurf_episodes,
+                             streams=streams)
+        record("rings", len(smurfs))
+        rings.extend(smurfs)
+
+    with stage("gather_scatter"):
+        layering = gather_scatter_rings(enc, settings.smurf_window_hours, settings.smurf_count_threshold,
+                                        GATHER_SCATTER_GAP_HOURS, streams=streams)
+        record("rings", len(layering))
+        rings.extend(layering)
+
+    with stage("shells"):
+        shells = pass_through_rings(enc, SHELL_MIN_HOPS, SHELL_MAX_GAP_HOURS, SHELL_MAX_HAIRCUT, SHELL_MAX_DEGREE)
+        record("rings", len(shells))
+        rings.extend(shells)
+
+    return rings
+
+
+def detect_global_rings(df: pd.DataFrame, enc: Optional[EncodedTransactions] = None) -> List[Dict]:
+    """Detectors that already run as one vectorized pass over the whole table (`enc`: its encoding, if at hand)."""
+    if enc is None:
+        enc = encode_transactions(df)
+    with stage("structuring"):
+        rings = structuring_rings(enc, STRUCTURING_THRESHOLDS, STRUCTURING_MARGIN,
+                                  STRUCTURING_WINDOW_HOURS, STRUCTURING_COUNT_THRESHOLD)
+        record("rings", len(rings))
+    return rings
+
+
+def detect_encoded_rings(enc: EncodedTransactions, csr: CSRGraph, smurf_episodes: bool = False) -> List[Dict]:
+    """
+    Every detector over encoded columns plus a CSR adjacency (e.g. a memory-mapped
+    snapshot) — no DataFrame or igraph object is built. Same rings, in the same order,
+    as detect_component_rings + detect_global_rings on the whole table.
+    """
+    with stage("cycles"):
+        rings = find_cycles_csr(csr.offsets, csr.targets, csr.out_count, csr.in_count, enc.names,
+                                min_len=CYCLE_MIN_LEN, max_len=CYCLE_MAX_LEN)
+    streams = {}
+    with stage("smurfing"):
+        rings.extend(smurf_rings(enc, [(SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD)], smurf_episodes, streams=streams))
+    with stage("gather_scatter"):
+        rings.extend(gather_scatter_rings(enc, SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD, GATHER_SCATTER_GAP_HOURS,
+                                          streams=streams))
+    with stage("shells"):
+        rings.extend(pass_through_rings(enc, SHELL_MIN_HOPS, SHELL_MAX_GAP_HOURS, SHELL_MAX_HAIRCUT, SHELL_MAX_DEGREE))
+    with stage("structuring"):
+        rings.extend(structuring_rings(enc, STRUCTURING_THRESHOLDS, STRUCTURING_MARGIN,
+                                       STRUCTURING_WINDOW_HOURS, STRUCTURING_COUNT_THRESHOLD))
+    return rings
+
+
+def detect_shard_rings(enc: EncodedTransactions, owned: np.ndarray, smurf_episodes: bool = False) -> Dict:
+    """
+    Runs the per-account detectors on one account shard. `enc` must hold every transaction
+    touching an owned account; only owned accounts act as centers/shells, so the union over
+    all shards equals the whole-table result. Shell hop links are returned unchained —
+    chains cross shards and are walked once all links are known.
+    """
+    specs   = [(SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD)]
+    streams = {}
+    smurfs  = smurf_rings(enc, specs, smurf_episodes,
+                          allowed={"Smurfing (Fan-In)": owned, "Smurfing (Fan-Out)": owned}, streams=streams)
+    layering = gather_scatter_rings(enc, SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD,
+                                    GATHER_SCATTER_GAP_HOURS, allowed=owned, streams=streams)
+    structuring = structuring_rings(enc, STRUCTURING_THRESHOLDS, STRUCTURING_MARGIN,
+                                    STRUCTURING_WINDOW_HOURS, STRUCTURING_COUNT_THRESHOLD, allowed=owned)
+
+    tx_in, tx_out = pass_through_links(enc, SHELL_MAX_GAP_HOURS, SHELL_MAX_HAIRCUT, SHELL_MAX_DEGREE, allowed=owned)
+    legs = leg_table(enc, np.unique(np.concatenate((tx_in, tx_out))))
+
+    return {
+        "smurfing"       : smurfs,
+        "gather_scatter" : layering,
+        "structuring"    : structuring,
+        "shell_links"    : (tx_in, tx_out),
+        "shell_legs"     : legs
+    }
+
+
+def combine_shard_rings(cycles: List[Dict], shard_results: List[Dict], names) -> List[Dict]:
+    """
+    Merges detect_shard_rings outputs from every shard: shell hop links are chained across
+    shards, and rings are ordered like the in-memory pipeline (cycles, smurfing,
+    gather-scatter, shells, structuring).
+    """
+    found = {"smurfing": [], "gather_scatter": [], "structuring": []}
+    links_in, links_out, legs = [], [], []
+    for result in shard_results:
+        for key in found:
+            found[key].extend(result[key])
+        links_in.append(result["shell_links"][0])
+        links_out.append(result["shell_links"][1])
+        legs.append(result["shell_legs"])
+
+    paths  = shell_paths(np.concatenate(links_in), np.concatenate(links_out), SHELL_MIN_HOPS)
+    leg_df = pd.concat(legs)
+    shells = shell_rings(paths, leg_df[~leg_df.index.duplicated()], names)
+
+    return cycles + found["smurfing"] + found["gather_scatter"] + shells + found["structuring"]
@@ -0,0 +1,85 @@
+import cProfile
+import hmac
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "mule_profiles"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# One profiled run at a time: from 3.12 only one cProfile profiler can be active per process
+PROFILER_LOCK = threading.Lock()
+
+# Entry points reported by name even when they are not among the top self-time functions
+TRACKED_FUNCTIONS = (
+    "find_cycles_dfs", "find_cycles_csr", "enumerate_cycles",
+    "detect_smurfing", "smurf_rings", "detect_gather_scatter",
+    "detect_pass_through_shells", "detect_structuring",
+    "score_rings", "score_accounts"
+)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Profiling is off unless ADMIN_TOKEN is configured; compares in constant time."""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _label(key) -> str:
+    filename, line, func = key
+    return f"{os.path.basename(filename)}:{line}({func})" if line else func
+
+
+def hotspots(stats: pstats.Stats, top: int = 15) -> Dict[str, List[Dict]]:
+    """Top functions by self time, plus cumulative time of every tracked entry point that ran."""
+    rows = [{
+        "function"          : _label(key),
+        "calls"             : nc,
+        "self_seconds"      : round(tt, 4),
+        "cumulative_seconds": round(ct, 4)
+    } for key, (cc, nc, tt, ct, callers) in stats.stats.items()]
+
+    by_self = sorted(rows, key=lambda r: r["self_seconds"], reverse=True)[:top]
+    tracked = sorted((r for r, key in zip(rows, stats.stats) if key[2] in TRACKED_FUNCTIONS),
+                     key=lambda r: r["cumulative_seconds"], reverse=True)
+    return {"top_self_time": by_self, "tracked": tracked}
+
+
+@contextmanager
+def profiled(label: str, top: int = 15) -> Iterator[Dict]:
+    """
+    Runs the block under cProfile (deterministic, so every call is counted) and fills the
+    yielded dict with the hotspot report. The raw profile is saved as a .prof (pstats) file
+    under PROFILE_DIR; snakeviz, tuna or flameprof render it as a flame / icicle graph.
+    Only requests that ask for it pay the profiler's overhead.
+    """
+    report   = {}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield report
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{label}_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}.prof")
+        profiler.dump_stats(path)
+
+        stats = pstats.Stats(profiler)
+        report["profile_file"]  = path
+        report["total_seconds"] = round(stats.total_tt, 4)
+        report.update(hotspots(stats, top))
+
+
+def profiled_call(label: str, fn: Callable[[], Any], top: int = 15) -> Tuple[Any, Dict]:
+    """
+    Calls fn() under profiled() and returns (its result, the report). Meant for
+    asyncio.to_thread: the profiler is enabled in that worker thread, so requests served
+    meanwhile by the server's loop are neither profiled nor slowed down.
+    """
+    with profiled(label, top) as report:
+        result = fn()
+    return result, report
@@ -0,0 +1,307 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+
+SAR_MODEL           = os.getenv("SAR_MODEL", "llama-3.1-8b-instant")
+SAR_TIMEOUT_SECONDS = float(os.getenv("SAR_TIMEOUT_SECONDS", "30"))
+SAR_MAX_CONCURRENCY = int(os.getenv("SAR_MAX_CONCURRENCY", "8"))
+STUB_LATENCY        = float(os.getenv("SAR_STUB_LATENCY", "2"))
+SAR_CACHE_SIZE      = int(os.getenv("SAR_CACHE_SIZE", "4096"))
+SAR_CACHE_TTL       = float(os.getenv("SAR_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+SYSTEM_PROMPT = "You are a specialized financial crime detection AI. Output strictly valid JSON."
+
+
+class SARTimeout(Exception):
+    """The LLM did not answer within the per-request timeout."""
+
+
+def ring_key(ring: Dict[str, Any]) -> str:
+    """
+    Stable content key of a ring: pattern, member set, score and value. ring_id is left out —
+    it is derived from a per-process hash, so the same ring gets different IDs across runs.
+    """
+    content = {
+        "pattern_type"   : ring.get("pattern_type"),
+        "member_accounts": sorted(str(m) for m in ring.get("member_accounts", [])),
+        "risk_score"     : ring.get("risk_score"),
+        "total_value"    : ring.get("total_value")
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:24]
+
+
+class SARCache:
+    """LRU of generated reports by ring_key, entries expiring `ttl` seconds after they were stored."""
+
+    def __init__(self, maxsize: int = SAR_CACHE_SIZE, ttl: float = SAR_CACHE_TTL):
+        self.maxsize  = maxsize
+        self.ttl      = ttl
+        self.hits     = 0
+        self.misses   = 0
+        self._entries = OrderedDict()       # key -> (stored_at, report)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, report: Dict[str, Any]):
+        self._entries[key] = (time.monotonic(), report)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def build_prompt(ring: Dict[str, Any]) -> str:
+    return f"""
+    You are an expert Financial Forensics Analyst for FinCEN.
+    Analyze the following Fraud Ring data and generate a professional Suspicious Activity Report (SAR) snippet.
+
+    Ring ID: {ring.get('ring_id')}
+    Pattern Type: {ring.get('pattern_type')}
+    Risk Score: {ring.get('risk_score')}/100
+    Total Volume: ${ring.get('total_value', 0)}
+    Member Accounts: {', '.join(ring.get('member_accounts', []))}
+
+    Output strictly in JSON format with two keys:
+    1. "executive_summary": A professional, 3-sentence summary of the suspicious activity, mentioning the typology (e.g. smurfing, cycle) and financial impact. Use "We have detected..." style.
+    2. "mule_herder": Identify the likely central actor (account ID) and briefly explain why (e.g. "Account X initiated the flow"). If unsure, pick the first account.
+    """
+
+
+def build_batch_prompt(rings: List[Dict[str, Any]]) -> str:
+    """One prompt for several rings; the answer must hold one report per ring, in order."""
+    blocks = "\n".join(f"""
+    Ring {i + 1}:
+    Ring ID: {ring.get('ring_id')}
+    Pattern Type: {ring.get('pattern_type')}
+    Risk Score: {ring.get('risk_score')}/100
+    Total Volume: ${ring.get('total_value', 0)}
+    Member Accounts: {', '.join(ring.get('member_accounts', []))}""" for i, ring in enumerate(rings))
+    return f"""
+    You are an expert Financial Forensics Analyst for FinCEN.
+    Analyze each of the following {len(rings)} Fraud Rings and generate a professional Suspicious Activity Report (SAR) snippet for each.
+    {blocks}
+
+    Output strictly in JSON format as {{"reports": [...]}} with exactly {len(rings)} objects, in ring order, each with two keys:
+    1. "executive_summary": A professional, 3-sentence summary of the suspicious activity, mentioning the typology (e.g. smurfing, cycle) and financial impact. Use "We have detected..." style.
+    2. "mule_herder": Identify the likely central actor (account ID) and briefly explain why (e.g. "Account X initiated the flow"). If unsure, pick the first account.
+    """
+
+
+class StubBackend:
+    """Offline stand-in for the LLM: answers a placeholder SAR after `latency` seconds, without blocking."""
+
+    def __init__(self, latency: float = STUB_LATENCY):
+        self.latency = latency
+
+    async def complete(self, ring: Dict[str, Any], prompt: str) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        return self._report(ring)
+
+    async def complete_many(self, rings: List[Dict[str, Any]], prompt: str) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        return [self._report(ring) for ring in rings]
+
+    @staticmethod
+    def _report(ring: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "executive_summary": "Simulated AI Response: Groq API Key is missing. This is a placeholder summary indicating that a suspicious ring was detected with circular flow characteristics.",
+            "mule_herder": ring['member_accounts'][0] if ring.get('member_accounts') else "Unknown"
+        }
+
+    async def aclose(self):
+        pass
+
+
+class GroqBackend:
+    """
+    AsyncGroq over one pooled httpx.AsyncClient, so concurrent SARs reuse keep-alive
+    connections instead of opening one per request.
+    """
+
+    def __init__(self, api_key: str, model: str = SAR_MODEL, max_connections: int = SAR_MAX_CONCURRENCY,
+                 timeout: float = SAR_TIMEOUT_SECONDS):
+        from groq import AsyncGroq
+        self.model  = model
+        self.http   = httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections,
+                                                            max_keepalive_connections=max_connections),
+                                        timeout=httpx.Timeout(timeout, connect=5.0))
+        self.client = AsyncGroq(api_key=api_key, http_client=self.http, max_retries=1)
+
+    async def _json(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        completion = await self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            model=self.model,
+            temperature=0.2,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+        return json.loads(completion.choices[0].message.content)
+
+    async def complete(self, ring: Dict[str, Any], prompt: str) -> Dict[str, Any]:
+        return await self._json(prompt, 300)
+
+    async def complete_many(self, rings: List[Dict[str, Any]], prompt: str) -> List[Dict[str, Any]]:
+        reports = (await self._json(prompt, 300 * len(rings))).get("reports")
+        if not isinstance(reports, list) or len(reports) != len(rings):
+            raise ValueError(f"Expected {len(rings)} reports in the batch answer")
+        return reports
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class SARGenerator:
+    """
+    Runs SAR completions on the event loop: at most `max_concurrency` LLM calls in flight
+    (the rest wait on a semaphore, never on the loop) and each call bounded by `timeout`
+    (x rings, for a multi-ring prompt).
+
+    Reports are cached by ring_key, and a ring already being generated — for this request
+    or another — is awaited rather than requested again.
+
+    `backend_factory` builds the backend; the backend and semaphore are (re)built for the
+    running event loop, since pooled connections and asyncio primitives belong to one loop.
+    """
+
+    def __init__(self, backend_factory, max_concurrency: int = SAR_MAX_CONCURRENCY,
+                 timeout: float = SAR_TIMEOUT_SECONDS, cache: Optional[SARCache] = None):
+        self.backend_factory = backend_factory
+        self.max_concurrency = max_concurrency
+        self.timeout         = timeout
+        self.cache           = cache if cache is not None else SARCache()
+        self.llm_calls       = 0
+        self._loop           = None
+        self._backend        = None
+        self._semaphore      = None
+        self._inflight       = {}       # ring_key -> Future of its report
+        self._tasks          = set()
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop      = loop
+            self._backend   = self.backend_factory()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight  = {}
+        return self._backend, self._semaphore
+
+    async def _complete(self, rings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        backend, semaphore = self._bind()
+        async with semaphore:
+            self.llm_calls += 1
+            try:
+                if len(rings) == 1:
+                    call = backend.complete(rings[0], build_prompt(rings[0]))
+                    return [await asyncio.wait_for(call, self.timeout)]
+                call = backend.complete_many(rings, build_batch_prompt(rings))
+                return await asyncio.wait_for(call, self.timeout * len(rings))
+            except asyncio.TimeoutError:
+                raise SARTimeout(f"SAR generation timed out after {self.timeout:g}s")
+
+    async def _run(self, keys: List[str], rings: List[Dict[str, Any]]):
+        try:
+            try:
+                reports = await self._complete(rings)
+            except ValueError as e:
+                if len(rings) == 1:
+                    raise
+                # The model didn't return one report per ring: fall back to one prompt each
+                print(f"Multi-ring SAR prompt failed ({e}); retrying rings individually")
+                reports = [r[0] for r in await asyncio.gather(*(self._complete([ring]) for ring in rings))]
+            for key, report in zip(keys, reports):
+                self.cache.put(key, report)
+                self._inflight.pop(key).set_result(report)
+        except Exception as e:
+            for key in keys:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+
+    def _schedule(self, rings: Dict[str, Dict[str, Any]], pack: int = 1) -> Dict[str, asyncio.Future]:
+        """Futures for the given uncached rings by key, starting LLM calls (`pack` rings each) for new ones."""
+        self._bind()
+        futures, new = {}, []
+        for key, ring in rings.items():
+            if key not in self._inflight:
+                self._inflight[key] = self._loop.create_future()
+                new.append(key)
+            futures[key] = self._inflight[key]
+        for start in range(0, len(new), max(1, pack)):
+            keys = new[start:start + max(1, pack)]
+            task = self._loop.create_task(self._run(keys, [rings[k] for k in keys]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return futures
+
+    async def generate(self, ring: Dict[str, Any]) -> Dict[str, Any]:
+        key    = ring_key(ring)
+        report = self.cache.get(key)
+        if report is not None:
+            return report
+        # Shielded: a client going away must not cancel a report other callers share
+        return await asyncio.shield(self._schedule({key: ring})[key])
+
+    async def generate_batch(self, rings: List[Dict[str, Any]],
+                             pack: int = 1) -> AsyncIterator[Tuple[List[int], str, Optional[Dict], Optional[str], bool]]:
+        """
+        Yields (input indexes, ring_key, report, error, cached) once per distinct ring, cached
+        ones first, then in completion order. Duplicate rings in the input share one entry.
+        """
+        indexes = {}
+        for i, ring in enumerate(rings):
+            indexes.setdefault(ring_key(ring), []).append(i)
+
+        pending = {}
+        for key, where in indexes.items():
+            report = self.cache.get(key)
+            if report is not None:
+                yield where, key, report, None, True
+            else:
+                pending[key] = rings[where[0]]
+        if not pending:
+            return
+
+        futures = self._schedule(pending, pack)
+
+        async def settle(key: str):
+            try:
+                return key, await asyncio.shield(futures[key]), None
+            except Exception as e:
+                return key, None, str(e) or type(e).__name__
+
+        for done in asyncio.as_completed([settle(key) for key in futures]):
+            key, report, error = await done
+            yield indexes[key], key, report, error, False
+
+    async def aclose(self):
+        if self._backend is not None and self._loop is asyncio.get_running_loop():
+            await self._backend.aclose()
+        self._loop = self._backend = self._semaphore = None
+
+
+def default_generator() -> SARGenerator:
+    """Groq when GROQ_API_KEY is valid (and SAR_BACKEND isn't 'stub'), otherwise the offline stub."""
+    api_key = os.getenv("GROQ_API_KEY")
+    if os.getenv("SAR_BACKEND", "groq") != "stub" and api_key and "gsk_" in api_key:
+        print("Groq Client Initialized Successfully")
+        return SARGenerator(lambda: GroqBackend(api_key))
+    print("WARNING: GROQ_API_KEY not found or invalid in .env. AI features will be disabled or mocked.")
+    return SARGenerator(StubBackend)
@@ -0,0 +1,157 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Tuple
+from app.algorithms.csr import CSRGraph
+
+
+def pattern_base_score(rtype: str) -> float:
+    """Rule 1: Base Pattern Weights."""
+    if "Gather-Scatter" in rtype:
+        return 75.0
+    if "Smurfing" in rtype or "Fan" in rtype:
+        return 70.0
+    if "Cycle" in rtype:
+        return 65.0
+    if "Structuring" in rtype:
+        return 60.0
+    if "Layered" in rtype or "Shell" in rtype:
+        return 55.0
+    return 50.0 # Fallback
+
+
+def csr_ring_value(csr: CSRGraph, names: pd.Index) -> Callable[[List[str]], float]:
+    """
+    Ring volume = total amount of all transactions between ring members.
+    Reads each member's CSR row and keeps the targets inside the ring, so the cost is
+    the members' out-degree rather than a scan of every edge per ring.
+    """
+    def ring_value(members: List[str]) -> float:
+        codes = names.get_indexer(members)
+        codes = np.unique(codes[codes >= 0])
+        total = 0.0
+        for v in codes.tolist():
+            lo, hi = csr.offsets[v], csr.offsets[v + 1]
+            inside = np.isin(csr.targets[lo:hi], codes)
+            total += float(csr.weights[lo:hi][inside].sum())
+        return total
+
+    return ring_value
+
+
+def score_rings(rings: List[Dict], ring_value: Callable[[List[str]], float]) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """
+    Scores, IDs and deduplicates detected rings.
+    Returns the formatted rings and the per-account memberships used for Kingpin detection (Rule 4):
+    { account_id: { "rings": [], "patterns": set(), "max_ring_score": 0.0 } }
+    Ring clusters from consolidate_rings() also report ring_count and member_count, and
+    their members get "merged_rings": how many of the merged rings they were in.
+    """
+    formatted_rings = []
+    seen_ring_ids = set()
+    account_ring_memberships = {}
+
+    for ring in rings:
+        rtype = ring["type"]
+        members = ring['members']
+        metadata = ring.get("metadata") or {}
+
+        # --- Rule 1: Base Pattern Weights ---
+        base_score = pattern_base_score(rtype)
+
+        # --- Calculate Ring Volume & ID ---
+        sorted_members = sorted([str(m) for m in members])
+        ring_val = ring_value(sorted_members)
+
+        # --- Rule 2: Financial Volume Multiplier ---
+        vol_score = 0.0
+        if ring_val > 50000: vol_score = 15.0
+        elif ring_val > 20000: vol_score = 10.0
+        elif ring_val > 5000: vol_score = 5.0
+
+        # --- Rule 3: Network Complexity Multiplier ---
+        node_count = len(members)
+        node_score = 0.0
+        if node_count >= 10: node_score = 10.0
+        elif node_count >= 5: node_score = 5.0
+
+        # --- Total Ring Score (Rule 5: Cap at 99.5) ---
+        total_ring_score = min(99.5, base_score + vol_score + node_score)
+
+        # ID Generation & Deduplication (a stable digest: the same ring gets the same ID in every process)
+        members_str = ",".join(sorted_members)
+        ring_hash = hashlib.blake2b(f"{members_str}|{rtype}".encode(), digest_size=5).hexdigest()
+        ring_id = f"RING_{ring_hash}"
+
+        if ring_id in seen_ring_ids:
+            continue
+        seen_ring_ids.add(ring_id)
+
+        formatted = {
+            "ring_id": ring_id,
+            "member_accounts": sorted_members,
+            "pattern_type": rtype,
+            "risk_score": round(total_ring_score, 1),
+            "total_value": round(ring_val, 2)
+        }
+        if "ring_count" in metadata:
+            formatted["ring_count"] = metadata["ring_count"]
+            formatted["member_count"] = len(sorted_members)
+        formatted_rings.append(formatted)
+        merged_counts = metadata.get("member_ring_counts", {})
+
+        # Update Account Memberships for Kingpin Logic
+        for member in sorted_members:
+            if member not in account_ring_memberships:
+                account_ring_memberships[member] = {
+                    "rings": [],
+                    "patterns": set(),
+                    "max_ring_score": 0.0
+                }
+            account_ring_memberships[member]["rings"].append(ring_id)
+            account_ring_memberships[member]["patterns"].add(rtype)
+            account_ring_memberships[member]["max_ring_score"] = max(account_ring_memberships[member]["max_ring_score"], total_ring_score)
+            if member in merged_counts:
+                data = account_ring_memberships[member]
+                data["merged_rings"] = data.get("merged_rings", 0) + merged_counts[member]
+
+    return formatted_rings, account_ring_memberships
+
+
+def score_accounts(account_ring_memberships: Dict[str, Dict], inflow: Dict[str, float],
+                   outflow: Dict[str, float], statuses: Dict[str, str]) -> List[Dict]:
+    """Finalize Accounts with dynamic scoring, sorted by suspicion score (highest first)."""
+    final_accounts = []
+    for acc_id, data in account_ring_memberships.items():
+        # Base Score is the MAX risk of any ring they are part of (not sum)
+        base_suspicion = data["max_ring_score"]
+
+        # --- Rule 4: Kingpin Overlap Multiplier ---
+        # If in > 1 unique ring (counting the rings merged into a cluster), add 20.0
+        overlap_bonus = 0.0
+        if len(set(data["rings"])) > 1 or data.get("merged_rings", 0) > 1:
+            overlap_bonus = 20.0
+
+        # Final Score Cap (Rule 5)
+        final_score = min(99.5, base_suspicion + overlap_bonus)
+
+        acc = {
+            "account_id": acc_id,
+            "suspicion_score": round(final_score, 1),
+            "detected_patterns": list(data["patterns"]),
+            "ring_id": list(data["rings"])[0] if data["rings"] else None,
+            "ring_ids": list(dict.fromkeys(data["rings"]))     # every ring, in detection order
+        }
+
+        acc["total_inflow"] = round(inflow.get(acc_id, 0.0), 2)
+        acc["total_outflow"] = round(outflow.get(acc_id, 0.0), 2)
+        acc["net_balance"] = round(acc["total_inflow"] - acc["total_outflow"], 2)
+
+        # Inject status if flagged
+        if acc_id in statuses:
+            acc["status"] = statuses[acc_id]
+
+        final_accounts.append(acc)
+
+    final_accounts.sort(key=lambda x: x["suspicion_score"], reverse=True)
+    return final_accounts
@@ -0,0 +1,279 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.membership import RingIndex, build_ring_index, write_ring_index, open_ring_index
+
+ANALYSIS_DIR  = os.getenv("ANALYSIS_DIR", os.path.join(tempfile.gettempdir(), "mule_analyses"))
+ANALYSIS_KEEP = int(os.getenv("ANALYSIS_KEEP", "20"))
+INDEX_VERSION = 1
+
+# Per-account columns, all in `keys` order
+COLUMNS = ("keys", "account_id", "score", "patterns", "ring_id", "inflow", "outflow", "net", "score_rank",
+           "by_score", "neg_score_desc", "patterns_desc", "tri_codes", "tri_offsets", "tri_postings")
+MAX_CHAR = "\U0010ffff"
+
+
+def _trigrams(encoded: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(code, position) of every distinct byte trigram of each entry of an 'S' array, sorted by code then position."""
+    n, width = len(encoded), encoded.dtype.itemsize
+    if n == 0 or width < 3:
+        return np.zeros(0, np.uint32), np.zeros(0, np.int32)
+    mat     = encoded.view(np.uint8).reshape(n, width).astype(np.uint32)
+    lengths = np.strings.str_len(encoded)
+    pairs   = []
+    for j in range(width - 2):
+        rows  = np.flatnonzero(lengths >= j + 3)
+        codes = (mat[rows, j] << 16) | (mat[rows, j + 1] << 8) | mat[rows, j + 2]
+        pairs.append((codes.astype(np.uint64) << 32) | rows.astype(np.uint64))
+    # sort + adjacent-difference rather than np.unique, which is far slower on large uint64 arrays
+    pairs = np.sort(np.concatenate(pairs))
+    pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))[:len(pairs)]]
+    return (pairs >> 32).astype(np.uint32), (pairs & 0xFFFFFFFF).astype(np.int32)
+
+
+def _query_trigrams(query: str) -> np.ndarray:
+    b = query.encode()
+    return np.unique(np.array([(b[i] << 16) | (b[i + 1] << 8) | b[i + 2] for i in range(len(b) - 2)], np.uint32))
+
+
+def _first_true(flags: np.ndarray, count: int) -> np.ndarray:
+    """Positions of the first `count` True values, reading no further into `flags` than needed."""
+    stop = 4 * count + 1024
+    while True:
+        found = np.flatnonzero(flags[:stop])
+        if len(found) >= count or stop >= len(flags):
+            return found[:count]
+        stop *= 4
+
+
+class AccountIndex:
+    """
+    Search index over one analysis' suspicious accounts.
+
+    Accounts are stored as columns sorted by lower-cased account ID (`keys`), so a prefix is
+    a binary-searched range of `keys`. Substrings go through a trigram inverted index (CSR:
+    tri_codes -> tri_offsets -> account positions): the posting lists of the query's
+    trigrams are intersected, smallest first, and the few survivors checked directly.
+    Queries shorter than three bytes fall back to a vectorized scan.
+    by_score / score_rank give the score order, so results sort by score by ranking only
+    the matches. Listings without a query walk the score order directly: a score range is a
+    binary-searched slice of neg_score_desc (-score in rank order, ascending), and a pattern filter one mask over that slice.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], patterns: List[str]):
+        self.arrays   = arrays
+        self.patterns = patterns        # bit i of `patterns` column = patterns[i]
+
+    def __len__(self) -> int:
+        return len(self.arrays["keys"])
+
+    def _substring(self, query: str) -> np.ndarray:
+        keys = self.arrays["keys"]
+        if len(query.encode()) < 3:
+            return np.flatnonzero(np.strings.find(keys, query) >= 0)
+        codes, offsets, postings = self.arrays["tri_codes"], self.arrays["tri_offsets"], self.arrays["tri_postings"]
+        wanted = _query_trigrams(query)
+        slots  = np.searchsorted(codes, wanted)
+        if np.any(slots >= len(codes)) or np.any(codes[np.minimum(slots, len(codes) - 1)] != wanted):
+            return np.zeros(0, np.int64)
+        lists  = sorted((postings[offsets[s]:offsets[s + 1]] for s in slots.tolist()), key=len)
+        found  = np.asarray(lists[0])
+        for other in lists[1:]:
+            found = np.intersect1d(found, other, assume_unique=True)
+        # Trigrams can all occur without being contiguous: confirm on the candidates
+        return found[np.strings.find(keys[found], query) >= 0].astype(np.int64)
+
+    def _pattern_mask(self, pattern: str) -> int:
+        pattern = pattern.lower()
+        return sum(1 << i for i, name in enumerate(self.patterns) if pattern in name.lower())
+
+    def search(self, query: str = "", match: str = "prefix", pattern: Optional[str] = None,
+               min_score: Optional[float] = None, max_score: Optional[float] = None,
+               sort: str = "score", offset: int = 0, limit: int = 50) -> Tuple[int, List[Dict]]:
+        """(total matches, the requested page of accounts). match: 'prefix' | 'substring'; sort: 'score' | 'account_id'."""
+        a      = self.arrays
+        query  = query.lower()
+        hits   = None           # positions in `keys` order; None = every account
+        if query:
+            if match == "substring":
+                hits = self._substring(query)
+            else:
+                lo, hi = np.searchsorted(a["keys"], [query, query + MAX_CHAR])
+                hits = np.arange(lo, hi)
+
+        end  = offset + limit
+        mask = self.arrays["patterns"].dtype.type(self._pattern_mask(pattern)) if pattern is not None else None
+
+        if hits is None and sort == "score":
+            # Ranks [lo, hi) hold the score range; scores are descending along the ranks
+            lo = 0 if max_score is None else int(np.searchsorted(a["neg_score_desc"], -max_score, "left"))
+            hi = len(self) if min_score is None else int(np.searchsorted(a["neg_score_desc"], -min_score, "right"))
+            hi = max(lo, hi)
+            if mask is None:
+                return hi - lo, self._rows(np.asarray(a["by_score"][lo + offset:min(hi, lo + end)]))
+            flags = (np.asarray(a["patterns_desc"][lo:hi]) & mask) != 0
+            ranks = lo + _first_true(flags, end)
+            return int(np.count_nonzero(flags)), self._rows(np.asarray(a["by_score"][ranks[offset:end]]))
+
+        filters = [(mask, lambda p: (np.asarray(a["patterns"][p]) & mask) != 0),
+                   (min_score, lambda p: a["score"][p] >= min_score),
+                   (max_score, lambda p: a["score"][p] <= max_score)]
+        filters = [test for value, test in filters if value is not None]
+
+        if hits is None:
+            # Account ID order is the storage order: filter everything, then read the page off the flags
+            flags = np.ones(len(self), bool)
+            for test in filters:
+                flags &= test(slice(None))
+            return int(np.count_nonzero(flags)), self._rows(_first_true(flags, end)[offset:])
+        for test in filters:
+            hits = hits[test(hits)]
+
+        if sort == "score" and len(hits):
+            ranks = np.asarray(a["score_rank"][hits])
+            if end < len(ranks):
+                ranks = np.partition(ranks, end)[:end]
+            page = np.asarray(a["by_score"][np.sort(ranks)[offset:end]])
+        else:
+            page = hits[offset:end]
+        return len(hits), self._rows(page)
+
+    def _rows(self, positions: np.ndarray) -> List[Dict]:
+        a = self.arrays
+        rows = []
+        for p in positions.tolist():
+            bits = int(a["patterns"][p])
+            rows.append({
+                "account_id": str(a["account_id"][p]),
+                "suspicion_score": round(float(a["score"][p]), 1),
+                "detected_patterns": [name for i, name in enumerate(self.patterns) if bits >> i & 1],
+                "ring_id": str(a["ring_id"][p]) or None,
+                "total_inflow": float(a["inflow"][p]),
+                "total_outflow": float(a["outflow"][p]),
+                "net_balance": float(a["net"][p])
+            })
+        return rows
+
+
+def build_account_index(accounts: List[Dict]) -> AccountIndex:
+    """Builds the index over score_accounts() output."""
+    ids    = np.array([acc["account_id"] for acc in accounts], dtype=str)
+    keys   = np.strings.lower(ids)
+    order  = np.argsort(keys, kind="stable")
+    vocab  = sorted({p for acc in accounts for p in acc["detected_patterns"]})
+    if len(vocab) > 64:
+        raise ValueError(f"{len(vocab)} pattern types do not fit the 64-bit pattern mask")
+    mask_type = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= len(vocab))
+    bit    = {name: 1 << i for i, name in enumerate(vocab)}
+
+    def column(values, dtype):
+        return np.array(values, dtype=dtype)[order]
+
+    score    = column([acc["suspicion_score"] for acc in accounts], np.float64)
+    patterns = column([sum(bit[p] for p in set(acc["detected_patterns"])) for acc in accounts], mask_type)
+    by_score = np.lexsort((np.arange(len(order)), -score))      # score desc, then account ID
+    rank     = np.empty(len(order), np.int64)
+    rank[by_score] = np.arange(len(order))
+    codes, postings = _trigrams(np.strings.encode(keys[order], "utf-8"))
+    tri_codes, starts = np.unique(codes, return_index=True)
+
+    arrays = {
+        "keys"       : keys[order],
+        "account_id" : ids[order],
+        "score"      : score,
+        "patterns"   : patterns,
+        "ring_id"    : column([acc["ring_id"] or "" for acc in accounts], str),
+        "inflow"     : column([acc["total_inflow"] for acc in accounts], np.float64),
+        "outflow"    : column([acc["total_outflow"] for acc in accounts], np.float64),
+        "net"        : column([acc["net_balance"] for acc in accounts], np.float64),
+        "score_rank" : rank,
+        "by_score"   : by_score.astype(np.int64),
+        "neg_score_desc": -score[by_score],
+        "patterns_desc": patterns[by_score],
+        "tri_codes"  : tri_codes,
+        "tri_offsets": np.append(starts, len(codes)).astype(np.int64),
+        "tri_postings": postings
+    }
+    return AccountIndex(arrays, vocab)
+
+
+def write_account_index(directory: str, index: AccountIndex):
+    os.makedirs(directory, exist_ok=True)
+    for name in COLUMNS:
+        np.save(os.path.join(directory, f"{name}.npy"), index.arrays[name])
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"version": INDEX_VERSION, "accounts": len(index), "patterns": index.patterns}, f)
+
+
+def open_account_index(directory: str) -> AccountIndex:
+    """Memory-maps an index written by write_account_index. Raises FileNotFoundError / ValueError."""
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != INDEX_VERSION:
+        raise ValueError(f"Unsupported index version: {meta.get('version')}")
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+              for name in COLUMNS}
+    return AccountIndex(arrays, meta["patterns"])
+
+
+class AnalysisStore:
+    """
+    Stored analyses, one directory per analysis_id under `directory` holding its account
+    search index (accounts/) and ring membership index (rings/), assembled in a temp
+    directory and renamed into place. The newest `keep` are kept on disk (shared by every
+    worker); a few are kept open per process.
+    """
+
+    OPEN_INDEXES = 8
+
+    def __init__(self, directory: str = ANALYSIS_DIR, keep: int = ANALYSIS_KEEP):
+        self.directory = directory
+        self.keep      = keep
+        self._open     = OrderedDict()
+        self._lock     = threading.Lock()       # _open is shared by threadpool requests and save()
+
+    def save(self, accounts: List[Dict], rings: List[Dict]) -> str:
+        """Stores score_accounts() / score_rings() output; returns the new analysis_id."""
+        analysis_id = uuid.uuid4().hex[:16]
+        directory   = os.path.join(self.directory, analysis_id)
+        tmp         = f"{directory}.tmp-{os.getpid()}"
+        write_account_index(os.path.join(tmp, "accounts"), build_account_index(accounts))
+        write_ring_index(os.path.join(tmp, "rings"), build_ring_index(rings))
+        os.rename(tmp, directory)
+        self._prune()
+        return analysis_id
+
+    def _prune(self):
+        stored = [entry for entry in os.scandir(self.directory) if entry.is_dir() and ".tmp-" not in entry.name]
+        stored.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in stored[self.keep:]:
+            with self._lock:
+                for part in ("accounts", "rings"):
+                    self._open.pop((entry.name, part), None)
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _cached(self, analysis_id: str, part: str, opener):
+        key = (analysis_id, part)
+        with self._lock:
+            index = self._open.get(key)
+            if index is None:
+                index = opener(os.path.join(self.directory, analysis_id, part))     # a few mmap headers
+                self._open[key] = index
+                while len(self._open) > self.OPEN_INDEXES:
+                    self._open.popitem(last=False)
+            self._open.move_to_end(key)
+            return index
+
+    def open(self, analysis_id: str) -> AccountIndex:
+        """The analysis' account search index. Raises FileNotFoundError if it is unknown or pruned."""
+        return self._cached(analysis_id, "accounts", open_account_index)
+
+    def rings(self, analysis_id: str) -> RingIndex:
+        """The analysis' ring membership index. Raises FileNotFoundError if it is unknown or pruned."""
+        return self._cached(analysis_id, "rings", open_ring_index)
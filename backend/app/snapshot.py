@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, NamedTuple, Optional
+from app.algorithms.csr import CSRGraph, csr_from_edges, save_csr, load_csr
+from app.algorithms.events import EncodedTransactions
+from app.algorithms.paths import PathIndex, build_path_index, save_path_index, load_path_index
+from app.algorithms.trace import TraceIndex, build_trace_index, save_trace_index, load_trace_index
+
+SNAPSHOT_VERSION    = 1
+TRANSACTION_COLUMNS = ("src", "dst", "time", "amount", "rows")
+
+
+class GraphSnapshot(NamedTuple):
+    """
+    A transaction graph reopened from disk. Every array is a read-only np.memmap, so
+    opening costs a few header reads regardless of size and any number of processes
+    share one copy through the page cache.
+    transactions.names is the fixed-width 'U' name array rather than a pd.Index —
+    building an Index would read every name; use name_index() where lookups are needed.
+    """
+    directory: str
+    transactions: EncodedTransactions
+    csr: CSRGraph
+    meta: Dict
+
+    def name_index(self) -> pd.Index:
+        return pd.Index(self.transactions.names)
+
+
+class AccountLookup(NamedTuple):
+    """
+    Account names sorted, with their codes: one name resolves by binary search over the
+    memory-mapped arrays, without reading (or hashing) every name as name_index() does.
+    """
+    sorted_names: np.ndarray
+    sorted_codes: np.ndarray
+
+    def code(self, name: str) -> Optional[int]:
+        pos = int(np.searchsorted(self.sorted_names, name))
+        if pos < len(self.sorted_names) and self.sorted_names[pos] == name:
+            return int(self.sorted_codes[pos])
+        return None
+
+
+def build_account_lookup(names: np.ndarray) -> AccountLookup:
+    names   = np.asarray(names, dtype=str)
+    by_name = np.argsort(names, kind="stable")
+    return AccountLookup(names[by_name], by_name.astype(np.int64))
+
+
+def save_account_lookup(directory: str, lookup: AccountLookup):
+    os.makedirs(directory, exist_ok=True)
+    for name in AccountLookup._fields:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(lookup, name))
+
+
+def load_account_lookup(directory: str) -> AccountLookup:
+    """Memory-maps a saved AccountLookup. Raises FileNotFoundError."""
+    return AccountLookup(*(_mapped(os.path.join(directory, f"{name}.npy")) for name in AccountLookup._fields))
+
+
+def _tmp_name(directory: str) -> str:
+    """A private sibling temp path: unique per process and per call, so concurrent builders never share one."""
+    return f"{directory}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def write_snapshot(directory: str, enc: EncodedTransactions, csr: Optional[CSRGraph] = None) -> str:
+    """
+    Writes encoded transactions, their CSR adjacency and the account-name dictionary as .npy
+    files under `directory`. The snapshot is assembled in a sibling temp directory and renamed
+    into place, so readers never observe a partial snapshot; if `directory` already exists
+    (another writer got there first) it is left untouched.
+    """
+    if os.path.exists(directory):
+        return directory
+
+    if csr is None:
+        csr = csr_from_edges(enc.src, enc.dst, enc.amount, len(enc.names))
+
+    tmp = _tmp_name(directory)
+    os.makedirs(os.path.join(tmp, "transactions"), exist_ok=True)
+
+    for name in TRANSACTION_COLUMNS:
+        np.save(os.path.join(tmp, "transactions", f"{name}.npy"), np.asarray(getattr(enc, name)))
+    np.save(os.path.join(tmp, "names.npy"), np.asarray(enc.names, dtype=str))
+    save_csr(os.path.join(tmp, "csr"), csr)
+    save_account_lookup(os.path.join(tmp, "lookup"), build_account_lookup(enc.names))
+    save_path_index(os.path.join(tmp, "paths"), build_path_index(enc, csr))
+    save_trace_index(os.path.join(tmp, "trace"), build_trace_index(enc))
+
+    meta = {
+        "version"      : SNAPSHOT_VERSION,
+        "transactions" : len(enc.src),
+        "accounts"     : len(enc.names),
+        "csr_edges"    : csr.n_edges
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return directory
+
+
+def open_snapshot(directory: str) -> GraphSnapshot:
+    """Memory-maps a snapshot written by write_snapshot. Raises FileNotFoundError / ValueError."""
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {meta.get('version')}")
+
+    # Plain ndarray views over the maps: same pages, but results of the detectors' array
+    # ops are ordinary arrays instead of np.memmap subclasses
+    columns = {
+        name: _mapped(os.path.join(directory, "transactions", f"{name}.npy"))
+        for name in TRANSACTION_COLUMNS
+    }
+    names = _mapped(os.path.join(directory, "names.npy"))
+    enc   = EncodedTransactions(columns["src"], columns["dst"], columns["time"], columns["amount"],
+                                names, columns["rows"])
+    return GraphSnapshot(directory, enc, load_csr(os.path.join(directory, "csr")), meta)
+
+
+def _mapped(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode="r").view(np.ndarray)
+
+
+def derived_index(snap: GraphSnapshot, name: str, load: Callable[[str], object], build: Callable[[], object],
+                   save: Callable[[str, object], None]):
+    """
+    Loads the index stored in snap.directory/name. Snapshots written before it existed get
+    it built from their arrays on first use and saved alongside (renamed into place).
+    """
+    directory = os.path.join(snap.directory, name)
+    try:
+        return load(directory)
+    except FileNotFoundError:
+        tmp = _tmp_name(directory)
+        save(tmp, build())
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return load(directory)
+
+
+def open_account_lookup(snap: GraphSnapshot) -> AccountLookup:
+    """Name -> code lookup for the snapshot's accounts."""
+    return derived_index(snap, "lookup", load_account_lookup, lambda: build_account_lookup(snap.transactions.names),
+                          save_account_lookup)
+
+
+def open_path_index(snap: GraphSnapshot) -> PathIndex:
+    """The snapshot's path-query adjacency."""
+    return derived_index(snap, "paths", lambda d: load_path_index(d, snap.csr),
+                          lambda: build_path_index(snap.transactions, snap.csr), save_path_index)
+
+
+def open_trace_index(snap: GraphSnapshot) -> TraceIndex:
+    """The snapshot's per-account, time-sorted transaction index for fund traces."""
+    return derived_index(snap, "trace", load_trace_index, lambda: build_trace_index(snap.transactions),
+                          save_trace_index)
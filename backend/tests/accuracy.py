@@ -0,0 +1,164 @@
+"""
+Detection accuracy at scale: runs the in-memory detector pipeline over generated datasets
+with known injected rings, under a grid of detector settings, and reports recall,
+precision, rings/second and peak memory together.
+
+Run from backend/:
+
+    python -m tests.accuracy                                        # default grid (8 settings), 20k rows
+    python -m tests.accuracy --sizes 20k,200k --cycle-len 3-5,3-6 --cap-multiplier 1,2,4 \\
+        --smurf 72:10,48:10,72:15 -o accuracy.json
+
+A produced ring (score_rings output, i.e. the API's fraud_rings) matches an injected one
+of the same pattern_type when their member sets overlap by at least --min-jaccard —
+detectors report the part of a ring they can see (a smurf window's first senders, a
+shell chain's intermediates), not necessarily every injected account.
+Recall counts injected rings matched; detector_recall is the same before score_rings
+(its ID-based de-duplication can drop rings). Precision counts produced rings that match
+an injected ring; background traffic also forms genuine cycles, so precision is relative
+to what was injected and is most useful for comparing settings on the same dataset.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import pandas as pd
+from typing import Dict, List
+from app.algorithms.csr import csr_from_edges
+from app.algorithms.events import encode_transactions
+from app.metrics import AnalysisMetrics
+from app.pipeline import build_graph, detect_component_rings, detect_global_rings, DetectorSettings
+from app.scoring import score_rings, csr_ring_value
+from tests.benchmark import BENCH_DATA_DIR, parse_size
+from tests.generate_data import generate_synthetic_data
+
+
+def dataset(rows: int, seed: int = 0) -> str:
+    """Cached accuracy dataset: hub-heavy traffic, 3-6 hop cycles (some through hubs), all pattern kinds."""
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DATA_DIR, f"accuracy_{rows}_{seed}.csv")
+    if not os.path.exists(path):
+        generate_synthetic_data(path, rows=rows, accounts=max(100, rows // 4), hub_exponent=0.8,
+                                cycles=max(10, rows // 1000), cycle_len=(3, 6), cycle_hub_share=0.3,
+                                fan_in=max(2, rows // 10000), fan_out=max(2, rows // 10000),
+                                shells=max(5, rows // 2000), shell_hops=3, seed=seed)
+    return path
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b)
+
+
+def match_rings(produced: List[Dict], truth: List[Dict], min_jaccard: float = 0.5) -> Dict:
+    """Recall / precision (overall and per pattern_type) of produced rings against injected ones."""
+    by_type = {}
+    for ring in produced:
+        by_type.setdefault(ring["pattern_type"], []).append(frozenset(ring["member_accounts"]))
+
+    found = {}                              # pattern -> [matched, injected]
+    hits  = set()                           # (pattern, produced member set) that matched something
+    for ring in truth:
+        members = frozenset(ring["member_accounts"])
+        counts  = found.setdefault(ring["pattern_type"], [0, 0])
+        counts[1] += 1
+        matches = [p for p in by_type.get(ring["pattern_type"], []) if jaccard(members, p) >= min_jaccard]
+        if matches:
+            counts[0] += 1
+            hits.update((ring["pattern_type"], p) for p in matches)
+
+    matched  = sum(c[0] for c in found.values())
+    positive = sum(1 for ring in produced if (ring["pattern_type"], frozenset(ring["member_accounts"])) in hits)
+    return {
+        "recall"    : round(matched / len(truth), 4) if truth else None,
+        "precision" : round(positive / len(produced), 4) if produced else None,
+        "recall_by_type": {pattern: round(c[0] / c[1], 4) for pattern, c in sorted(found.items())},
+        "rings_injected": len(truth),
+        "rings_produced": len(produced)
+    }
+
+
+def evaluate(path: str, grid: List[DetectorSettings], min_jaccard: float) -> List[Dict]:
+    with open(f"{path}.truth.json") as f:
+        truth = json.load(f)["rings"]
+
+    df = pd.read_csv(path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    graph = build_graph(df)
+    enc   = encode_transactions(df)
+    ring_value = csr_ring_value(csr_from_edges(enc.src, enc.dst, enc.amount, len(enc.names)), enc.names)
+
+    results = []
+    for settings in grid:
+        metrics = AnalysisMetrics()
+        with metrics.stage("detection"):
+            rings = detect_component_rings(df, graph, settings=settings, enc=enc) + detect_global_rings(df, enc)
+            produced, _ = score_rings(rings, ring_value)
+        seconds  = metrics.stages["detection"]["wall_seconds"]
+        detected = [{"pattern_type": r["type"], "member_accounts": r["members"]} for r in rings]
+        results.append({
+            "rows"           : len(df),
+            "settings"       : settings._asdict(),
+            "seconds"        : round(seconds, 3),
+            "rings_per_second": round(len(produced) / max(seconds, 1e-9), 1),
+            "peak_rss_mb"    : round(metrics.peak_rss() / 2**20, 1),
+            **match_rings(produced, truth, min_jaccard),
+            "detector_recall": match_rings(detected, truth, min_jaccard)["recall"]
+        })
+        print(f"  {_label(settings)}: recall {results[-1]['recall']}, precision {results[-1]['precision']}, "
+              f"{seconds:.2f}s")
+    return results
+
+
+def _label(settings: DetectorSettings) -> str:
+    return (f"cycles {settings.cycle_min_len}-{settings.cycle_max_len} cap x{settings.cap_multiplier:g} "
+            f"smurf {settings.smurf_window_hours:g}h/{settings.smurf_count_threshold}")
+
+
+def settings_grid(cycle_lens: str, cap_multipliers: str, smurfs: str) -> List[DetectorSettings]:
+    """Cartesian product of '3-5,3-6' x '1,2,4' x '72:10,48:10'."""
+    lens  = [tuple(int(x) for x in item.split("-")) for item in cycle_lens.split(",")]
+    caps  = [float(item) for item in cap_multipliers.split(",")]
+    smurf = [(float(w), int(t)) for w, t in (item.split(":") for item in smurfs.split(","))]
+    return [DetectorSettings(lo, hi, cap, window, threshold)
+            for (lo, hi), cap, (window, threshold) in itertools.product(lens, caps, smurf)]
+
+
+def print_table(results: List[Dict]):
+    print(f"\n{'rows':>9}  {'settings':<40}{'recall':>8}{'detector':>10}{'precision':>11}{'seconds':>9}"
+          f"{'rings/s':>10}{'peak MB':>9}")
+    for r in results:
+        label = _label(DetectorSettings(**r["settings"]))
+        print(f"{r['rows']:>9,}  {label:<40}{r['recall']:>8}{r['detector_recall']:>10}{r['precision']:>11}"
+              f"{r['seconds']:>9.2f}"
+              f"{r['rings_per_second']:>10,.0f}{r['peak_rss_mb']:>9.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Recall / precision / cost of detector settings on generated data.")
+    parser.add_argument("--sizes", default="20k", help="comma-separated row counts, e.g. 20k,200k")
+    parser.add_argument("--cycle-len", default="3-5,3-6", help="cycle length bounds to try, e.g. 3-5,3-6")
+    parser.add_argument("--cap-multiplier", default="1,2", help="get_dynamic_outdegree_cap multipliers to try")
+    parser.add_argument("--smurf", default="72:10,48:10", help="smurf window_hours:count_threshold pairs")
+    parser.add_argument("--min-jaccard", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="accuracy_results.json")
+    args = parser.parse_args()
+
+    grid    = settings_grid(args.cycle_len, args.cap_multiplier, args.smurf)
+    results = []
+    for rows in sorted(parse_size(s) for s in args.sizes.split(",")):
+        print(f"Evaluating {len(grid)} settings on {rows:,} rows...")
+        results.extend(evaluate(dataset(rows, args.seed), grid, args.min_jaccard))
+
+    with open(args.output, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "min_jaccard": args.min_jaccard,
+                   "results": results}, f, indent=1)
+    print_table(results)
+    print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
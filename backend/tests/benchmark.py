@@ -0,0 +1,258 @@
+"""
+Benchmark suite: times the detector stages and the full /analyze request over generated
+datasets of growing size, records throughput and peak memory, and fails on regressions.
+
+Run from backend/:
+
+    python -m tests.benchmark                                   # 10k + 100k rows vs the baseline
+    python -m tests.benchmark --sizes 10k,100k,1M,10M -o bench.json
+    python -m tests.benchmark --update-baseline                 # after an intended change
+
+Datasets come from tests/generate_data.py (uniform degrees, 5 transactions per account,
+patterns scaled with the size) and are cached in BENCH_DATA_DIR. A stage regresses when it
+is slower than `tolerance` x its baseline time (best of --repeat runs, and by more than
+MIN_REGRESSION_SECONDS, so tiny stages don't fail on timer noise), or grows RSS past
+`memory_tolerance` x baseline.
+Baselines are machine-specific: regenerate benchmark_baseline.json on the machine that
+runs the check. Sizes whose /analyze would exceed the memory budget (app.admission) are
+skipped and reported as such.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from fastapi.testclient import TestClient
+from app.admission import MemoryBudget, estimate_peak_bytes
+from app.algorithms.csr import csr_from_edges
+from app.algorithms.events import encode_transactions
+from app.algorithms.graph_dsa import find_cycles_dfs
+from app.algorithms.structuring_dsa import detect_structuring
+from app.algorithms.temporal_dsa import detect_smurfing, detect_pass_through_shells, gather_scatter_rings
+from app.metrics import AnalysisMetrics, current_rss
+from app.pipeline import build_graph, CYCLE_MIN_LEN, CYCLE_MAX_LEN, SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD, \
+    GATHER_SCATTER_GAP_HOURS, SHELL_MIN_HOPS, SHELL_MAX_GAP_HOURS, SHELL_MAX_HAIRCUT, SHELL_MAX_DEGREE, \
+    STRUCTURING_THRESHOLDS, STRUCTURING_MARGIN, STRUCTURING_WINDOW_HOURS, STRUCTURING_COUNT_THRESHOLD
+from app.scoring import score_rings, score_accounts, csr_ring_value
+from tests.generate_data import generate_synthetic_data
+
+BASELINE_FILE          = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+BENCH_DATA_DIR         = os.getenv("BENCH_DATA_DIR", os.path.join(tempfile.gettempdir(), "mule_bench"))
+DEFAULT_SIZES          = "10k,100k"
+MIN_REGRESSION_SECONDS = 0.1
+MIN_REGRESSION_MB      = 16.0
+STAGES = ("parse", "graph_build", "find_cycles_dfs", "detect_smurfing", "gather_scatter_rings",
+          "detect_pass_through_shells", "detect_structuring", "scoring", "analyze")
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 10**3, "m": 10**6}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def dataset(rows: int, seed: int = 0) -> str:
+    """Path of the cached benchmark dataset for `rows`, generating it on first use."""
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DATA_DIR, f"bench_{rows}_{seed}.csv")
+    if not os.path.exists(path):
+        generate_synthetic_data(path, rows=rows, accounts=max(100, rows // 5), cycles=max(5, rows // 2000),
+                                fan_in=max(1, rows // 10000), fan_out=max(1, rows // 10000),
+                                shells=max(3, rows // 3000), seed=seed)
+    return path
+
+
+class _Timer:
+    """Runs stages under one AnalysisMetrics and keeps the best of `repeat` runs per stage."""
+
+    def __init__(self, rows: int, repeat: int):
+        self.rows    = rows
+        self.repeat  = repeat
+        self.results = []
+
+    def run(self, name: str, fn, *args):
+        best, value = None, None
+        for _ in range(self.repeat):
+            gc.collect()
+            metrics = AnalysisMetrics()
+            before  = current_rss() or 0
+            with metrics.stage(name):
+                value = fn(*args)
+            entry = metrics.stages[name]
+            if best is None or entry["wall_seconds"] < best["wall_seconds"]:
+                best = dict(entry, rss_before=before)
+        self.results.append({
+            "rows"           : self.rows,
+            "stage"          : name,
+            "seconds"        : round(best["wall_seconds"], 4),
+            "cpu_seconds"    : round(best["cpu_seconds"], 4),
+            "rows_per_second": round(self.rows / max(best["wall_seconds"], 1e-9)),
+            "peak_rss_mb"    : round(best["peak_rss"] / 2**20, 1),
+            "rss_growth_mb"  : round(max(0, best["peak_rss"] - best["rss_before"]) / 2**20, 1),
+            "output"         : value.ecount() if hasattr(value, "ecount") else len(value)
+        })
+        return value
+
+    def skip(self, name: str, reason: str):
+        self.results.append({"rows": self.rows, "stage": name, "skipped": reason})
+
+
+def _parse(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+
+def _score(df: pd.DataFrame, rings: List[Dict]) -> List[Dict]:
+    enc = encode_transactions(df)
+    csr = csr_from_edges(enc.src, enc.dst, enc.amount, len(enc.names))
+    inflow  = df.groupby(df['receiver_id'].astype(str))['amount'].sum().to_dict()
+    outflow = df.groupby(df['sender_id'].astype(str))['amount'].sum().to_dict()
+    formatted, memberships = score_rings(rings, csr_ring_value(csr, enc.names))
+    return score_accounts(memberships, inflow, outflow, {})
+
+
+def _analyze(client: TestClient, path: str) -> List[Dict]:
+    with open(path, "rb") as f:
+        response = client.post("/analyze", files={"file": (os.path.basename(path), f, "text/csv")})
+    response.raise_for_status()
+    return response.json()["fraud_rings"]
+
+
+def bench_size(rows: int, repeat: int = 3, seed: int = 0, client: Optional[TestClient] = None) -> List[Dict]:
+    path  = dataset(rows, seed)
+    timer = _Timer(rows, repeat)
+
+    need = estimate_peak_bytes(os.path.getsize(path))
+    if need > MemoryBudget().capacity:
+        reason = f"needs ~{need / 2**30:.1f} GB, over the memory budget"
+        for name in STAGES:
+            timer.skip(name, reason)
+        return timer.results
+
+    df     = timer.run("parse", _parse, path)
+    graph  = timer.run("graph_build", build_graph, df)
+    cycles = timer.run("find_cycles_dfs", find_cycles_dfs, graph, CYCLE_MIN_LEN, CYCLE_MAX_LEN)
+    smurfs = timer.run("detect_smurfing", detect_smurfing, df, SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD)
+    enc    = encode_transactions(df)
+    layers = timer.run("gather_scatter_rings", gather_scatter_rings, enc, SMURF_WINDOW_HOURS, SMURF_COUNT_THRESHOLD,
+                       GATHER_SCATTER_GAP_HOURS)
+    shells = timer.run("detect_pass_through_shells", detect_pass_through_shells, df, SHELL_MIN_HOPS,
+                       SHELL_MAX_GAP_HOURS, SHELL_MAX_HAIRCUT, SHELL_MAX_DEGREE)
+    structs = timer.run("detect_structuring", detect_structuring, df, STRUCTURING_THRESHOLDS, STRUCTURING_MARGIN,
+                        STRUCTURING_WINDOW_HOURS, STRUCTURING_COUNT_THRESHOLD)
+    timer.run("scoring", _score, df, cycles + smurfs + layers + shells + structs)
+
+    # Free this process's copy before the request builds its own
+    del df, graph, enc, cycles, smurfs, layers, shells, structs
+    timer.run("analyze", _analyze, client or TestClient(_app()), path)
+    return timer.results
+
+
+def _app():
+    from app.main import app
+    return app
+
+
+def scaling(results: List[Dict]) -> Dict[str, Optional[float]]:
+    """Per stage, the log-log slope of seconds over rows (1.0 = linear scaling)."""
+    exponents = {}
+    for name in STAGES:
+        points = [(r["rows"], r["seconds"]) for r in results
+                  if r["stage"] == name and "skipped" not in r and r["seconds"] > 0]
+        if len({rows for rows, _ in points}) < 2:
+            continue
+        rows, seconds = np.log(np.array(points, dtype=float)).T
+        exponents[name] = round(float(np.polyfit(rows, seconds, 1)[0]), 2)
+    return exponents
+
+
+def regressions(results: List[Dict], baseline: List[Dict], tolerance: float,
+                memory_tolerance: float) -> List[str]:
+    """Human-readable regressions of `results` against matching (rows, stage) baseline entries."""
+    base  = {(b["rows"], b["stage"]): b for b in baseline if "skipped" not in b}
+    found = []
+    for r in results:
+        b = base.get((r["rows"], r["stage"]))
+        if b is None or "skipped" in r:
+            continue
+        if r["seconds"] > b["seconds"] * tolerance and r["seconds"] - b["seconds"] > MIN_REGRESSION_SECONDS:
+            found.append(f"{r['stage']} @ {r['rows']:,} rows: {r['seconds']:.3f}s vs baseline {b['seconds']:.3f}s")
+        if (r["rss_growth_mb"] > b["rss_growth_mb"] * memory_tolerance and
+                r["rss_growth_mb"] - b["rss_growth_mb"] > MIN_REGRESSION_MB):
+            found.append(f"{r['stage']} @ {r['rows']:,} rows: +{r['rss_growth_mb']:.0f} MB RSS "
+                         f"vs baseline +{b['rss_growth_mb']:.0f} MB")
+    return found
+
+
+def print_table(results: List[Dict], exponents: Dict[str, float]):
+    print(f"\n{'stage':<28}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'peak MB':>10}{'+RSS MB':>10}")
+    for name in STAGES:
+        for r in (r for r in results if r["stage"] == name):
+            if "skipped" in r:
+                print(f"{name:<28}{r['rows']:>12,}  skipped: {r['skipped']}")
+                continue
+            print(f"{name:<28}{r['rows']:>12,}{r['seconds']:>10.3f}{r['rows_per_second']:>12,}"
+                  f"{r['peak_rss_mb']:>10.1f}{r['rss_growth_mb']:>10.1f}")
+        if name in exponents:
+            print(f"{'':<28}{'scaling':>12}{'rows^' + str(exponents[name]):>10}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark detector stages and /analyze; fail on regressions.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 10k,100k,1M,10M")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown factor per stage")
+    parser.add_argument("--memory-tolerance", type=float, default=1.25, help="allowed RSS growth factor per stage")
+    args = parser.parse_args()
+
+    client  = TestClient(_app())
+    results = []
+    for rows in sorted(parse_size(s) for s in args.sizes.split(",")):
+        print(f"Benchmarking {rows:,} rows...")
+        results.extend(bench_size(rows, args.repeat, args.seed, client))
+
+    exponents = scaling(results)
+    document  = {
+        "created" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine" : {"platform": platform.platform(), "python": platform.python_version(),
+                     "cpus": os.cpu_count()},
+        "results" : results,
+        "scaling_exponents": exponents
+    }
+    with open(args.output, "w") as f:
+        json.dump(document, f, indent=1)
+    print_table(results, exponents)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=1)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against (run with --update-baseline).")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    found = regressions(results, baseline, args.tolerance, args.memory_tolerance)
+    for line in found:
+        print(f"REGRESSION: {line}")
+    if not found:
+        print(f"No regressions against {args.baseline}.")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,126 +1,368 @@
-import pandas as pd
+"""
+Synthetic transaction generator for tests, benchmarks and load tests.
+
+Everything is vectorized with NumPy and written in chunks, so memory stays flat and
+100M rows take a few minutes:
+
+    python generate_data.py                                  # the 10k test file
+    python generate_data.py --rows 100000000 --accounts 5000000 --hub-exponent 1.1 \\
+        --cycles 2000 --fan-in 500 --fan-out 500 --shells 1000 --seed 7 -o load_100m.csv
+
+Background traffic is drawn between ACC_NORM_* accounts; --hub-exponent > 0 gives a
+power-law (Zipf) degree distribution, so a few hub accounts carry most of the traffic.
+Known laundering patterns are injected on dedicated accounts, and every injected ring
+is listed in <output>.truth.json using the API's ring fields (pattern_type,
+member_accounts). Rows come out in chronological order, like a database export.
+Parquet output (-o x.parquet or --format parquet) needs pyarrow.
+"""
+import argparse
+import json
+import os
+import time
 import numpy as np
-import uuid
-from datetime import datetime, timedelta
-import random
 
 # Constants
 TOTAL_TRANSACTIONS = 10000
-START_DATE = datetime(2026, 2, 1)
-
-def random_date(start, end):
-    return start + timedelta(seconds=random.randint(0, int((end - start).total_seconds())))
-
-def generate_synthetic_data():
-    transactions = []
-    
-    # 1. Generate Baseline "Legitimate" Noise
-    # Creates thousands of normal accounts trading back and forth
-    print("Generating baseline transactions...")
-    normal_accounts = [f"ACC_NORM_{i}" for i in range(2000)]
-    for _ in range(TOTAL_TRANSACTIONS - 200): # Reserve 200 for fraud patterns
-        t_time = random_date(START_DATE, START_DATE + timedelta(days=30))
-        transactions.append({
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-            "sender_id": random.choice(normal_accounts),
-            "receiver_id": random.choice(normal_accounts),
-            "amount": round(random.uniform(10.0, 5000.0), 2),
-            "timestamp": t_time.strftime("%Y-%m-%d %H:%M:%S")
-        })
-
-    # 2. Inject Pattern 1: Circular Fund Routing (Cycles 3-5 hops)
-    print("Injecting Cycle Patterns...")
-    for cycle_id in range(5):
-        length = random.randint(3, 5) # Detect cycles of length 3 to 5
-        cycle_nodes = [f"ACC_CYC_{cycle_id}_{i}" for i in range(length)]
-        base_amount = round(random.uniform(1000, 5000), 2)
-        
-        for i in range(length):
-            sender = cycle_nodes[i]
-            receiver = cycle_nodes[(i + 1) % length] # Loop back to start
-            # Keep times sequential
-            t_time = START_DATE + timedelta(days=cycle_id, hours=i)
-            transactions.append({
-                "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-                "sender_id": sender,
-                "receiver_id": receiver,
-                "amount": base_amount - (i * 10), # Slight decay for realism
-                "timestamp": t_time.strftime("%Y-%m-%d %H:%M:%S")
-            })
-
-    # 3. Inject Pattern 2: Smurfing (Fan-in and Fan-out within 72 hrs)
-    print("Injecting Smurfing Patterns...")
-    # Fan-in: Multiple accounts send to one aggregator (10+ senders -> 1 receiver)
-    aggregator = "ACC_SMURF_AGGREGATOR"
-    base_time_fan_in = START_DATE + timedelta(days=10)
-    for i in range(15): # 15 senders to guarantee it hits the 10+ threshold
-        sender = f"ACC_SMURF_IN_{i}"
-        # Transactions within a 72-hour window are more suspicious
-        t_time = base_time_fan_in + timedelta(hours=random.randint(1, 70)) 
-        transactions.append({
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-            "sender_id": sender,
-            "receiver_id": aggregator,
-            "amount": round(random.uniform(9000.0, 9900.0), 2), # Just under typical 10k reporting thresholds
-            "timestamp": t_time.strftime("%Y-%m-%d %H:%M:%S")
-        })
-
-    # Fan-out: One account disperses to many receivers (1 sender -> 10+ receivers)
-    disperser = "ACC_SMURF_DISPERSER"
-    base_time_fan_out = START_DATE + timedelta(days=15)
-    for i in range(12):
-        receiver = f"ACC_SMURF_OUT_{i}"
-        t_time = base_time_fan_out + timedelta(hours=random.randint(1, 70))
-        transactions.append({
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-            "sender_id": disperser,
-            "receiver_id": receiver,
-            "amount": round(random.uniform(500.0, 800.0), 2),
-            "timestamp": t_time.strftime("%Y-%m-%d %H:%M:%S")
-        })
-
-    # 4. Inject Pattern 3: Layered Shell Networks
-    # Chains of 3+ hops where intermediate accounts have only 2-3 total transactions
-    print("Injecting Layered Shell Networks...")
-    for shell_chain in range(3):
-        src = f"ACC_SHELL_SRC_{shell_chain}"
-        shell1 = f"ACC_SHELL_INT1_{shell_chain}"
-        shell2 = f"ACC_SHELL_INT2_{shell_chain}"
-        dst = f"ACC_SHELL_DST_{shell_chain}"
-        
-        chain_time = START_DATE + timedelta(days=20+shell_chain)
-        
-        # Hop 1: Src -> Shell1
-        transactions.append({
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-            "sender_id": src, "receiver_id": shell1,
-            "amount": 5000.00, "timestamp": (chain_time).strftime("%Y-%m-%d %H:%M:%S")
-        })
-        # Hop 2: Shell1 -> Shell2 (Shell1 now has exactly 2 transactions: 1 in, 1 out)
-        transactions.append({
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-            "sender_id": shell1, "receiver_id": shell2,
-            "amount": 4950.00, "timestamp": (chain_time + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
-        })
-        # Hop 3: Shell2 -> Dst (Shell2 now has exactly 2 transactions: 1 in, 1 out)
-        transactions.append({
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:8]}",
-            "sender_id": shell2, "receiver_id": dst,
-            "amount": 4900.00, "timestamp": (chain_time + timedelta(hours=4)).strftime("%Y-%m-%d %H:%M:%S")
-        })
-
-    # Compile and shuffle so the fraud isn't clumped at the bottom of the CSV
-    print("Compiling and shuffling dataset...")
-    df = pd.DataFrame(transactions)
-    
-    # Sort by timestamp to simulate a real chronological database export
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.sort_values(by='timestamp').reset_index(drop=True)
-    
-    # Export to CSV
-    filename = "test_10k_transactions.csv"
-    df.to_csv(filename, index=False)
-    print(f"Dataset successfully generated: {filename} with {len(df)} rows.")
+START_DATE = np.datetime64("2026-02-01T00:00:00", "s")
+CHUNK_ROWS = 1_000_000
+HOUR = 3600
+
+# Injected pattern shapes (sized to clear the detector thresholds in app.pipeline)
+SMURF_SENDERS   = 15        # fan-in senders / fan-out receivers per ring, within SMURF_WINDOW_HOURS
+SMURF_SPREAD    = 70 * HOUR
+
+
+# --- Vectorized CSV formatting: each row is built as a byte matrix whose padding is 0 ---
+
+def _digits(values: np.ndarray, width: int, keep: int = 1) -> np.ndarray:
+    """ASCII digits of non-negative ints as an (n, width) uint8 matrix, leading zeros blanked to 0."""
+    values = values.astype(np.int64)
+    out    = np.empty((len(values), width), dtype=np.uint8)
+    rest   = values.copy()
+    for pos in range(width - 1, -1, -1):
+        out[:, pos] = rest % 10 + 48
+        rest //= 10
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    lead   = values[:, None] < powers
+    lead[:, width - keep:] = False
+    out[lead] = 0
+    return out
+
+
+def _literal(text: bytes, n: int) -> np.ndarray:
+    return np.broadcast_to(np.frombuffer(text, dtype=np.uint8), (n, len(text)))
+
+
+def _name_matrix(names: np.ndarray) -> np.ndarray:
+    """Fixed-width bytes ('S') account names as an (accounts, width) uint8 matrix, NUL-padded."""
+    return names.view(np.uint8).reshape(len(names), names.dtype.itemsize)
+
+
+def _timestamps(seconds: np.ndarray) -> np.ndarray:
+    """'YYYY-MM-DD HH:MM:SS' rows for offsets from START_DATE (each distinct second formatted once)."""
+    unique, inverse = np.unique(seconds, return_inverse=True)
+    text = (START_DATE + unique.astype("timedelta64[s]")).astype("S19")
+    text = text.view(np.uint8).reshape(len(unique), 19).copy()
+    text[:, 10] = ord(" ")
+    return text[inverse]
+
+
+def _fields(chunk: dict, name_bytes: np.ndarray) -> dict:
+    """Per-column byte matrices of a chunk (variable-width fields keep NUL padding)."""
+    n = len(chunk["txn"])
+    return {
+        "transaction_id": np.concatenate([_literal(b"TXN_", n), _digits(chunk["txn"], 10)], axis=1),
+        "sender_id"     : name_bytes[chunk["src"]],
+        "receiver_id"   : name_bytes[chunk["dst"]],
+        "amount"        : np.concatenate([_digits(chunk["cents"] // 100, 9), _literal(b".", n),
+                                          _digits(chunk["cents"] % 100, 2, keep=2)], axis=1),
+        "timestamp"     : _timestamps(chunk["time"])
+    }
+
+
+def _csv_bytes(fields: dict) -> bytes:
+    n     = len(fields["timestamp"])
+    parts = []
+    for column in ("transaction_id", "sender_id", "receiver_id", "amount", "timestamp"):
+        parts.extend([fields[column], _literal(b",", n)])
+    parts[-1] = _literal(b"\n", n)
+    rows = np.concatenate(parts, axis=1)
+    return rows[rows != 0].tobytes()
+
+
+# --- Accounts and patterns ---
+
+def _names(prefix: str, *ids: np.ndarray) -> np.ndarray:
+    """prefix_id1_id2..., as fixed-width bytes."""
+    out = np.full(len(ids[0]), prefix.encode())
+    for part in ids:
+        out = np.strings.add(np.strings.add(out, b"_"), part.astype("S"))
+    return out
+
+
+class _Accounts:
+    """Name registry: background accounts first, then one block per injected pattern."""
+
+    def __init__(self, n_normal: int):
+        self.blocks = [_names("ACC_NORM", np.arange(n_normal))]
+        self.size   = n_normal
+
+    def add(self, prefix: str, *ids: np.ndarray) -> np.ndarray:
+        block = _names(prefix, *ids)
+        codes = np.arange(self.size, self.size + len(block))
+        self.blocks.append(block)
+        self.size += len(block)
+        return codes
+
+    def names(self) -> np.ndarray:
+        width = max(block.dtype.itemsize for block in self.blocks)
+        return np.concatenate([block.astype(f"S{width}") for block in self.blocks])
+
+
+def _ring(ring_id: str, pattern: str, members: np.ndarray, names: np.ndarray) -> dict:
+    return {"ring_id": ring_id, "pattern_type": pattern,
+            "member_accounts": sorted(n.decode() for n in names[members])}
+
+
+def inject_patterns(rng: np.random.Generator, accounts: _Accounts, span: int, cycles: int, cycle_len: tuple,
+                    fan_in: int, fan_out: int, shells: int, shell_hops: int, cycle_hub_share: float = 0.0,
+                    draw_background=None):
+    """
+    Builds the pattern rows (code / cents / second arrays) and a truth entry per ring:
+      cycles    A0 -> A1 -> ... -> A0, one hop an hour, amounts decaying slightly; in a
+                cycle_hub_share of them A0 is a background account drawn by activity, so
+                busy hubs sit on some cycles (they are what the out-degree cap prunes)
+      fan-in    SMURF_SENDERS senders -> 1 aggregator within 70h, each deposit just under
+                10,000 — so every fan-in ring is also a Structuring ring
+      fan-out   1 disperser -> SMURF_SENDERS receivers within 70h
+      shells    SRC -> INT1 -> ... -> DST, 2h per hop, ~1% haircut, intermediates used once
+    Truth entries are (id prefix, number, pattern, member codes), named once all accounts exist.
+    """
+    src, dst, cents, secs, truth = [], [], [], [], []
+
+    def emit(s, d, c, t):
+        src.append(s.ravel()); dst.append(d.ravel()); cents.append(c.ravel()); secs.append(t.ravel())
+
+    # Cycles, grouped by length so each group is one array operation
+    lengths = rng.integers(cycle_len[0], cycle_len[1] + 1, cycles)
+    for length in np.unique(lengths):
+        idx     = np.flatnonzero(lengths == length)
+        members = accounts.add("ACC_CYC", np.repeat(idx, length), np.tile(np.arange(length), len(idx)))
+        members = members.reshape(len(idx), length)
+        via_hub = rng.random(len(idx)) < cycle_hub_share
+        members[via_hub, 0] = draw_background(int(via_hub.sum()))
+        start   = rng.integers(0, span - length * HOUR, len(idx))[:, None]
+        hop     = np.arange(length)
+        base    = rng.integers(100_000, 500_000, len(idx))[:, None]
+        emit(members, np.roll(members, -1, axis=1), base - hop * 1000, start + hop * HOUR)
+        truth.extend(("CYCLE", i, "Cycle", row) for i, row in zip(idx, members))
+
+    # Smurfing fan-in (also structuring) and fan-out
+    for kind, count in (("IN", fan_in), ("OUT", fan_out)):
+        if not count:
+            continue
+        ring  = np.arange(count)
+        hubs  = accounts.add(f"ACC_SMURF_{'AGG' if kind == 'IN' else 'DISP'}", ring)
+        peers = accounts.add(f"ACC_SMURF_{kind}", np.repeat(ring, SMURF_SENDERS),
+                             np.tile(np.arange(SMURF_SENDERS), count)).reshape(count, SMURF_SENDERS)
+        start = rng.integers(0, span - SMURF_SPREAD - HOUR, count)[:, None]
+        when  = start + rng.integers(HOUR, SMURF_SPREAD, (count, SMURF_SENDERS))
+        hub   = np.broadcast_to(hubs[:, None], peers.shape)
+        if kind == "IN":
+            emit(peers, hub, rng.integers(900_000, 990_000, peers.shape), when)
+        else:
+            emit(hub, peers, rng.integers(50_000, 80_000, peers.shape), when)
+        for i, (h, p) in enumerate(zip(hubs, peers)):
+            members = np.append(p, h)
+            truth.append((f"FAN_{kind}", i, f"Smurfing (Fan-{kind.title()})", members))
+            if kind == "IN":
+                truth.append(("STRUCTURING", i, "Structuring", members))
+
+    # Layered shell chains
+    if shells:
+        ring   = np.arange(shells)
+        chain  = np.column_stack(
+            [accounts.add("ACC_SHELL_SRC", ring)] +
+            [accounts.add(f"ACC_SHELL_INT{k}", ring) for k in range(1, shell_hops)] +
+            [accounts.add("ACC_SHELL_DST", ring)])
+        start  = rng.integers(0, span - 2 * shell_hops * HOUR, shells)[:, None]
+        hop    = np.arange(shell_hops)
+        base   = rng.integers(200_000, 2_000_000, shells)[:, None]
+        emit(chain[:, :-1], chain[:, 1:], base - base * hop // 100, start + 2 * HOUR * hop)
+        truth.extend(("SHELL", i, "Layered Shell", row[1:-1]) for i, row in enumerate(chain))
+
+    if not src:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty, empty, empty), truth
+    return tuple(np.concatenate(a) for a in (src, dst, cents, secs)), truth
+
+
+def _background_draw(rng: np.random.Generator, n: int, n_accounts: int, cdf) -> np.ndarray:
+    if cdf is None:
+        return rng.integers(0, n_accounts, n)
+    return np.searchsorted(cdf, rng.random(n), side="right")
+
+
+def _hub_cdf(rng: np.random.Generator, n_accounts: int, hub_exponent: float):
+    """Zipf weights rank^-exponent over a random ranking of the accounts (None = uniform)."""
+    if hub_exponent <= 0:
+        return None
+    weights = np.arange(1, n_accounts + 1, dtype=np.float64) ** -hub_exponent
+    cdf     = np.cumsum(weights[rng.permutation(n_accounts)])
+    return cdf / cdf[-1]
+
+
+# --- Output ---
+
+class _CSVWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(b"transaction_id,sender_id,receiver_id,amount,timestamp\n")
+
+    def write(self, chunk: dict, name_bytes: np.ndarray):
+        self.file.write(_csv_bytes(_fields(chunk, name_bytes)))
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """One row group per chunk; string columns are built straight from the byte matrices."""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow)")
+        self.pa     = pa
+        self.schema = pa.schema([("transaction_id", pa.string()), ("sender_id", pa.string()),
+                                 ("receiver_id", pa.string()), ("amount", pa.float64()),
+                                 ("timestamp", pa.timestamp("s"))])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def _strings(self, matrix: np.ndarray):
+        lengths = np.count_nonzero(matrix, axis=1)
+        offsets = np.zeros(len(matrix) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+        data = matrix[matrix != 0]
+        return self.pa.StringArray.from_buffers(len(matrix), self.pa.py_buffer(offsets), self.pa.py_buffer(data))
+
+    def write(self, chunk: dict, name_bytes: np.ndarray):
+        fields  = _fields(chunk, name_bytes)
+        columns = [self._strings(fields[c]) for c in ("transaction_id", "sender_id", "receiver_id")]
+        columns.append(self.pa.array(chunk["cents"] / 100))
+        columns.append(self.pa.array(START_DATE + chunk["time"].astype("timedelta64[s]")))
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def generate_synthetic_data(output: str = "test_10k_transactions.csv", rows: int = TOTAL_TRANSACTIONS,
+                            accounts: int = 2000, hub_exponent: float = 0.0, days: int = 30,
+                            cycles: int = 5, cycle_len: tuple = (3, 5), fan_in: int = 1, fan_out: int = 1,
+                            shells: int = 3, shell_hops: int = 3, fmt: str = None, seed: int = None,
+                            chunk_rows: int = CHUNK_ROWS, cycle_hub_share: float = 0.0) -> dict:
+    """
+    Writes `rows` transactions (background + injected patterns) to `output` and the injected
+    rings to <output>.truth.json. Returns the truth document.
+
+    The time span is cut into one slice per chunk; each chunk draws its background rows
+    inside its slice, takes the pattern rows that fall there and sorts — so the file is
+    globally chronological without a global sort.
+    """
+    started  = time.time()
+    rng      = np.random.default_rng(seed)
+    span     = days * 24 * HOUR
+    fmt      = fmt or ("parquet" if output.endswith(".parquet") else "csv")
+    registry = _Accounts(accounts)
+    cdf      = _hub_cdf(rng, accounts, hub_exponent)
+
+    print("Injecting fraud patterns...")
+    (p_src, p_dst, p_cents, p_secs), truth = inject_patterns(
+        rng, registry, span, cycles, cycle_len, fan_in, fan_out, shells, shell_hops, cycle_hub_share,
+        lambda n: _background_draw(rng, n, accounts, cdf))
+    names      = registry.names()
+    name_bytes = _name_matrix(names)
+
+    background = rows - len(p_src)
+    if background < 0:
+        raise ValueError(f"{rows} rows cannot hold the {len(p_src)} injected pattern rows")
+    n_chunks = max(1, -(-background // chunk_rows))
+    bounds   = np.linspace(0, span, n_chunks + 1).astype(np.int64)
+    sizes    = np.diff(np.linspace(0, background, n_chunks + 1).astype(np.int64))
+    p_chunk  = np.searchsorted(bounds, p_secs, side="right") - 1
+
+    print(f"Generating {rows:,} transactions over {accounts:,} accounts in {n_chunks} chunk(s)...")
+    writer = _ParquetWriter(output) if fmt == "parquet" else _CSVWriter(output)
+    next_txn = 0
+    try:
+        for k in range(n_chunks):
+            n   = sizes[k]
+            src = _background_draw(rng, n, accounts, cdf)
+            dst = _background_draw(rng, n, accounts, cdf)
+            dst = np.where(src == dst, (dst + 1) % accounts, dst)    # no self-transfers
+            mine  = p_chunk == k
+            chunk = {
+                "src"  : np.concatenate([src, p_src[mine]]),
+                "dst"  : np.concatenate([dst, p_dst[mine]]),
+                "cents": np.concatenate([rng.integers(1_000, 500_000, n), p_cents[mine]]),
+                "time" : np.concatenate([rng.integers(bounds[k], bounds[k + 1], n), p_secs[mine]])
+            }
+            order = np.argsort(chunk["time"], kind="stable")
+            chunk = {key: value[order] for key, value in chunk.items()}
+            chunk["txn"] = np.arange(next_txn, next_txn + len(order))
+            next_txn += len(order)
+            writer.write(chunk, name_bytes)
+    finally:
+        writer.close()
+
+    rings = [_ring(f"{prefix}_{i}", pattern, members, names) for prefix, i, pattern, members in sorted(
+        truth, key=lambda entry: entry[:2])]
+    document = {
+        "dataset": os.path.basename(output),
+        "config" : {"rows": rows, "accounts": accounts, "hub_exponent": hub_exponent, "days": days,
+                    "cycles": cycles, "cycle_len": list(cycle_len), "cycle_hub_share": cycle_hub_share,
+                    "fan_in": fan_in, "fan_out": fan_out,
+                    "shells": shells, "shell_hops": shell_hops, "seed": seed},
+        "rings"  : rings
+    }
+    truth_path = f"{output}.truth.json"
+    with open(truth_path, "w") as f:
+        json.dump(document, f, indent=1)
+
+    print(f"Dataset successfully generated: {output} with {next_txn:,} rows "
+          f"({len(rings)} injected rings in {truth_path}) in {time.time() - started:.1f}s.")
+    return document
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic transactions dataset with injected rings.")
+    parser.add_argument("-o", "--output", default="test_10k_transactions.csv")
+    parser.add_argument("--rows", type=int, default=TOTAL_TRANSACTIONS)
+    parser.add_argument("--accounts", type=int, default=2000, help="background (ACC_NORM_*) accounts")
+    parser.add_argument("--hub-exponent", type=float, default=0.0,
+                        help="Zipf exponent of account activity; 0 = uniform, ~1 = a few heavy hubs")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--cycle-len", type=int, nargs=2, default=(3, 5), metavar=("MIN", "MAX"))
+    parser.add_argument("--cycle-hub-share", type=float, default=0.0,
+                        help="fraction of cycles routed through a background account (often a hub)")
+    parser.add_argument("--fan-in", type=int, default=1)
+    parser.add_argument("--fan-out", type=int, default=1)
+    parser.add_argument("--shells", type=int, default=3)
+    parser.add_argument("--shell-hops", type=int, default=3)
+    parser.add_argument("--format", choices=("csv", "parquet"), default=None, help="default: from the extension")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    generate_synthetic_data(args.output, args.rows, args.accounts, args.hub_exponent, args.days,
+                            args.cycles, tuple(args.cycle_len), args.fan_in, args.fan_out,
+                            args.shells, args.shell_hops, args.format, args.seed, args.chunk_rows,
+                            args.cycle_hub_share)
+
 
 if __name__ == "__main__":
-    generate_synthetic_data()
\ No newline at end of file
+    main()
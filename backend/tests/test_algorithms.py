@@ -1,9 +1,69 @@
+import os
+import time
+import asyncio
+import json
+import sys
+import shutil
+import subprocess
+import tempfile
+import threading
 import unittest
+import contextvars
+import tracemalloc
+from unittest import mock
 import igraph
+import numpy as np
 import pandas as pd
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from app.algorithms.graph_dsa import find_cycles_dfs, detect_shells
-from app.algorithms.temporal_dsa import detect_smurfing
+from fastapi.testclient import TestClient
+from app.algorithms.graph_dsa import find_cycles_dfs, detect_shells, get_dynamic_outdegree_cap
+from app.algorithms.structuring_dsa import detect_structuring
+from app.algorithms import partition
+from app.algorithms.partition import component_batches, run_partitioned, close_pools
+from app.pipeline import (
+    build_graph, detect_component_rings, detect_global_rings, detect_encoded_rings, DetectorSettings
+)
+from app.algorithms.events import encode_transactions
+from app.snapshot import write_snapshot, open_snapshot, open_account_lookup, open_path_index, open_trace_index
+from app.algorithms.paths import find_paths
+from app.algorithms.trace import trace_funds
+from app.coordinator import Coordinator, analysis_task, analyze_coordinated, open_shard_layout
+from app.metrics import MetricsRegistry, RSSSampler, begin_analysis, stage
+from app import profiling
+from app.admission import MemoryBudget, AdmissionRejected, estimate_peak_bytes
+from app.sar import SARGenerator, SARTimeout, StubBackend, SARCache, ring_key
+from app.cases import CaseStore
+from app.journal import SubmissionJournal
+from app.search import AnalysisStore
+from app.scoring import score_accounts, score_rings
+from app.consolidation import consolidate_rings
+from app.out_of_core import analyze_out_of_core
+from app.algorithms.temporal_dsa import (
+    detect_smurfing, detect_pass_through_shells, detect_smurfing_triaged, smurf_triage_recall,
+    detect_gather_scatter, smurf_rings, gather_scatter_rings
+)
+from app import main
+
+def _crash_once(payload):
+    # Coordinator test handler: the first attempt at each task kills its worker process
+    marker, value = payload
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return value * 2
+
+def _slow_double(value):
+    time.sleep(0.3)
+    return value * 2
+
+def _fail_on_zero(value):
+    # Coordinator test handler: 0 raises at once, anything else is slow to answer
+    if value == 0:
+        raise ValueError("bad task")
+    time.sleep(0.2)
+    return value * 2
 
 class TestAlgorithms(unittest.TestCase):
     def test_cycle_detection(self):
@@ -12,6 +72,15 @@ class TestAlgorithms(unittest.TestCase):
         cycles = find_cycles_dfs(g, min_len=3, max_len=5)
         self.assertEqual(len(cycles), 1)
         self.assertEqual(set(cycles[0]["members"]), {"A", "B", "C"})
+
+    def test_detector_settings(self):
+        # A 4-hop loop is found with the default bounds and not with cycles capped at 3 hops
+        df = pd.DataFrame({
+            "sender_id": ["A", "B", "C", "D"], "receiver_id": ["B", "C", "D", "A"],
+            "amount": [100.0] * 4, "timestamp": pd.to_datetime(["2026-02-01"] * 4)
+        })
+        self.assertEqual(len(detect_component_rings(df)), 1)
+        self.assertEqual(detect_component_rings(df, settings=DetectorSettings(cycle_max_len=3)), [])
         
     def test_shell_detection(self):
         # Create Source -> S1 -> S2 -> Dest
@@ -46,5 +115,837 @@ class TestAlgorithms(unittest.TestCase):
         self.assertEqual(results[0]["type"], "Smurfing (Fan-In)")
         self.assertEqual(results[0]["members"][0], "R")
 
+    def test_smurfing_multi_window(self):
+        # 12 senders spread one every 9 hours: only the 7-day horizon sees 10+ of them
+        data = []
+        base_time = datetime(2023, 1, 1, 10, 0, 0)
+        for i in range(12):
+            data.append({
+                "sender_id": f"S{i}",
+                "receiver_id": "R",
+                "amount": 100,
+                "timestamp": base_time + timedelta(hours=i*9)
+            })
+        df = pd.DataFrame(data)
+        results = detect_smurfing(df, windows=[(24, 10), (72, 10), (168, 10)])
+        self.assertEqual(len(results), 1)
+        windows = results[0]["metadata"]["windows"]
+        self.assertEqual([w["fired"] for w in windows], [False, False, True])
+        self.assertEqual([w["peak_unique_peers"] for w in windows], [3, 9, 12])
+        self.assertEqual(results[0]["metadata"]["window_hours"], 168)
+
+    def test_smurfing_episodes(self):
+        # Two separate bursts by the same aggregator, a week apart, with different senders
+        data = []
+        base_time = datetime(2023, 1, 1, 10, 0, 0)
+        for burst in range(2):
+            for i in range(12):
+                data.append({
+                    "sender_id": f"S{burst}_{i}",
+                    "receiver_id": "R",
+                    "amount": 100,
+                    "timestamp": base_time + timedelta(days=7 * burst, minutes=i*10)
+                })
+        df = pd.DataFrame(data)
+        self.assertEqual(len(detect_smurfing(df.copy(), count_threshold=10)), 1)
+
+        results = detect_smurfing(df, count_threshold=10, episodes=True)
+        self.assertEqual(len(results), 2)
+        for burst, ring in enumerate(results):
+            episode = ring["metadata"]["episode"]
+            self.assertEqual(ring["members"][0], "R")
+            self.assertEqual(set(ring["members"][1:]), {f"S{burst}_{i}" for i in range(12)})
+            self.assertEqual(episode["peak_unique_peers"], 12)
+            self.assertEqual(episode["of"], 2)
+
+    def test_smurfing_triage(self):
+        # One fan-in burst hidden among quiet pairs: triage must keep it and prune the rest
+        data = []
+        base_time = datetime(2023, 1, 1, 10, 0, 0)
+        for i in range(12):
+            data.append({"sender_id": f"S{i}", "receiver_id": "R", "amount": 100,
+                         "timestamp": base_time + timedelta(hours=i)})
+        for i in range(50):
+            data.append({"sender_id": f"N{i}", "receiver_id": f"M{i % 5}", "amount": 100,
+                         "timestamp": base_time + timedelta(days=i)})
+        df = pd.DataFrame(data)
+
+        results = detect_smurfing_triaged(df.copy(), count_threshold=10)
+        self.assertEqual([r["members"][0] for r in results], ["R"])
+
+        report = smurf_triage_recall(df, count_threshold=10)
+        self.assertEqual(report["recall"], 1.0)
+        self.assertLess(report["candidates"], 5)
+        # Senders with one transaction each are never sketched: only R's and the M's cells
+        self.assertEqual(report["sketch_cells"], 51)
+
+    def test_structuring(self):
+        # R receives four deposits just under 10k within a day; L receives ordinary amounts
+        data = []
+        base_time = datetime(2023, 1, 1, 10, 0, 0)
+        for i, amount in enumerate([9500, 9800, 9900, 9100]):
+            data.append({"sender_id": f"S{i}", "receiver_id": "R", "amount": amount,
+                         "timestamp": base_time + timedelta(hours=i*5)})
+        for i, amount in enumerate([4000, 12000, 10000, 8000]):
+            data.append({"sender_id": f"T{i}", "receiver_id": "L", "amount": amount,
+                         "timestamp": base_time + timedelta(hours=i)})
+        df = pd.DataFrame(data)
+        results = detect_structuring(df, thresholds=(10000.0,), count_threshold=3)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["type"], "Structuring")
+        self.assertEqual(results[0]["members"][0], "R")
+        self.assertEqual(results[0]["metadata"]["direction"], "inbound")
+        self.assertEqual(results[0]["metadata"]["flagged_transactions"], 4)
+
+    def test_gather_scatter(self):
+        # M gathers from 10 senders, then scatters to 10 receivers a few hours later
+        data = []
+        base_time = datetime(2023, 1, 1, 10, 0, 0)
+        for i in range(10):
+            data.append({"sender_id": f"S{i}", "receiver_id": "M", "amount": 900,
+                         "timestamp": base_time + timedelta(minutes=i*10)})
+            data.append({"sender_id": "M", "receiver_id": f"D{i}", "amount": 850,
+                         "timestamp": base_time + timedelta(hours=6, minutes=i*10)})
+        df = pd.DataFrame(data)
+        results = detect_gather_scatter(df, count_threshold=10, max_gap_hours=24)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["members"][0], "M")
+        self.assertEqual(len(results[0]["members"]), 21)
+
+        # Reusing the episodes of a smurfing pass (either mode) gives the same rings
+        enc = encode_transactions(df.copy())
+        for episodes in (False, True):
+            streams = {}
+            smurf_rings(enc, [(72, 10)], episodes, streams=streams)
+            self.assertEqual(gather_scatter_rings(enc, 72, 10, 24, streams=streams), results)
+
+        # A scatter that only starts two weeks later is not linked
+        late = df.copy()
+        late.loc[late["sender_id"] == "M", "timestamp"] += timedelta(days=14)
+        self.assertEqual(detect_gather_scatter(late, count_threshold=10, max_gap_hours=24), [])
+
+    def _chain_df(self, gap_minutes, haircut=50):
+        # Source -> S1 -> S2 -> Dest, each hop forwarded after gap_minutes
+        base_time = datetime(2023, 1, 1, 10, 0, 0)
+        hops = [("Source", "S1"), ("S1", "S2"), ("S2", "Dest")]
+        return pd.DataFrame([{
+            "sender_id": s,
+            "receiver_id": r,
+            "amount": 5000 - i * haircut,
+            "timestamp": base_time + timedelta(minutes=i * gap_minutes)
+        } for i, (s, r) in enumerate(hops)])
+
+    def test_pass_through_shells(self):
+        shells = detect_pass_through_shells(self._chain_df(gap_minutes=30), min_hops=3)
+        self.assertEqual(len(shells), 1)
+        self.assertEqual(shells[0]["members"], ["S1", "S2"])
+        self.assertEqual(shells[0]["metadata"]["hops"], 3)
+        self.assertEqual(shells[0]["metadata"]["source"], "Source")
+        self.assertEqual(shells[0]["metadata"]["destination"], "Dest")
+
+    def test_pass_through_shells_skip_decoy_out_leg(self):
+        # S1 sends a small decoy before forwarding: the nearest out-leg fails the haircut,
+        # the later one that passes it must still be linked
+        df = self._chain_df(gap_minutes=30)
+        decoy = {"sender_id": "S1", "receiver_id": "X", "amount": 10,
+                 "timestamp": datetime(2023, 1, 1, 10, 10, 0)}
+        df = pd.concat([df, pd.DataFrame([decoy])], ignore_index=True)
+        shells = detect_pass_through_shells(df, min_hops=3)
+        self.assertEqual(len(shells), 1)
+        self.assertEqual(shells[0]["metadata"]["path"], ["Source", "S1", "S2", "Dest"])
+
+    def test_pass_through_shells_follow_the_longest_branch(self):
+        # S1 forwards twice within the haircut: first to Y, a dead end, then on to S2.
+        # Only the later out-leg continues the chain, and it is the one the path must take
+        df = self._chain_df(gap_minutes=30)
+        branch = {"sender_id": "S1", "receiver_id": "Y", "amount": 4990,
+                  "timestamp": datetime(2023, 1, 1, 10, 10, 0)}
+        df = pd.concat([df, pd.DataFrame([branch])], ignore_index=True)
+        shells = detect_pass_through_shells(df, min_hops=3)
+        self.assertEqual([s["metadata"]["path"] for s in shells], [["Source", "S1", "S2", "Dest"]])
+
+    def test_pass_through_shells_rejects_slow_or_lossy_hops(self):
+        # Funds parked for 3 days, or a 40% haircut, are not pass-through behaviour
+        self.assertEqual(detect_pass_through_shells(self._chain_df(gap_minutes=3 * 24 * 60)), [])
+        self.assertEqual(detect_pass_through_shells(self._chain_df(gap_minutes=30, haircut=2000)), [])
+        # min_hops is enforced
+        self.assertEqual(detect_pass_through_shells(self._chain_df(gap_minutes=30), min_hops=4), [])
+
+    def test_partitioned_matches_whole_graph(self):
+        path = os.path.join(os.path.dirname(__file__), "sample.csv")
+        df = pd.read_csv(path, parse_dates=["timestamp"])
+        graph = build_graph(df)
+
+        def ring_set(rings):
+            return sorted((r["type"], tuple(sorted(r["members"]))) for r in rings)
+
+        whole = detect_component_rings(df, graph)
+        detect = partial(detect_component_rings, cycle_cap=get_dynamic_outdegree_cap(graph))
+        try:
+            split = run_partitioned(df, detect, max_workers=2, target_rows=5)
+            self.assertEqual(ring_set(split), ring_set(whole))
+            # The pool outlives the call and serves the next one
+            pool = partition._pools[2]
+            self.assertEqual(ring_set(run_partitioned(df, detect, max_workers=2, target_rows=5)), ring_set(whole))
+            self.assertIs(partition._pools[2], pool)
+        finally:
+            close_pools()
+        self.assertEqual(partition._pools, {})
+
+        # The two isolated legit transfers are pairs and get dropped
+        batches = component_batches(df, min_size=3, target_rows=5)
+        self.assertEqual(sum(len(b) for b in batches), len(df) - 2)
+
+    def test_out_of_core_matches_in_memory(self):
+        path = os.path.join(os.path.dirname(__file__), "sample.csv")
+        df = pd.read_csv(path, parse_dates=["timestamp"])
+
+        def ring_set(rings):
+            return sorted((r["type"], tuple(sorted(r["members"]))) for r in rings)
+
+        in_memory = detect_component_rings(df) + detect_global_rings(df)
+        with tempfile.TemporaryDirectory() as work_dir:
+            # A tiny budget forces several shards and a disk-built CSR
+            result = analyze_out_of_core(path, work_dir, memory_budget=4096)
+            self.assertGreater(result.stats["shards"], 1)
+            self.assertEqual(ring_set(result.rings), ring_set(in_memory))
+            self.assertEqual(result.csr.n_edges, len(set(zip(df["sender_id"], df["receiver_id"]))))
+
+    def test_snapshot_round_trip(self):
+        path = os.path.join(os.path.dirname(__file__), "sample.csv")
+        df = pd.read_csv(path, parse_dates=["timestamp"])
+
+        def ring_set(rings):
+            return sorted((r["type"], tuple(sorted(r["members"]))) for r in rings)
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            directory = write_snapshot(os.path.join(work_dir, "snap"), encode_transactions(df.copy()))
+            snap = open_snapshot(directory)
+            self.assertEqual(snap.meta["transactions"], len(df))
+            self.assertEqual(snap.csr.n_edges, len(set(zip(df["sender_id"], df["receiver_id"]))))
+            rings = detect_encoded_rings(snap.transactions, snap.csr)
+        self.assertEqual(ring_set(rings), ring_set(detect_component_rings(df) + detect_global_rings(df)))
+
+    def test_coordinated_matches_in_memory(self):
+        path = os.path.join(os.path.dirname(__file__), "sample.csv")
+        df = pd.read_csv(path, parse_dates=["timestamp"])
+
+        def ring_set(rings):
+            return sorted((r["type"], tuple(sorted(r["members"]))) for r in rings)
+
+        coordinator = Coordinator(analysis_task, workers=2)
+        try:
+            with tempfile.TemporaryDirectory() as work_dir:
+                directory = write_snapshot(os.path.join(work_dir, "snap"), encode_transactions(df.copy()))
+                # Many small shards so the sample's cycles cross shard boundaries
+                rings = analyze_coordinated(coordinator, directory, n_shards=7)
+                # Rows were bucketed once: each shard's slice is exactly the rows touching it
+                snap   = open_snapshot(directory)
+                layout = open_shard_layout(snap, 7)
+                self.assertTrue(os.path.isdir(os.path.join(directory, "shards-7")))
+                src, dst = layout.owner[snap.transactions.src], layout.owner[snap.transactions.dst]
+                for shard in range(7):
+                    rows = layout.txn_positions[layout.txn_offsets[shard]:layout.txn_offsets[shard + 1]]
+                    self.assertEqual(rows.tolist(), np.flatnonzero((src == shard) | (dst == shard)).tolist())
+        finally:
+            coordinator.close()
+        self.assertEqual(ring_set(rings), ring_set(detect_component_rings(df) + detect_global_rings(df)))
+
+    def test_coordinator_retries_crashed_worker(self):
+        coordinator = Coordinator(_crash_once, workers=2, max_retries=1)
+        try:
+            with tempfile.TemporaryDirectory() as work_dir:
+                payloads = [(os.path.join(work_dir, f"task_{i}"), i) for i in range(3)]
+                self.assertEqual(coordinator.run(payloads), [0, 2, 4])
+        finally:
+            coordinator.close()
+        self.assertGreaterEqual(coordinator.restarts, 3)
+
+    def test_coordinator_failed_run_leaves_no_stale_replies(self):
+        coordinator = Coordinator(_fail_on_zero, workers=2)
+        try:
+            # Task 0 fails while the other worker still holds task 1
+            with self.assertRaises(RuntimeError):
+                coordinator.run([0, 1])
+            self.assertEqual(coordinator.run([5, 6, 7]), [10, 12, 14])
+        finally:
+            coordinator.close()
+
+    def test_coordinator_close_waits_for_run(self):
+        coordinator = Coordinator(_slow_double, workers=2)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            running = pool.submit(coordinator.run, [1, 2, 3])
+            time.sleep(0.1)
+            coordinator.close()       # another request tearing the pool down mid-run
+            self.assertEqual(running.result(timeout=30), [2, 4, 6])
+        self.assertEqual(coordinator._workers, [])
+
+    def test_stage_metrics(self):
+        def run():
+            metrics = begin_analysis()
+            g = igraph.Graph.TupleList([("A", "B"), ("B", "C"), ("C", "A")], directed=True)
+            detect_component_rings(pd.DataFrame(columns=["sender_id", "receiver_id", "amount", "timestamp"]), g)
+            return metrics
+
+        # Fresh context so the active recorder does not leak into other tests
+        metrics = contextvars.copy_context().run(run)
+        summary = metrics.summary()
+        self.assertEqual(list(summary)[:2], ["cycles", "smurfing"])
+        self.assertEqual(summary["cycles"]["cycles_found"], 1)
+        self.assertGreater(summary["cycles"]["dfs_expansions"], 0)
+
+        # Nested stages can hold equal RSS peaks; each must release its own sampler slot
+        sampler = RSSSampler()
+        outer, inner = sampler.watch(), sampler.watch()
+        outer[0] = inner[0] = 1
+        sampler.unwatch(inner)
+        self.assertTrue(any(cell is outer for cell in sampler._watchers))
+        sampler.unwatch(outer)
+
+        # A nested stage resets the tracemalloc peak; the outer stage must keep its own
+        def traced():
+            metrics = begin_analysis()
+            with stage("outer"):
+                block = bytearray(8 * 2**20)
+                del block
+                with stage("inner"):
+                    pass
+            return metrics
+
+        tracemalloc.start()
+        try:
+            traced_stages = contextvars.copy_context().run(traced).stages
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(traced_stages["outer"]["peak_traced"], 8 * 2**20)
+        self.assertLess(traced_stages["inner"]["peak_traced"], 2**20)
+
+        registry = MetricsRegistry()
+        registry.publish(metrics)
+        text = registry.render()
+        self.assertIn("mule_analyses_total 1", text)
+        self.assertIn('mule_stage_items_total{stage="cycles",item="cycles_found"} 1', text)
+
+    def test_profiled_reports_hotspots(self):
+        g = igraph.Graph.TupleList([("A", "B"), ("B", "C"), ("C", "A")], directed=True)
+        with tempfile.TemporaryDirectory() as work_dir, mock.patch.object(profiling, "PROFILE_DIR", work_dir):
+            with profiling.profiled("test") as report:
+                find_cycles_dfs(g)
+            self.assertTrue(os.path.exists(report["profile_file"]))
+        self.assertIn("find_cycles_dfs", [r["function"].split("(")[-1].rstrip(")") for r in report["tracked"]])
+        self.assertTrue(report["top_self_time"])
+
+        # Profiled in a worker thread, as /analyze?profile=true does
+        async def serve():
+            return await asyncio.to_thread(profiling.profiled_call, "test", lambda: len(find_cycles_dfs(g)))
+
+        with tempfile.TemporaryDirectory() as work_dir, mock.patch.object(profiling, "PROFILE_DIR", work_dir):
+            found, report = asyncio.run(serve())
+        self.assertEqual(found, 1)
+        self.assertIn("find_cycles_dfs", [r["function"].split("(")[-1].rstrip(")") for r in report["tracked"]])
+
+        # No ADMIN_TOKEN configured means nobody may profile
+        with mock.patch.object(profiling, "ADMIN_TOKEN", None):
+            self.assertFalse(profiling.is_admin("anything"))
+
+    def test_memory_budget_admission(self):
+        budget = MemoryBudget(capacity=100, wait_seconds=0)
+        first = asyncio.run(budget.acquire(60))
+        self.assertEqual(budget.reserved, 60)
+
+        # Busy budget: queued, then rejected with 429 once the wait runs out
+        with self.assertRaises(AdmissionRejected) as busy:
+            asyncio.run(budget.acquire(50))
+        self.assertEqual(busy.exception.status_code, 429)
+
+        # Never fits: rejected at once with 503
+        with self.assertRaises(AdmissionRejected) as too_big:
+            budget.acquire_blocking(101)
+        self.assertEqual(too_big.exception.status_code, 503)
+
+        first.resize(30)
+        second = budget.acquire_blocking(50)
+        self.assertEqual(budget.reserved, 80)
+
+        # Growing a reservation is admitted too: no room now is 429, never fits is 503
+        with self.assertRaises(AdmissionRejected) as grow_busy:
+            first.resize(60)
+        self.assertEqual(grow_busy.exception.status_code, 429)
+        with self.assertRaises(AdmissionRejected) as grow_too_big:
+            first.resize(101)
+        self.assertEqual(grow_too_big.exception.status_code, 503)
+        self.assertEqual((first.nbytes, budget.reserved), (30, 80))
+        first.resize(50)
+        self.assertEqual(budget.reserved, 100)
+        first.release()
+        second.release()
+        second.release()
+        self.assertEqual((budget.reserved, budget.running, budget.rejected), (0, 0, 4))
+        self.assertIn("mule_admission_rejections_total 4", budget.render())
+
+        with mock.patch.dict(os.environ, {"MEMORY_BUDGET_MB": "1024", "WEB_CONCURRENCY": "4"}):
+            self.assertEqual(MemoryBudget().capacity, 256 * 2**20)
+
+    def test_sar_generation_is_concurrent_and_bounded(self):
+        async def run(generator, n):
+            # Distinct rings: identical ones would share a single call
+            rings   = [{"ring_id": f"RING_{i}", "member_accounts": ["A", "B", f"C{i}"]} for i in range(n)]
+            started = time.perf_counter()
+            reports = await asyncio.gather(*(generator.generate(ring) for ring in rings))
+            return reports, time.perf_counter() - started
+
+        # 8 calls of 0.1s overlap on the loop; with a limit of 2 they run 4 waves
+        reports, parallel = asyncio.run(run(SARGenerator(partial(StubBackend, 0.1), max_concurrency=8), 8))
+        self.assertEqual(reports[0]["mule_herder"], "A")
+        self.assertLess(parallel, 0.35)
+        _, limited = asyncio.run(run(SARGenerator(partial(StubBackend, 0.1), max_concurrency=2), 8))
+        self.assertGreaterEqual(limited, 0.4)
+
+        with self.assertRaises(SARTimeout):
+            asyncio.run(run(SARGenerator(partial(StubBackend, 1.0), timeout=0.05), 1))
+
+    def test_sar_batch_dedups_and_caches(self):
+        rings = [{"ring_id": f"RING_{i}", "pattern_type": "cycle", "member_accounts": [f"A{i % 3}", "B"]}
+                 for i in range(6)]
+        rings.append({"ring_id": "RING_X", "pattern_type": "cycle", "member_accounts": ["B", "A0"]})
+        self.assertEqual(ring_key(rings[0]), ring_key(rings[-1]))     # ring_id and member order don't matter
+
+        async def run(generator, pack=1):
+            return [entry async for entry in generator.generate_batch(rings, pack)]
+
+        generator = SARGenerator(partial(StubBackend, 0.01))
+        first = asyncio.run(run(generator))
+        self.assertEqual(len(first), 3)                                 # 7 rings, 3 distinct
+        self.assertEqual(sorted(i for indexes, *_ in first for i in indexes), list(range(7)))
+        self.assertEqual(generator.llm_calls, 3)
+        self.assertFalse(any(cached for *_, cached in first))
+
+        second = asyncio.run(run(generator))
+        self.assertTrue(all(cached for *_, cached in second))
+        self.assertEqual(generator.llm_calls, 3)
+        self.assertEqual(asyncio.run(generator.generate(rings[1]))["mule_herder"], "A1")
+
+        packed = SARGenerator(partial(StubBackend, 0.01))
+        reports = asyncio.run(run(packed, pack=3))
+        self.assertEqual(packed.llm_calls, 1)
+        self.assertEqual({report["mule_herder"] for _, _, report, _, _ in reports}, {"A0", "A1", "A2"})
+
+        expiring = SARCache(ttl=-1)
+        expiring.put("k", {})
+        self.assertIsNone(expiring.get("k"))
+
+    def test_case_store_persists_flags(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            path  = os.path.join(work_dir, "cases.sqlite3")
+            store = CaseStore(path)
+            store.flag("A", "review_pending")
+            store.flag_many([("A", "false_positive", "known payroll"), ("B", "escalated", None)])
+            self.assertEqual(store.statuses(["A", "B", "C"]), {"A": "false_positive", "B": "escalated"})
+
+            # A second store on the same file (another worker, or after a restart) sees the flags
+            other = CaseStore(path)
+            self.assertEqual(other.get("A")["notes"], "known payroll")
+            self.assertIsNone(other.get("C"))
+            self.assertEqual(other.counts(), {"false_positive": 1, "escalated": 1})
+
+    def test_submission_journal_batches_rotates_and_replays(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            journal = SubmissionJournal(work_dir, fsync_interval=0, segment_bytes=2000)
+
+            async def submit():
+                await asyncio.gather(*(journal.append({"ring_id": f"RING_{i % 5}", "n": i}) for i in range(100)))
+                await journal.aclose()
+
+            asyncio.run(submit())
+            self.assertEqual(journal.records, 100)
+            self.assertLess(journal.batches, 100)                   # concurrent appends share writes
+            self.assertGreater(journal.segment, 1)                  # rotated by size
+            self.assertEqual([r["n"] for r in journal.read("RING_3")], list(range(3, 100, 5)))
+
+            # A torn last line (crash mid-write) is dropped; the index is rebuilt from disk
+            with open(journal._path(journal.segment), "ab") as f:
+                f.write(b'{"ring_id": "RING_3", "n"')
+            reopened = SubmissionJournal(work_dir, segment_bytes=2000)
+            self.assertEqual(reopened.read("RING_3"), journal.read("RING_3"))
+            self.assertEqual(reopened.read("RING_9"), [])
+
+    def test_submission_journal_shared_by_workers(self):
+        # Two workers on one directory: each sees the other's submissions and rotations
+        with tempfile.TemporaryDirectory() as work_dir:
+            workers = [SubmissionJournal(work_dir, fsync_interval=0, segment_bytes=500) for _ in range(2)]
+
+            async def submit(journal, first):
+                for i in range(first, first + 10):
+                    await journal.append({"ring_id": f"RING_{i % 3}", "n": i})
+
+            for round_start in range(0, 60, 10):
+                asyncio.run(submit(workers[round_start // 10 % 2], round_start))
+            expected = list(range(1, 60, 3))
+            for journal in workers:
+                self.assertEqual([r["n"] for r in journal.read("RING_1")], expected)
+            self.assertGreater(workers[0].segment, 2)
+
+            # Sealed segments' .idx files hold every worker's records
+            reopened = SubmissionJournal(work_dir, segment_bytes=500)
+            self.assertEqual([r["n"] for r in reopened.read("RING_1")], expected)
+            for journal in workers + [reopened]:
+                asyncio.run(journal.aclose())
+
+    def test_account_search_index(self):
+        accounts = [{"account_id": name, "suspicion_score": score, "detected_patterns": patterns,
+                     "ring_id": "RING_1", "total_inflow": 1.0, "total_outflow": 0.0, "net_balance": 1.0}
+                    for name, score, patterns in [("ACC_100", 90.0, ["Cycle"]), ("acc_101", 70.0, ["Structuring"]),
+                                                  ("ACC_200", 80.0, ["Cycle", "Layered Shell"]),
+                                                  ("MULE_1001", 65.0, ["Smurfing (Fan-in)"])]]
+        with tempfile.TemporaryDirectory() as work_dir:
+            store = AnalysisStore(work_dir, keep=2)
+            index = store.open(store.save(accounts, []))
+
+            def ids(**kwargs):
+                total, page = index.search(**kwargs)
+                return total, [acc["account_id"] for acc in page]
+
+            self.assertEqual(ids(), (4, ["ACC_100", "ACC_200", "acc_101", "MULE_1001"]))
+            self.assertEqual(ids(query="acc_1"), (2, ["ACC_100", "acc_101"]))
+            self.assertEqual(ids(query="100", match="substring"), (2, ["ACC_100", "MULE_1001"]))
+            self.assertEqual(ids(query="c_2", match="substring"), (1, ["ACC_200"]))
+            self.assertEqual(ids(pattern="cycle", min_score=85), (1, ["ACC_100"]))
+            self.assertEqual(ids(query="acc", pattern="shell", sort="account_id"), (1, ["ACC_200"]))
+            self.assertEqual(ids(max_score=80, sort="account_id", offset=1, limit=1), (3, ["ACC_200"]))
+            self.assertEqual(index.search(query="acc_200")[1][0]["detected_patterns"], ["Cycle", "Layered Shell"])
+
+            # Only the newest `keep` analyses stay on disk
+            store.save(accounts[:1], [])
+            store.save([], [])
+            self.assertEqual(len(os.listdir(work_dir)), 2)
+
+    def test_ring_membership_index(self):
+        rings = [{"ring_id": ring_id, "member_accounts": members, "pattern_type": "Cycle", "risk_score": score,
+                  "total_value": 100.0}
+                 for ring_id, members, score in [("RING_2", ["A", "B", "C"], 65.0), ("RING_1", ["B", "C", "D"], 80.0),
+                                                 ("RING_3", ["B", "E"], 70.0)]]
+        memberships = {}
+        for ring in rings:
+            for member in ring["member_accounts"]:
+                entry = memberships.setdefault(member, {"rings": [], "patterns": set(), "max_ring_score": 0.0})
+                entry["rings"].append(ring["ring_id"])
+                entry["patterns"].add("Cycle")
+                entry["max_ring_score"] = max(entry["max_ring_score"], ring["risk_score"])
+        accounts = score_accounts(memberships, {}, {}, {})
+        self.assertEqual(next(acc for acc in accounts if acc["account_id"] == "B")["ring_ids"],
+                         ["RING_2", "RING_1", "RING_3"])
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            store = AnalysisStore(work_dir)
+            index = store.rings(store.save(accounts, rings))
+            self.assertEqual([r["ring_id"] for r in index.rings_of("B")], ["RING_1", "RING_3", "RING_2"])
+            self.assertEqual(index.rings_of("A")[0]["member_count"], 3)
+            self.assertIsNone(index.rings_of("Z"))
+            self.assertEqual(index.shared_accounts("RING_1", "RING_2"), ["B", "C"])
+            self.assertEqual(index.shared_accounts("RING_1", "RING_3"), ["B"])
+            self.assertIsNone(index.shared_accounts("RING_1", "RING_9"))
+            self.assertEqual([(a["account_id"], a["ring_count"]) for a in index.top_overlap(2)], [("B", 3), ("C", 2)])
+
+    def test_bounded_path_queries(self):
+        base = datetime(2024, 1, 1)
+        transfers = [("X", "A", 500, 1), ("A", "Y", 400, 2),               # X->A->Y, in time order
+                     ("X", "B", 500, 5), ("B", "Y", 450, 3),               # X->B->Y, second hop too early
+                     ("X", "C", 20, 1), ("C", "Y", 20, 2),                 # X->C->Y, small amounts
+                     ("A", "D", 300, 3), ("D", "Y", 300, 4), ("Y", "X", 50, 6)]
+        df = pd.DataFrame([{"transaction_id": f"T{i}", "sender_id": s, "receiver_id": r, "amount": amount,
+                            "timestamp": base + timedelta(hours=h)} for i, (s, r, amount, h) in enumerate(transfers)])
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            snap = open_snapshot(write_snapshot(os.path.join(work_dir, "snap"), encode_transactions(df)))
+            index  = open_path_index(snap)
+            lookup = open_account_lookup(snap)
+
+            def paths(**kwargs):
+                result = find_paths(index, lookup.code("X"), lookup.code("Y"), **kwargs)
+                return sorted("".join(str(snap.transactions.names[v]) for v in p["accounts"]) for p in result["paths"])
+
+            self.assertEqual(paths(max_hops=2), ["XAY", "XBY", "XCY"])
+            self.assertEqual(paths(max_hops=3), ["XADY", "XAY", "XBY", "XCY"])
+            self.assertEqual(paths(max_hops=3, time_ordered=True), ["XADY", "XAY", "XCY"])
+            self.assertEqual(paths(max_hops=3, time_ordered=True, min_amount=100), ["XADY", "XAY"])
+            self.assertEqual(paths(max_hops=1), [])
+            limited = find_paths(index, lookup.code("X"), lookup.code("Y"), max_hops=3, max_paths=2)
+            self.assertTrue(limited["truncated"])
+            self.assertEqual(len(limited["paths"]), 2)
+            self.assertEqual(limited["shortest_hops"], 2)
+
+            # Snapshots from before path indexes get one built on first use
+            shutil.rmtree(os.path.join(snap.directory, "paths"))
+            self.assertEqual(open_path_index(snap).pair_offsets.tolist(), index.pair_offsets.tolist())
+            shutil.rmtree(os.path.join(snap.directory, "lookup"))
+            self.assertEqual(open_account_lookup(snap).code("D"), lookup.code("D"))
+            self.assertIsNone(lookup.code("nobody"))
+
+    def test_fund_trace_conserves_amounts(self):
+        base = datetime(2024, 1, 1)
+        transfers = [("X", "A", 100, 1), ("A", "B", 60, 2), ("A", "C", 70, 3),     # only 40 of A's 70 is X's
+                     ("C", "D", 30, 0), ("C", "D", 50, 4), ("B", "E", 60, 24 * 30)]  # too early / too late
+        df = pd.DataFrame([{"transaction_id": f"T{i}", "sender_id": s, "receiver_id": r, "amount": amount,
+                            "timestamp": base + timedelta(hours=h)} for i, (s, r, amount, h) in enumerate(transfers)])
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            snap  = open_snapshot(write_snapshot(os.path.join(work_dir, "snap"), encode_transactions(df)))
+            index = open_trace_index(snap)
+            names = list(snap.transactions.names)
+            week  = 7 * 86_400 * 10**9
+
+            def trace(account, **kwargs):
+                result = trace_funds(index, snap.transactions, names.index(account), window_ns=week, **kwargs)
+                accounts = {names[v]: (round(d["received"], 2), round(d["held"], 2), d["hops"])
+                            for v, d in result["accounts"].items()}
+                held = sum(d["held"] for v, d in result["accounts"].items() if names[v] != account)
+                self.assertAlmostEqual(held + result["held_by_seed"], result["amount"])
+                return result["amount"], accounts
+
+            self.assertEqual(trace("X"), (100, {"A": (100, 0, 1), "B": (60, 60, 2), "C": (40, 0, 2), "D": (40, 40, 3)}))
+            self.assertEqual(trace("X", max_hops=2)[1]["C"], (40, 40, 2))
+            self.assertEqual(trace("X", min_amount=50)[1], {"A": (100, 40, 1), "B": (60, 60, 2)})
+            # Backward from D: of C's 80, only the 50 paid after A's transfer can be A's money
+            self.assertEqual(trace("D", backward=True), (80, {"C": (80, 30, 1), "A": (50, 0, 2), "X": (50, 50, 3)}))
+
+            # A fixed amount is spent on the earliest transfers; older snapshots rebuild the
+            # index, also when several requests get there at once
+            shutil.rmtree(os.path.join(snap.directory, "trace"))
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                built = list(pool.map(lambda _: open_trace_index(snap), range(4)))
+            index = built[0]
+            self.assertTrue(all(b.out_order.tolist() == index.out_order.tolist() for b in built))
+            self.assertEqual([name for name in os.listdir(snap.directory) if ".tmp-" in name], [])
+            self.assertEqual(trace("X", amount=10), (10, {"A": (10, 0, 1), "B": (10, 10, 2)}))
+
+    def test_ring_ids_are_stable_across_processes(self):
+        # Workers and restarts must agree on a ring's ID, whatever their string hash seed
+        code = ("from app.scoring import score_rings; "
+                "print([r['ring_id'] for r in score_rings([{'type': 'Cycle', 'members': ['B', 'A', 'C']}, "
+                "{'type': 'Fan-In', 'members': ['A', 'B', 'C']}], lambda m: 0.0)[0]])")
+        ids = {subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                              env=dict(os.environ, PYTHONHASHSEED=str(seed))).stdout for seed in (1, 2)}
+        self.assertEqual(len(ids), 1)
+        formatted, _ = score_rings([{"type": "Cycle", "members": ["C", "A", "B"]},
+                                    {"type": "Fan-In", "members": ["A", "B", "C"]}], lambda members: 0.0)
+        self.assertEqual(str([r["ring_id"] for r in formatted]) + "\n", ids.pop())
+        self.assertNotEqual(formatted[0]["ring_id"], formatted[1]["ring_id"])
+
+    def test_ring_consolidation(self):
+        def cycle(*members):
+            return {"type": "Cycle", "members": list(members), "metadata": {"length": len(members)}}
+        rings = [cycle("A", "B", "C"), cycle("B", "C", "A"),           # same cycle, rotated
+                 cycle("A", "B", "C", "D"), cycle("B", "C", "D"),
+                 cycle("C", "D", "E"),                                  # joins through B-C-D only
+                 cycle("X", "Y", "Z"),                                  # shares X only: stays apart
+                 cycle("X", "P", "Q"),
+                 {"type": "Fan-In", "members": ["A", "B", "C"], "metadata": {}}]
+
+        clusters = consolidate_rings(rings, 0.5)
+        by_members = {(c["type"], tuple(c["members"])): c["metadata"] for c in clusters}
+        self.assertEqual(len(clusters), 4)
+        big = by_members[("Cycle", ("A", "B", "C", "D", "E"))]
+        self.assertEqual(big["ring_count"], 4)
+        self.assertEqual(big["member_ring_counts"], {"A": 2, "B": 3, "C": 4, "D": 3, "E": 1})
+        self.assertEqual(by_members[("Cycle", ("X", "Y", "Z"))], {"length": 3, "ring_count": 1})
+        self.assertIn(("Fan-In", ("A", "B", "C")), by_members)
+        self.assertEqual(len(consolidate_rings(rings, 1.0)), 7)
+        self.assertEqual(len(consolidate_rings(rings, 0.2)), 3)
+
+        formatted, memberships = score_rings(clusters, lambda members: 100.0 * len(members))
+        cluster = next(r for r in formatted if r["pattern_type"] == "Cycle" and "E" in r["member_accounts"])
+        self.assertEqual((cluster["ring_count"], cluster["member_count"], cluster["total_value"]), (4, 5, 500.0))
+        # E sat in one cycle of the cluster and nothing else; D in three, so D keeps its Kingpin bonus
+        scores = {a["account_id"]: a["suspicion_score"] for a in score_accounts(memberships, {}, {}, {})}
+        self.assertEqual(scores["D"] - scores["E"], 20.0)
+
+        # Two orderings of one cycle are one ring: consolidating must not change any score
+        orderings = [cycle("A", "B", "C"), cycle("A", "C", "B")]
+        def account_scores(rings):
+            _, memberships = score_rings(rings, lambda members: 100.0)
+            return {a["account_id"]: a["suspicion_score"] for a in score_accounts(memberships, {}, {}, {})}
+        self.assertEqual(account_scores(orderings), {"A": 65.0, "B": 65.0, "C": 65.0})
+        for threshold in (0.5, 1.0):
+            self.assertEqual(account_scores(consolidate_rings(orderings, threshold)), account_scores(orderings))
+
+class TestAPI(unittest.TestCase):
+    """Endpoint tests against the app, with its stores moved to a scratch directory."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        cls.patches = [
+            mock.patch.object(main, "SNAPSHOT_DIR", os.path.join(cls.work_dir, "snapshots")),
+            mock.patch.object(main, "analyses", AnalysisStore(os.path.join(cls.work_dir, "analyses"))),
+            mock.patch.object(main, "cases", CaseStore(os.path.join(cls.work_dir, "cases.db"))),
+            mock.patch.object(main, "sar_journal", SubmissionJournal(os.path.join(cls.work_dir, "journal"),
+                                                                     fsync_interval=0)),
+            mock.patch.object(main, "sar_generator", SARGenerator(partial(StubBackend, 0.01))),
+        ]
+        for patch in cls.patches:
+            patch.start()
+        # Entered once: every request (from any thread) is served by the same event loop
+        cls.client = TestClient(main.app).__enter__()
+        with open(os.path.join(os.path.dirname(__file__), "sample.csv"), "rb") as f:
+            cls.csv = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+        for patch in reversed(cls.patches):
+            patch.stop()
+        shutil.rmtree(cls.work_dir)
+
+    def upload(self, path="/analyze", **params):
+        return self.client.post(path, params=params, files={"file": ("sample.csv", self.csv, "text/csv")})
+
+    def test_concurrent_analyses_wait_or_are_rejected(self):
+        # The first analysis holds the budget while it runs in a worker thread; the event loop
+        # stays free, so the second request is queued (or rejected) instead of running after it
+        rows = self.csv.count(b"\n") - 1
+        need = max(estimate_peak_bytes(len(self.csv)), estimate_peak_bytes(len(self.csv), rows=rows))
+        started, release = threading.Event(), threading.Event()
+        detect = main.detect_global_rings
+
+        def held(*args, **kwargs):
+            started.set()
+            release.wait(10)
+            return detect(*args, **kwargs)
+
+        for wait_seconds, admitted, rejected in ((0, 1, 1), (10, 2, 0)):
+            started.clear()
+            release.clear()
+            budget = MemoryBudget(capacity=int(need * 1.5), wait_seconds=wait_seconds)
+            with mock.patch.object(main, "BUDGET", budget), mock.patch.object(main, "detect_global_rings", held), \
+                    ThreadPoolExecutor(2) as pool:
+                first = pool.submit(self.upload)
+                self.assertTrue(started.wait(10))
+                second = pool.submit(self.upload)
+                if wait_seconds == 0:
+                    response = second.result(timeout=10)
+                    self.assertEqual(response.status_code, 429)
+                    self.assertIn("Retry-After", response.headers)
+                else:
+                    time.sleep(0.3)
+                    self.assertFalse(second.done())
+                    self.assertEqual(budget.running, 1)
+                release.set()
+                self.assertEqual(first.result(timeout=30).status_code, 200)
+                if wait_seconds:
+                    self.assertEqual(second.result(timeout=30).status_code, 200)
+            self.assertEqual((budget.admitted, budget.rejected, budget.reserved), (admitted, rejected, 0))
+
+    def test_analysis_search_and_ring_routes(self):
+        analysis = self.upload().json()
+        analysis_id = analysis["summary"]["analysis_id"]
+        base = f"/analyses/{analysis_id}"
+
+        page = self.client.get(f"{base}/accounts", params={"q": "ACC_CYC", "limit": 2}).json()
+        self.assertEqual((page["total"], len(page["accounts"])), (4, 2))
+        self.assertTrue(all(a["account_id"].startswith("ACC_CYC") for a in page["accounts"]))
+        self.assertEqual(self.client.get(f"{base}/accounts", params={"limit": 0}).status_code, 400)
+        self.assertEqual(self.client.get("/analyses/0123456789abcdef/accounts").status_code, 404)
+        self.assertEqual(self.client.get("/analyses/not-an-id/accounts").status_code, 404)
+
+        cycle = next(r for r in analysis["fraud_rings"] if "ACC_CYC_A" in r["member_accounts"])
+        member = self.client.get(f"{base}/accounts/ACC_CYC_A/rings").json()
+        self.assertEqual([r["ring_id"] for r in member["rings"]], [cycle["ring_id"]])
+        self.assertEqual(self.client.get(f"{base}/accounts/ACC_LEGIT_1/rings").status_code, 404)
+        shared = self.client.get(f"{base}/rings/{cycle['ring_id']}/shared/{cycle['ring_id']}").json()
+        self.assertEqual(sorted(shared["shared_accounts"]), cycle["member_accounts"])
+        self.assertEqual(self.client.get(f"{base}/rings/{cycle['ring_id']}/shared/RING_X").status_code, 404)
+        self.assertEqual(len(self.client.get(f"{base}/overlap", params={"k": 3}).json()["accounts"]), 3)
+        self.assertEqual(self.client.get(f"{base}/overlap", params={"k": 0}).status_code, 400)
+
+    def test_snapshot_routes(self):
+        analysis = self.upload(snapshot=True).json()
+        base = f"/snapshots/{analysis['summary']['snapshot_id']}"
+
+        again = self.client.post(f"{base}/analyze")
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(sorted(r["ring_id"] for r in again.json()["fraud_rings"]),
+                         sorted(r["ring_id"] for r in analysis["fraud_rings"]))
+
+        paths = self.client.get(f"{base}/paths", params={"source": "ACC_CYC_A", "target": "ACC_CYC_C"}).json()
+        self.assertEqual(paths["shortest_hops"], 2)
+        self.assertEqual([p["accounts"] for p in paths["paths"]], [["ACC_CYC_A", "ACC_CYC_B", "ACC_CYC_C"]])
+        self.assertEqual(self.client.get(f"{base}/paths", params={"source": "ACC_CYC_A", "target": "NOBODY"}).status_code,
+                         404)
+        self.assertEqual(self.client.get(f"{base}/paths", params={"source": "ACC_CYC_A", "target": "ACC_CYC_C",
+                                                                  "max_hops": 0}).status_code, 400)
+
+        trace = self.client.get(f"{base}/trace", params={"account": "ACC_SHELL_SRC", "days": 2}).json()
+        self.assertEqual({a["account_id"] for a in trace["accounts"]}, {"ACC_SHELL_1", "ACC_SHELL_2", "ACC_SHELL_DST"})
+        self.assertEqual(self.client.get(f"{base}/trace", params={"account": "ACC_SHELL_SRC",
+                                                                  "direction": "sideways"}).status_code, 400)
+
+        for route in ("/analyze", "/paths?source=A&target=B", "/trace?account=A"):
+            method = self.client.post if route == "/analyze" else self.client.get
+            self.assertEqual(method(f"/snapshots/0123456789abcdef{route}").status_code, 404)
+
+    def test_flag_routes(self):
+        flags = [{"account_id": "ACC_CYC_A", "status": "false_positive", "notes": "payroll"},
+                 {"account_id": "ACC_CYC_B", "status": "escalated"}]
+        self.assertEqual(self.client.post("/flag-accounts", json={"flags": flags}).json()["updated"], 2)
+        flag = self.client.get("/flag-account/ACC_CYC_A").json()
+        self.assertEqual((flag["status"], flag["notes"]), ("false_positive", "payroll"))
+        self.assertEqual(self.client.get("/flag-account/ACC_CYC_B").json()["status"], "escalated")
+        self.assertEqual(self.client.get("/flag-account/ACC_NOBODY").status_code, 404)
+
+        # Flags set after an analysis show up in its stored search results
+        analysis_id = self.upload().json()["summary"]["analysis_id"]
+        self.client.post("/flag-account", json={"account_id": "ACC_CYC_C", "status": "review_pending"})
+        page = self.client.get(f"/analyses/{analysis_id}/accounts", params={"q": "ACC_CYC_C"}).json()
+        self.assertEqual(page["accounts"][0]["status"], "review_pending")
+
+    def test_sar_routes(self):
+        submitted = self.client.post("/submit-sar", json={"ring_id": "RING_API", "report_content": {"summary": "x"}})
+        self.assertEqual(submitted.status_code, 200)
+        journaled = self.client.get("/sar-submissions/RING_API").json()["submissions"]
+        self.assertEqual([s["reference_id"] for s in journaled], [submitted.json()["reference_id"]])
+        self.assertEqual(self.client.get("/sar-submissions/RING_NONE").status_code, 404)
+
+        rings = [{"ring_id": "R1", "pattern_type": "cycle", "member_accounts": ["A", "B", "C"]},
+                 {"ring_id": "R2", "pattern_type": "cycle", "member_accounts": ["A", "B", "C"]},
+                 {"ring_id": "R3", "pattern_type": "cycle", "member_accounts": ["D", "E", "F"]}]
+        response = self.client.post("/generate-sar/batch", json={"rings": rings})
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(sorted(line["ring_id"] for line in lines[:-1]), ["R1", "R2", "R3"])
+        self.assertTrue(all("report" in line for line in lines[:-1]))
+        self.assertEqual((lines[-1]["done"], lines[-1]["rings"], lines[-1]["unique"]), (True, 3, 2))
+
+    def test_metrics_route(self):
+        self.upload()
+        self.client.post("/submit-sar", json={"ring_id": "RING_METRICS", "report_content": {}})
+        text = self.client.get("/metrics").text
+        for family in ("mule_analyses_total", 'mule_stage_runs_total{stage="parse"}', "mule_memory_budget_bytes",
+                       "mule_admissions_total", "mule_sar_journal_records_total"):
+            self.assertIn(family, text)
+
+    def test_profiling_gate(self):
+        with mock.patch.object(profiling, "ADMIN_TOKEN", "secret"), \
+                mock.patch.object(profiling, "PROFILE_DIR", os.path.join(self.work_dir, "profiles")):
+            self.assertEqual(self.upload(profile=True).status_code, 403)
+            self.assertEqual(self.client.post("/analyze", params={"profile": True}, headers={"X-Admin-Token": "wrong"},
+                                              files={"file": ("sample.csv", self.csv, "text/csv")}).status_code, 403)
+
+            def profiled():
+                return self.client.post("/analyze", params={"profile": True}, headers={"X-Admin-Token": "secret"},
+                                        files={"file": ("sample.csv", self.csv, "text/csv")})
+            with profiling.PROFILER_LOCK:
+                self.assertEqual(profiled().status_code, 409)
+            response = profiled()
+        self.assertEqual(response.status_code, 200)
+        report = response.json()["summary"]["profile"]
+        self.assertTrue(report["top_self_time"])
+        self.assertTrue(os.path.exists(report["profile_file"]))
+
+    def test_oversized_analysis_is_rejected(self):
+        with mock.patch.object(main, "BUDGET", MemoryBudget(capacity=1024)):
+            response = self.upload()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("out_of_core=true", response.json()["detail"])
+
 if __name__ == '__main__':
     unittest.main()